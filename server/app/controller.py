@@ -1,14 +1,269 @@
-from multiprocessing.dummy import Pool
-
-import tekore as tk
-
-from .models import db, Song, Site, Artist, Genre
-from .integrations.spotify import get_spotify_obj, search_spotify_track_id
+import os
+import time
+from datetime import date
+from typing import Any, Iterable, Iterator
+
+from flask import current_app
+from sqlalchemy import String, cast, distinct, extract, func, literal, or_, select, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+
+from .models import (
+    db,
+    song_fingerprint,
+    track_artists_table,
+    track_genres_table,
+    Song,
+    Site,
+    Artist,
+    Genre,
+)
+from .enrichment import LOOKUP_PENDING, SpotifyEnricher
+from .search_index import refresh_song_search_index
+from .integrations.spotify import get_spotify_obj
 from .integrations.scrape_top_tracks import (
+    TOP_TRACKS_URL,
+    StreamStats,
     Track,
+    get_peak_rss_mb,
     get_pitchfork_top_tracks_html,
     parse_top_tracks_html,
+    pitchfork_html_archive,
+    pitchfork_http_cache,
+    stream_top_tracks,
 )
+from .utils.logging_utils import logger
+
+# the number of scraped tracks that are deduplicated and written to the database per transaction
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "250"))
+# the number of values returned for each facet of the songs matching a set of filters
+FACET_LIMIT = int(os.getenv("TRACKS_FACET_LIMIT", "25"))
+# how long counting facets can take before it's given up on - only enforced on postgres
+FACETS_TIMEOUT_MS = int(os.getenv("TRACKS_FACETS_TIMEOUT_MS", "250"))
+# the SQLSTATE of a statement cancelled by postgres' statement_timeout, raised by psycopg2 as QueryCanceled
+QUERY_CANCELED_PGCODE = "57014"
+
+
+# the keys of the filters filter_songs applies
+SONG_FILTERS = ("site_name", "song_name", "artists", "genres", "date_from", "date_to")
+
+
+def _songs_with_every_name(name_column, names: list[str]):
+    # one grouped pass over an association table finds the songs having every name, however many names there are
+    table = name_column.table
+    names = set(names)
+    return (
+        select(table.c.song_id)
+        .where(name_column.in_(names))
+        .group_by(table.c.song_id)
+        .having(func.count(distinct(name_column)) == len(names))
+    )
+
+
+def filter_songs(query, filters: dict):
+    """
+    Applies the song filters accepted by the API to a query
+
+    Args:
+        query (Query | Select): A query selecting from the Song table
+        filters (dict): The loaded filter parameters - site_name, song_name, artists, genres, date_from and date_to
+
+    Returns:
+        Query | Select: the filtered query
+    """
+    if site_name := filters.get("site_name"):
+        query = query.filter(Song.site_name == site_name)
+
+    if song_name := filters.get("song_name"):
+        query = query.filter(Song.name.icontains(song_name))
+
+    if artists := filters.get("artists"):
+        query = query.filter(Song.id.in_(_songs_with_every_name(track_artists_table.c.artist_name, artists)))
+
+    if genres := filters.get("genres"):
+        query = query.filter(Song.id.in_(_songs_with_every_name(track_genres_table.c.genre_name, genres)))
+
+    if date_from := filters.get("date_from"):
+        query = query.filter(Song.date_published >= date_from)
+
+    if date_to := filters.get("date_to"):
+        query = query.filter(Song.date_published <= date_to)
+
+    return query
+
+
+# the orders song listings can be sorted in - the song ID breaks ties so every song has a unique position
+SONG_SORTS = ("date", "name", "artist")
+
+
+def sort_songs(query, sort: str = "date"):
+    """
+    Orders a query's songs newest first, or by name or primary artist, matching one of the song listing indexes
+
+    Args:
+        query (Query): A query selecting from the Song table
+        sort (str): One of SONG_SORTS
+
+    Returns:
+        Query: the ordered query
+    """
+    if sort == "name":
+        return query.order_by(Song.name, Song.id)
+    if sort == "artist":
+        return query.order_by(Song.primary_artist, Song.id)
+    return query.order_by(Song.date_published.desc().nulls_last(), Song.id.desc())
+
+
+def song_sort_key(song: Song, sort: str = "date") -> list:
+    """
+    Gets the values that position a song in a sort order, in a form that can be put in a cursor
+
+    Args:
+        song (Song): The song
+        sort (str): One of SONG_SORTS
+
+    Returns:
+        list: the sorted on value followed by the song ID
+    """
+    if sort == "name":
+        return [song.name, song.id]
+    if sort == "artist":
+        return [song.primary_artist, song.id]
+    return [song.date_published.isoformat() if song.date_published else None, song.id]
+
+
+def is_valid_song_sort_key(key: list, sort: str = "date") -> bool:
+    """
+    Checks that a sort key read from a cursor has the values song_sort_key gives a song in the sort order
+
+    Args:
+        key (list): The sort key
+        sort (str): One of SONG_SORTS
+
+    Returns:
+        bool: True if get_song_page can seek to the key
+    """
+    # bools are ints too, but never a song ID
+    if len(key) != 2 or type(key[1]) is not int:
+        return False
+    if sort in ("name", "artist"):
+        return isinstance(key[0], str)
+    if key[0] is None:
+        return True
+    if not isinstance(key[0], str):
+        return False
+    try:
+        date.fromisoformat(key[0])
+    except ValueError:
+        return False
+    return True
+
+
+def get_song_page(query, sort: str, after: list | None, limit: int) -> tuple[list[Song], list | None]:
+    """
+    Gets a page of songs that follow a position in a sort order
+
+    Each page seeks straight to its first song with the sort order's index instead of skipping over every song before
+        it, so deep pages cost the same as the first one and songs added meanwhile don't shift later pages
+
+    Args:
+        query (Query): A filtered query selecting from the Song table
+        sort (str): One of SONG_SORTS
+        after (list | None): The sort key of the last song on the previous page, or None for the first page
+        limit (int): The maximum number of songs on the page
+
+    Returns:
+        tuple[list[Song], list | None]: the songs, and the sort key of the last one if there are more songs after it
+    """
+    query = sort_songs(query, sort)
+    if after is None:
+        songs = query.limit(limit + 1).all()
+    elif sort == "name":
+        songs = query.filter(tuple_(Song.name, Song.id) > tuple_(*after)).limit(limit + 1).all()
+    elif sort == "artist":
+        songs = query.filter(tuple_(Song.primary_artist, Song.id) > tuple_(*after)).limit(limit + 1).all()
+    elif after[0] is None:
+        songs = query.filter(Song.date_published.is_(None), Song.id < after[1]).limit(limit + 1).all()
+    else:
+        # a row comparison can be answered from the index, but never matches the undated songs sorted after every
+        #   dated one, so the page is topped up with those once the dated songs run out
+        date_published = date.fromisoformat(after[0])
+        songs = query.filter(tuple_(Song.date_published, Song.id) < tuple_(date_published, after[1]))
+        songs = songs.limit(limit + 1).all()
+        if len(songs) <= limit:
+            songs += query.filter(Song.date_published.is_(None)).limit(limit + 1 - len(songs)).all()
+
+    if len(songs) <= limit:
+        return songs, None
+    songs = songs[:limit]
+    return songs, song_sort_key(songs[-1], sort)
+
+
+def _top_facet_values(facet: str, value, from_clause, limit: int):
+    counts = (
+        select(literal(facet).label("facet"), value.label("value"), func.count().label("num_songs"))
+        .select_from(from_clause)
+        .where(value.is_not(None))
+        .group_by(value)
+        .order_by(func.count().desc(), value)
+        .limit(limit)
+        .subquery()
+    )
+    return select(counts.c.facet, counts.c.value, counts.c.num_songs)
+
+
+def count_song_facets(filters: dict, limit: int = FACET_LIMIT) -> dict[str, dict[str, int]] | None:
+    """
+    Counts the songs matching the filters for each of their genres, artists and publication years
+
+    Every facet is counted in a single query, which is a separate statement from the one that loads the page of songs
+        the counts are returned with, so the tracks endpoint makes one more round trip when facets are asked for. On
+        postgres the query is cancelled if it runs past FACETS_TIMEOUT_MS, so a slow facet count can't hold up the page
+
+    Args:
+        filters (dict): The song filters accepted by the tracks endpoint
+        limit (int): The maximum number of values counted per facet, the ones with the most songs are kept
+
+    Returns:
+        dict[str, dict[str, int]] | None: the number of matching songs for each genre, artist and year, most songs
+            first, or None if the query ran out of time
+    """
+    if any(filters.get(key) for key in SONG_FILTERS):
+        matched = filter_songs(select(Song.id, Song.date_published), filters).cte("matched")
+        song_genres = track_genres_table.join(matched, matched.c.id == track_genres_table.c.song_id)
+        song_artists = track_artists_table.join(matched, matched.c.id == track_artists_table.c.song_id)
+        date_published = matched.c.date_published
+    else:
+        # every song matches, so the association tables are counted directly from their name indexes
+        matched = Song.__table__
+        song_genres = track_genres_table
+        song_artists = track_artists_table
+        date_published = Song.date_published
+    year = cast(extract("year", date_published), String)
+    query = union_all(
+        _top_facet_values("genres", track_genres_table.c.genre_name, song_genres, limit),
+        _top_facet_values("artists", track_artists_table.c.artist_name, song_artists, limit),
+        _top_facet_values("years", year, matched, limit),
+    )
+
+    facets = {"genres": {}, "artists": {}, "years": {}}
+    # the savepoint is always rolled back, which also undoes the timeout - counting songs doesn't write anything
+    savepoint = db.session.begin_nested()
+    try:
+        if db.session.get_bind().dialect.name == "postgresql":
+            db.session.execute(select(func.set_config("statement_timeout", str(FACETS_TIMEOUT_MS), True)))
+        for facet, value, num_songs in db.session.execute(query):
+            facets[facet][value] = num_songs
+    except OperationalError as err:
+        # only a cancelled count is expected, any other error is raised as usual
+        if getattr(err.orig, "pgcode", None) != QUERY_CANCELED_PGCODE:
+            raise
+        logger.warning(f"counting song facets took over {FACETS_TIMEOUT_MS}ms, filters: {filters}")
+        return None
+    finally:
+        savepoint.rollback()
+    return facets
 
 
 def save_new_recommendations_site(site_name):
@@ -28,67 +283,230 @@ def save_new_recommendations_site(site_name):
     return True
 
 
-def save_new_artist(artist):
+def _insert_ignoring_conflicts(model):
+    # insert-or-ignore has to be built with the dialect's own insert construct
+    if db.session.get_bind().dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return postgresql_insert(model)
+
+
+def save_new_names(model: type[Artist | Genre | Site], names: set[str]) -> set[str]:
     """
-    Saves a new artist in the database
+    Saves the names that are not already in the database for a model whose primary key is its name
+
+    The names are inserted with a single insert-or-ignore, so names saved by a concurrent ingest are skipped rather
+        than failing the batch. It's up to the caller to commit them
 
     Args:
-        artist (str): The name of the artist to be saved
+        model (type[Artist | Genre | Site]): The model to save the names for
+        names (set[str]): The names to be saved
 
     Returns:
-        bool: True if the artist is successfully saved, False if the artist already exists in the database
+        set[str]: The names that were not already in the database
     """
-    if Artist.query.get(artist):
-        return False
-    db.session.add(Artist(name=artist))
-    db.session.commit()
-    return True
+    if not names:
+        return set()
+    # rows are inserted in a fixed order so concurrent ingests wait on each other's new names instead of deadlocking
+    return set(
+        db.session.scalars(
+            _insert_ignoring_conflicts(model)
+            .values([{"name": name} for name in sorted(names)])
+            .on_conflict_do_nothing()
+            .returning(model.name)
+        )
+    )
 
 
-def save_new_genre(genre):
+def save_new_tracks(tracks: list[Track], site: str) -> list[int]:
     """
-    Saves a new genre in the database
+    Saves a batch of new tracks in the database in a single transaction
+
+    Tracks are identified by their fingerprint, so the tracks already in the database are found with one indexed
+        lookup for the whole batch. Songs are inserted with insert-or-ignore on the fingerprint's unique index, so a
+        track saved by a concurrent ingest after the lookup is skipped rather than failing the batch
 
     Args:
-        genre (str): The name of the genre to be saved
+        tracks (list[Track]): The tracks to be saved
+        site (str): The name of the site to associate with the tracks
 
     Returns:
-        bool: True if the genre is successfully saved, False if the genre already exists in the database
+        list[int]: the Song IDs of the tracks that were saved
     """
-    if Genre.query.get(genre):
-        return False
-    db.session.add(Genre(name=genre))
+    tracks_by_fingerprint: dict[str, Track] = {}
+    for track in tracks:
+        tracks_by_fingerprint.setdefault(track.fingerprint(site), track)
+    if not tracks_by_fingerprint:
+        return []
+    existing_fingerprints = set(
+        db.session.scalars(select(Song.fingerprint).where(Song.fingerprint.in_(tracks_by_fingerprint)))
+    )
+    # sorted so concurrent ingests of the same tracks insert them in the same order and can't deadlock
+    new_tracks = sorted(
+        (fingerprint, track)
+        for fingerprint, track in tracks_by_fingerprint.items()
+        if fingerprint not in existing_fingerprints
+    )
+    if not new_tracks:
+        return []
+
+    save_new_names(Artist, {artist for _, track in new_tracks for artist in track.artists})
+    save_new_names(Genre, {genre for _, track in new_tracks for genre in track.genres})
+
+    # IDs are given out by the database as the songs are inserted, so they're matched back to the tracks by fingerprint
+    song_ids_by_fingerprint = dict(
+        db.session.execute(
+            _insert_ignoring_conflicts(Song)
+            .values([track.to_song_values(site) for _, track in new_tracks])
+            .on_conflict_do_nothing()
+            .returning(Song.fingerprint, Song.id)
+        ).all()
+    )
+    if not song_ids_by_fingerprint:
+        db.session.commit()
+        return []
+
+    new_song_ids = []
+    artist_rows = []
+    genre_rows = []
+    for fingerprint, track in new_tracks:
+        if (song_id := song_ids_by_fingerprint.get(fingerprint)) is None:
+            continue
+        new_song_ids.append(song_id)
+        artist_rows += [{"song_id": song_id, "artist_name": artist} for artist in dict.fromkeys(track.artists)]
+        genre_rows += [{"song_id": song_id, "genre_name": genre} for genre in dict.fromkeys(track.genres)]
+    if artist_rows:
+        db.session.execute(track_artists_table.insert(), artist_rows)
+    if genre_rows:
+        db.session.execute(track_genres_table.insert(), genre_rows)
     db.session.commit()
-    return True
+    return new_song_ids
 
 
-def query_track(track: Track, site: str) -> list:
+def update_saved_tracks(tracks: list[Track], site: str) -> tuple[list[Track], list[int], list[int]]:
     """
-    Queries the database for tracks matching the given track and site
+    Updates the songs saved from the same links as a batch of tracks to match the tracks, in a single transaction
+
+    A track's link identifies it across scrapes, unlike its fingerprint, so re-parsing a page after the parsing code
+        changed corrects the songs saved from it instead of saving them again. Pages aren't an identity since tracks
+        move down them as new ones are published, so tracks without a link are left to be deduplicated by fingerprint.
+        Songs whose name or artists changed are reset to be matched to Spotify again. A song isn't updated if its new
+        fingerprint belongs to another song
 
     Args:
-        track (Track): The track to search for in the database
-        site (str): The site to search for in the database
+        tracks (list[Track]): The tracks to update the saved songs with
+        site (str): The name of the site the tracks were scraped from
 
     Returns:
-        list: A list of Songs in the database resulting from the query
+        tuple[list[Track], list[int], list[int]]: the tracks that don't match a saved song, the IDs of the songs that
+            were updated, and the IDs of the updated songs that have to be matched to Spotify again
     """
-    query = (
-        Song.query
-        .filter(Song.name == track.track_name)
-        .filter(Song.site_name == site)
+    tracks_by_link: dict[str, Track] = {}
+    unmatched_tracks = []
+    for track in tracks:
+        if track.link:
+            tracks_by_link.setdefault(track.link, track)
+        else:
+            unmatched_tracks.append(track)
+    songs_by_link = {}
+    if tracks_by_link:
+        # the oldest song is the one updated if a link was saved more than once before it identified tracks
+        for song in db.session.execute(
+            select(Song.id, Song.link, Song.name, Song.primary_artist, Song.date_published, Song.fingerprint)
+            .where(Song.site_name == site, Song.link.in_(tracks_by_link))
+            .order_by(Song.id.desc())
+        ):
+            songs_by_link[song.link] = song
+    unmatched_tracks += [track for link, track in tracks_by_link.items() if link not in songs_by_link]
+    if not songs_by_link:
+        return unmatched_tracks, [], []
+
+    song_ids = [song.id for song in songs_by_link.values()]
+    names_by_song_id: dict[int, tuple[set[str], set[str]]] = {song_id: (set(), set()) for song_id in song_ids}
+    for song_id, artist_name in db.session.execute(
+        select(track_artists_table.c.song_id, track_artists_table.c.artist_name).where(
+            track_artists_table.c.song_id.in_(song_ids)
+        )
+    ):
+        names_by_song_id[song_id][0].add(artist_name)
+    for song_id, genre_name in db.session.execute(
+        select(track_genres_table.c.song_id, track_genres_table.c.genre_name).where(
+            track_genres_table.c.song_id.in_(song_ids)
+        )
+    ):
+        names_by_song_id[song_id][1].add(genre_name)
+    new_fingerprints = {link: tracks_by_link[link].fingerprint(site) for link in songs_by_link}
+    song_ids_by_fingerprint = dict(
+        db.session.execute(
+            select(Song.fingerprint, Song.id).where(Song.fingerprint.in_(set(new_fingerprints.values())))
+        ).all()
     )
 
-    for artist in track.artists:
-        query = query.filter(Song.artists.any(name=artist))
-
-    for genre in track.genres:
-        query = query.filter(Song.genres.any(name=genre))
-    
-    return query.all()
+    updated_ids = []
+    updated_at = time.time()
+    column_updates = []
+    relookup_ids = []
+    renamed_tracks = {}
+    for link, song in songs_by_link.items():
+        track = tracks_by_link[link]
+        values = {
+            "name": track.track_name,
+            "primary_artist": track.artists[0] if track.artists else "",
+            "date_published": track.date_published,
+            "fingerprint": new_fingerprints[link],
+        }
+        if song_ids_by_fingerprint.get(values["fingerprint"], song.id) != song.id:
+            logger.warning(
+                f"not updating song {song.id} from {link}, "
+                f"it would duplicate song {song_ids_by_fingerprint[values['fingerprint']]}"
+            )
+            continue
+        # claimed for the rest of the batch, so two links re-derived to the same track don't both take the fingerprint
+        song_ids_by_fingerprint[values["fingerprint"]] = song.id
+        columns_changed = any(value != getattr(song, column) for column, value in values.items())
+        names_changed = (set(track.artists), set(track.genres)) != names_by_song_id[song.id]
+        if not (columns_changed or names_changed):
+            continue
+        updated_ids.append(song.id)
+        # every updated song is stamped, including those whose only change was their artists or genres
+        column_updates.append({"id": song.id, **values, "updated_at": updated_at})
+        if names_changed:
+            renamed_tracks[song.id] = track
+        if values["fingerprint"] != song.fingerprint:
+            relookup_ids.append(song.id)
+    if not updated_ids:
+        return unmatched_tracks, [], []
+
+    db.session.execute(update(Song), column_updates)
+    if relookup_ids:
+        db.session.execute(
+            update(Song)
+            .where(Song.id.in_(relookup_ids))
+            .values(spotify_track_id=None, preview_url=None, spotify_lookup_status=LOOKUP_PENDING)
+        )
+    if renamed_tracks:
+        save_new_names(Artist, {artist for track in renamed_tracks.values() for artist in track.artists})
+        save_new_names(Genre, {genre for track in renamed_tracks.values() for genre in track.genres})
+        for table in (track_artists_table, track_genres_table):
+            db.session.execute(table.delete().where(table.c.song_id.in_(renamed_tracks)))
+        artist_rows = [
+            {"song_id": song_id, "artist_name": artist}
+            for song_id, track in renamed_tracks.items()
+            for artist in dict.fromkeys(track.artists)
+        ]
+        genre_rows = [
+            {"song_id": song_id, "genre_name": genre}
+            for song_id, track in renamed_tracks.items()
+            for genre in dict.fromkeys(track.genres)
+        ]
+        if artist_rows:
+            db.session.execute(track_artists_table.insert(), artist_rows)
+        if genre_rows:
+            db.session.execute(track_genres_table.insert(), genre_rows)
+    db.session.commit()
+    return unmatched_tracks, updated_ids, relookup_ids
 
 
-def save_new_track(track: Track, site: str) -> bool | str:
+def save_new_track(track: Track, site: str) -> bool | int:
     """
     Saves a new track in the database
 
@@ -97,74 +515,286 @@ def save_new_track(track: Track, site: str) -> bool | str:
         site (str): The name of the site to associate with the track
 
     Returns:
-        bool | str: the Track ID for the new track if it saves, False if the track already exists in the database
+        bool | int: the Song ID for the new track if it saves, False if the track already exists in the database
     """
-    if query_track(track, site):
-        return False
+    if new_song_ids := save_new_tracks([track], site):
+        return new_song_ids[0]
+    return False
+
+
+def stream_new_top_tracks(site: Site, max_page_num: int) -> Iterator[tuple[int, list[Track]]]:
+    """
+    Fetches pages in order, newest first, yielding the tracks on each page that aren't already in the database
 
-    for artist in track.artists:
-        save_new_artist(artist)
+    Stops at the site's watermark, the newest track seen by the last run, or at the first page that contains only
+        known tracks. Tracks published before the watermark date are known without a query, the rest are checked by
+        link, or by fingerprint if they have no link, with one query per page
 
-    for genre in track.genres:
-        save_new_genre(genre)
+    Args:
+        site (Site): The site being scraped
+        max_page_num (int): The maximum page number to fetch
 
-    new_song = track.to_song(site)
+    Yields:
+        tuple[int, list[Track]]: The page number and the new tracks parsed from it
+    """
+    for page in range(1, max_page_num + 1):
+        if not (html := get_pitchfork_top_tracks_html(page)):
+            return
+        tracks = parse_top_tracks_html(html)
+        # tracks are listed newest first, so the watermark track and every track after it were seen by the last run
+        watermark_index = next(
+            (i for i, track in enumerate(tracks) if site.last_link and track.link == site.last_link), None
+        )
+        tracks = [
+            track
+            for track in tracks[:watermark_index]
+            if not site.last_date_published
+            or not track.date_published
+            or track.date_published >= site.last_date_published
+        ]
+        links = {track.link for track in tracks if track.link}
+        fingerprints = {track.fingerprint(site.name) for track in tracks if not track.link}
+        known_keys = set()
+        if links or fingerprints:
+            for link, fingerprint in db.session.execute(
+                select(Song.link, Song.fingerprint).where(
+                    Song.site_name == site.name, or_(Song.link.in_(links), Song.fingerprint.in_(fingerprints))
+                )
+            ):
+                known_keys.update((link, fingerprint))
+        new_tracks = [track for track in tracks if (track.link or track.fingerprint(site.name)) not in known_keys]
+        if new_tracks:
+            yield page, new_tracks
+        if watermark_index is not None:
+            logger.info(f"page {page} contains the newest track from the last run, stopping incremental update")
+            return
+        if not new_tracks:
+            logger.info(f"page {page} contains no new tracks, stopping incremental update")
+            return
+
+
+def update_site_watermark(site: Site, tracks: list[Track]) -> None:
+    """
+    Moves the site's watermark forward to the newest of the given tracks
 
-    db.session.add(new_song)
-    db.session.flush()
-    db.session.refresh(new_song)
+    Args:
+        site (Site): The site that was scraped
+        tracks (list[Track]): The tracks scraped during the run
+    """
+    dated_tracks = [track for track in tracks if track.date_published]
+    if not dated_tracks:
+        return
+    newest_track = max(dated_tracks, key=lambda track: track.date_published)
+    if site.last_date_published and newest_track.date_published < site.last_date_published:
+        return
+    site.last_date_published = newest_track.date_published
+    site.last_link = newest_track.link
     db.session.commit()
 
-    return new_song.id
+
+def start_spotify_enricher() -> SpotifyEnricher | None:
+    """
+    Starts a background stage that matches newly saved songs to Spotify tracks, starting with the songs earlier runs
+        left pending
+
+    Returns:
+        SpotifyEnricher | None: the running stage, or None if no Spotify client is available
+    """
+    if not (spotify_obj := get_spotify_obj()):
+        logger.warning("no Spotify client available, new songs won't be matched to Spotify tracks")
+        return None
+    enricher = SpotifyEnricher(current_app._get_current_object(), spotify_obj).start()
+    if num_requeued := enricher.requeue_pending():
+        logger.info(f"requeued {num_requeued} songs left pending by earlier runs for Spotify matching")
+    return enricher
+
+
+def save_streamed_tracks(
+    pages: Iterable[tuple[Any, list[Track]]],
+    site: Site,
+    batch_size: int = INGEST_BATCH_SIZE,
+    enricher: SpotifyEnricher | None = None,
+    stream_stats: StreamStats | None = None,
+    update_saved: bool = False,
+) -> list[int]:
+    """
+    Saves the tracks from a stream of parsed pages in batches and moves the site's watermark forward
+
+    Args:
+        pages (Iterable[tuple[Any, list[Track]]]): Pairs of page identifiers and the tracks parsed from each page
+        site (Site): The site the tracks were scraped from
+        batch_size (int): The number of scraped tracks to save per transaction
+        enricher (SpotifyEnricher | None): Stage the IDs of each saved batch are handed to for Spotify matching
+        stream_stats (StreamStats | None): Stats of the stream_top_tracks run the pages come from, which are logged
+        update_saved (bool): Update the songs saved from the tracks' links to match them, see update_saved_tracks
+
+    Returns:
+        list[int]: the Song IDs of the tracks that were saved
+    """
+    start_time = time.perf_counter()
+    num_scraped_tracks = 0
+    num_pages = 0
+    new_song_ids = []
+    updated_song_ids = []
+    batch = []
+
+    def save_batch() -> None:
+        nonlocal num_scraped_tracks
+        num_scraped_tracks += len(batch)
+        new_tracks, relookup_ids = batch, []
+        if update_saved:
+            new_tracks, updated_ids, relookup_ids = update_saved_tracks(batch, site.name)
+            updated_song_ids.extend(updated_ids)
+        batch_song_ids = save_new_tracks(new_tracks, site.name)
+        if enricher:
+            enricher.submit(batch_song_ids + relookup_ids)
+        new_song_ids.extend(batch_song_ids)
+        update_site_watermark(site, batch)
+        batch.clear()
+
+    # pages are saved as they're parsed, so batches may mix tracks from pages that finished out of order
+    for _, tracks in pages:
+        num_pages += 1
+        batch.extend(tracks)
+        if len(batch) >= batch_size:
+            save_batch()
+    if batch:
+        save_batch()
+    refresh_song_search_index(new_song_ids + updated_song_ids)
+
+    elapsed = time.perf_counter() - start_time
+    # the parsing processes are measured separately, their peaks can't be added to this process' peak
+    peak_rss = f"peak RSS: {get_peak_rss_mb():.1f} MiB"
+    if stream_stats and stream_stats.num_pages:
+        peak_rss += f", largest parsing process peak RSS: {stream_stats.parse_peak_rss_mb:.1f} MiB"
+    logger.info(
+        f"saved {len(new_song_ids)} new tracks{f' and updated {len(updated_song_ids)} songs' if update_saved else ''} "
+        f"out of {num_scraped_tracks} scraped tracks from {num_pages} pages "
+        f"in {elapsed:.2f}s ({num_scraped_tracks / elapsed if elapsed else 0:.1f} tracks/sec), {peak_rss}"
+    )
+    return new_song_ids
 
 
-def update_pitchfork_top_tracks_db(max_page_num: int = 255) -> int:
+def update_pitchfork_top_tracks_db(
+    max_page_num: int = 255,
+    batch_size: int = INGEST_BATCH_SIZE,
+    incremental: bool = False,
+    wait_for_enrichment: bool = True,
+) -> int:
     """
     Populates the database with recommended Pitchfork tracks
 
     Args:
         max_page_num (int): The maximum page number to obtain the HTML for
             defaults to 255 to get all recommendations
+        batch_size (int): The number of scraped tracks to save per transaction
+        incremental (bool): Fetch pages one at a time, newest first, and stop at the first page without new tracks
+        wait_for_enrichment (bool): Return only once every new song has been matched to a Spotify track
+            otherwise matching carries on in the background and its progress can be read from the database
     
     Returns:
         int: The number of tracks that were successfully added to the database
     """
     
     save_new_recommendations_site("Pitchfork")
-    with Pool() as pool:
-        html_results = pool.map(
-            get_pitchfork_top_tracks_html,
-            range(1, max_page_num + 1),
+    site = Site.query.get("Pitchfork")
+
+    pitchfork_http_cache.reset_stats()
+    enricher = start_spotify_enricher()
+    # the enricher's threads are stopped even if the scrape fails, the songs saved before it did are still matched
+    try:
+        stream_stats = StreamStats()
+        if incremental:
+            pages = stream_new_top_tracks(site, max_page_num)
+        else:
+            pages = stream_top_tracks(range(1, max_page_num + 1), stats=stream_stats)
+        new_song_ids = save_streamed_tracks(pages, site, batch_size, enricher, stream_stats)
+        cache_stats = pitchfork_http_cache.reset_stats()
+        logger.info(
+            f"HTTP cache: {cache_stats.hits} hits, {cache_stats.misses} misses, {cache_stats.bytes_saved} bytes saved"
         )
-    num_new_tracks_added = 0
-    spotify_obj = get_spotify_obj()
-    for html in html_results:
-        if html:
-            tracks = parse_top_tracks_html(html)
-            for track in tracks:
-                if song_id := save_new_track(track, "Pitchfork"):
-                    num_new_tracks_added += 1
-                    add_spotify_track_id_and_preview_url(song_id, spotify_obj, db)
-    return num_new_tracks_added
+    finally:
+        if enricher:
+            enricher.close(wait=wait_for_enrichment)
+    return len(new_song_ids)
 
 
-def add_spotify_track_id_and_preview_url(song_id: int, spotify_obj: tk.Spotify) -> bool:
+def reingest_pitchfork_archive(batch_size: int = INGEST_BATCH_SIZE) -> int:
     """
-    Updates a Song in the database with the Spotify Track ID for that song and the Spotify preview URL
+    Re-derives Pitchfork tracks from the latest archived copy of every page, without any network access
+
+    The archived pages go through the same parse and save path as a live scrape, with parsing spread across cores,
+        except that the songs saved from the tracks' links are updated to match them, see update_saved_tracks
 
     Args:
-        song_id (int): The Song's ID in the database
-        spotify_obj (tk.Spotify): a Spotify authentication object
-    
-        Returns:
-            bool: True if the song's track ID and preview URL were successfully updated, False otherwise
+        batch_size (int): The number of parsed tracks to save per transaction
+
+    Returns:
+        int: The number of tracks that were added to the database
     """
-    song = Song.query.get(song_id)
-    spotify_track_id = search_spotify_track_id(spotify_obj, song)
-    if not spotify_track_id:
-        return False
-    song.spotify_track_id = spotify_track_id
-    track = spotify_obj.track(spotify_track_id)
-    song.preview_url = track.preview_url
-    db.session.commit()
-    return True
+    save_new_recommendations_site("Pitchfork")
+    site = Site.query.get("Pitchfork")
+
+    entries = pitchfork_html_archive.latest_entries(url_prefix=TOP_TRACKS_URL)
+    logger.info(f"re-ingesting {len(entries)} archived Pitchfork pages")
+    enricher = start_spotify_enricher()
+    try:
+        stream_stats = StreamStats()
+        pages = stream_top_tracks(
+            [entry.sha256 for entry in entries],
+            fetch_html=pitchfork_html_archive.load,
+            max_fetch_workers=os.cpu_count() or 1,
+            stats=stream_stats,
+        )
+        new_song_ids = save_streamed_tracks(pages, site, batch_size, enricher, stream_stats, update_saved=True)
+    finally:
+        if enricher:
+            enricher.close()
+    return len(new_song_ids)
+
+
+def backfill_song_fingerprints(batch_size: int = 1000) -> dict[str, list[int]]:
+    """
+    Computes the fingerprints of songs saved before fingerprints were added
+
+    Songs that share a fingerprint are duplicates of each other. The song that already has the fingerprint, or else
+        the oldest one, keeps it and the rest are left without one and reported
+
+    Args:
+        batch_size (int): The number of songs updated per statement
+
+    Returns:
+        dict[str, list[int]]: the IDs of the songs sharing each fingerprint that more than one song has
+    """
+    artists_by_song_id: dict[int, list[str]] = {}
+    artist_rows = db.session.execute(select(track_artists_table.c.song_id, track_artists_table.c.artist_name))
+    for song_id, artist_name in artist_rows:
+        artists_by_song_id.setdefault(song_id, []).append(artist_name)
+
+    song_ids_by_fingerprint: dict[str, list[int]] = {}
+    missing_ids = set()
+    for song_id, name, site_name, fingerprint in db.session.execute(
+        select(Song.id, Song.name, Song.site_name, Song.fingerprint).order_by(Song.fingerprint.is_(None), Song.id)
+    ):
+        if fingerprint is None:
+            fingerprint = song_fingerprint(name, artists_by_song_id.get(song_id, []), site_name)
+            missing_ids.add(song_id)
+        song_ids_by_fingerprint.setdefault(fingerprint, []).append(song_id)
+
+    # songs that already have their fingerprint sort first, otherwise the oldest song does
+    updates = [
+        {"id": song_ids[0], "fingerprint": fingerprint}
+        for fingerprint, song_ids in song_ids_by_fingerprint.items()
+        if song_ids[0] in missing_ids
+    ]
+    for start in range(0, len(updates), batch_size):
+        db.session.execute(update(Song), updates[start:start + batch_size])
+        db.session.commit()
+
+    collisions = {
+        fingerprint: song_ids for fingerprint, song_ids in song_ids_by_fingerprint.items() if len(song_ids) > 1
+    }
+    for fingerprint, song_ids in collisions.items():
+        logger.warning(f"songs {song_ids} share fingerprint {fingerprint}, only song {song_ids[0]} was given it")
+    logger.info(f"backfilled {len(updates)} song fingerprints, found {len(collisions)} collisions")
+    return collisions
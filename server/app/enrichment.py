@@ -0,0 +1,219 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from queue import Empty, Queue
+from threading import Thread
+from typing import Iterable
+
+from flask import Flask
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import selectinload
+
+from .models import db, Song
+from .integrations.spotify import (
+    AsyncSafeSpotify,
+    SafeSpotify,
+    async_search_spotify_track,
+    get_preview_urls,
+    get_spotify_obj,
+    run_in_app_context,
+)
+from .utils.logging_utils import logger
+
+# the maximum number of songs looked up on Spotify concurrently
+SPOTIFY_ENRICHMENT_WORKERS = int(os.getenv("SPOTIFY_ENRICHMENT_WORKERS", "8"))
+# the maximum number of lookup results written to the database per transaction
+ENRICHMENT_WRITE_BATCH_SIZE = int(os.getenv("ENRICHMENT_WRITE_BATCH_SIZE", "50"))
+
+# values of Song.spotify_lookup_status
+LOOKUP_PENDING = "pending"
+LOOKUP_DONE = "done"
+LOOKUP_FAILED = "failed"
+
+# put on a queue to tell its consumer there is no more work
+_STOP = object()
+
+
+@dataclass
+class SpotifyLookupResult:
+    """
+    Represents the outcome of looking up a Song on Spotify
+
+    Attributes:
+        song_id (int): The Song's ID in the database
+        spotify_track_id (str | None): The matching Spotify track ID, None if no match was found
+        preview_url (str | None): The matching track's preview URL
+    """
+    song_id: int
+    spotify_track_id: str | None
+    preview_url: str | None
+
+    def to_row(self) -> dict:
+        """
+        Converts the result to the column values to update the Song with
+        """
+        return {
+            "id": self.song_id,
+            "spotify_track_id": self.spotify_track_id,
+            "preview_url": self.preview_url,
+            "spotify_lookup_status": LOOKUP_DONE if self.spotify_track_id else LOOKUP_FAILED,
+        }
+
+
+class SpotifyEnricher:
+    """
+    Background stage that adds Spotify track IDs and preview URLs to new songs
+
+    Song IDs are put on a work queue consumed by a lookup thread that runs up to `num_workers` searches concurrently
+        on an asynchronous Spotify client, reading the database on worker threads so the event loop is never blocked.
+        Their results are written back by a single writer thread in batches, so saving songs never waits on Spotify
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        spotify_obj: SafeSpotify,
+        num_workers: int = SPOTIFY_ENRICHMENT_WORKERS,
+        write_batch_size: int = ENRICHMENT_WRITE_BATCH_SIZE,
+    ):
+        self.app = app
+        self.spotify_obj = spotify_obj
+        self.num_workers = num_workers
+        self.write_batch_size = write_batch_size
+        self._song_ids: Queue = Queue()
+        self._results: Queue = Queue()
+        self._lookup_thread = Thread(target=self._lookup_songs, daemon=True)
+        self._writer = Thread(target=self._write_results, daemon=True)
+
+    def start(self) -> "SpotifyEnricher":
+        """
+        Starts the lookup and writer threads
+        """
+        self._lookup_thread.start()
+        self._writer.start()
+        return self
+
+    def submit(self, song_ids: Iterable[int]) -> None:
+        """
+        Queues songs to be looked up on Spotify
+
+        Args:
+            song_ids (Iterable[int]): The IDs of the Songs to look up
+        """
+        for song_id in song_ids:
+            self._song_ids.put(song_id)
+
+    def requeue_pending(self) -> int:
+        """
+        Queues the songs still waiting to be looked up, which an earlier run left pending if it stopped before its
+            queue was drained or had no Spotify client
+
+        Returns:
+            int: the number of songs queued
+        """
+        with self.app.app_context():
+            song_ids = db.session.scalars(
+                select(Song.id).where(Song.spotify_lookup_status == LOOKUP_PENDING).order_by(Song.id)
+            ).all()
+        self.submit(song_ids)
+        return len(song_ids)
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Stops the stage once every queued song has been looked up and its result written
+
+        Args:
+            wait (bool): Block until the remaining work is finished
+        """
+        self._song_ids.put(_STOP)
+        if wait:
+            self._writer.join()
+
+    @staticmethod
+    def _load_song(song_id: int) -> Song | None:
+        # the song is used after its session is closed, so the artists it's matched on are loaded up front
+        return db.session.get(Song, song_id, options=[selectinload(Song.artists)])
+
+    async def _lookup_song(self, spotify_obj: AsyncSafeSpotify, song_id: int) -> None:
+        try:
+            song = await run_in_app_context(self._load_song, song_id)
+            if track := await async_search_spotify_track(spotify_obj, song):
+                # the preview URL comes from the search result, tracks without one are looked up in bulk by the writer
+                result = SpotifyLookupResult(song_id=song_id, spotify_track_id=track.id, preview_url=track.preview_url)
+            else:
+                result = SpotifyLookupResult(song_id=song_id, spotify_track_id=None, preview_url=None)
+        except Exception:
+            logger.exception(f"failed to look up song with ID {song_id} on Spotify")
+            result = SpotifyLookupResult(song_id=song_id, spotify_track_id=None, preview_url=None)
+        self._results.put(result)
+
+    async def _lookup_songs_concurrently(self, spotify_obj: AsyncSafeSpotify) -> None:
+        lookups = set()
+        while (song_id := await asyncio.to_thread(self._song_ids.get)) is not _STOP:
+            if len(lookups) >= self.num_workers:
+                _, lookups = await asyncio.wait(lookups, return_when=asyncio.FIRST_COMPLETED)
+            lookups.add(asyncio.create_task(self._lookup_song(spotify_obj, song_id)))
+        if lookups:
+            await asyncio.wait(lookups)
+
+    async def _run_lookups(self) -> None:
+        # the asynchronous client's HTTP connections belong to this event loop, so it's created and closed here
+        if not (spotify_obj := await run_in_app_context(get_spotify_obj, asynchronous=True)):
+            logger.warning("no Spotify client available, queued songs are left pending")
+            return
+        try:
+            await self._lookup_songs_concurrently(spotify_obj)
+        finally:
+            await spotify_obj.sender.client.aclose()
+
+    def _lookup_songs(self) -> None:
+        with self.app.app_context():
+            try:
+                asyncio.run(self._run_lookups())
+            finally:
+                # tell the writer there are no more results coming
+                self._results.put(_STOP)
+
+    def _add_missing_preview_urls(self, rows: list[dict]) -> None:
+        track_ids = [row["spotify_track_id"] for row in rows if row["spotify_track_id"] and not row["preview_url"]]
+        if not track_ids:
+            return
+        preview_urls = get_preview_urls(self.spotify_obj, track_ids)
+        for row in rows:
+            if not row["preview_url"]:
+                row["preview_url"] = preview_urls.get(row["spotify_track_id"])
+
+    def _write_results(self) -> None:
+        with self.app.app_context():
+            stopped = False
+            while not stopped:
+                batch = []
+                while len(batch) < self.write_batch_size:
+                    try:
+                        result = self._results.get(timeout=1.0 if batch else None)
+                    except Empty:
+                        break
+                    if result is _STOP:
+                        stopped = True
+                        break
+                    batch.append(result.to_row())
+                if batch:
+                    self._add_missing_preview_urls(batch)
+                    db.session.execute(update(Song), batch)
+                    db.session.commit()
+                    logger.debug(f"wrote {len(batch)} Spotify lookup results")
+
+
+def get_enrichment_progress() -> dict[str, int]:
+    """
+    Counts songs by the state of their Spotify lookup
+
+    Returns:
+        dict[str, int]: the number of pending, done and failed lookups
+    """
+    counts = dict(
+        db.session.query(Song.spotify_lookup_status, func.count())
+        .filter(Song.spotify_lookup_status.is_not(None))
+        .group_by(Song.spotify_lookup_status)
+    )
+    return {status: counts.get(status, 0) for status in (LOOKUP_PENDING, LOOKUP_DONE, LOOKUP_FAILED)}
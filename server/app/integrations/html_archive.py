@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Lock
+
+# there's no default location, the archive has to outlive the process and the machine's temp directory doesn't
+HTML_ARCHIVE_DIR = os.getenv("HTML_ARCHIVE_DIR")
+
+
+@dataclass
+class ArchiveEntry:
+    """
+    Represents one fetch of a URL recorded in the archive
+
+    Attributes:
+        url (str): The URL that was fetched
+        sha256 (str): The SHA-256 hash of the fetched content, which is the key of the stored object
+        fetched_at (str): When the URL was fetched, as an ISO 8601 UTC timestamp
+    """
+    url: str
+    sha256: str
+    fetched_at: str
+
+
+class HtmlArchive:
+    """
+    Content-addressed archive of fetched pages
+
+    Each distinct page body is stored once, gzip compressed, under its SHA-256 hash. An append-only index records
+        every fetch as a URL, content hash and timestamp, so pages can be re-parsed later without any network access
+    """
+
+    def __init__(self, archive_dir: str | None = HTML_ARCHIVE_DIR):
+        self._archive_dir = archive_dir
+        self._index_lock = Lock()
+
+    @property
+    def archive_dir(self) -> str:
+        if not self._archive_dir:
+            raise RuntimeError("HTML_ARCHIVE_DIR is not set, set it to the directory fetched pages are archived in")
+        os.makedirs(os.path.join(self._archive_dir, "objects"), exist_ok=True)
+        return self._archive_dir
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.archive_dir, "index.jsonl")
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.archive_dir, "objects", sha256[:2], f"{sha256}.html.gz")
+
+    def store(self, url: str, content: bytes) -> str:
+        """
+        Stores the content fetched from a URL and records the fetch in the index
+
+        Args:
+            url (str): The URL the content was fetched from
+            content (bytes): The fetched content
+
+        Returns:
+            str: the SHA-256 hash the content is stored under
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            # write to a temp file first so a concurrent reader never sees a partially written object
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(object_path))
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(gzip.compress(content))
+            os.replace(temp_path, object_path)
+
+        entry = ArchiveEntry(url=url, sha256=sha256, fetched_at=datetime.now(timezone.utc).isoformat())
+        with self._index_lock, open(self.index_path, "a") as index_file:
+            index_file.write(json.dumps(entry.__dict__) + "\n")
+        return sha256
+
+    def load(self, sha256: str) -> bytes:
+        """
+        Loads stored content by its hash
+
+        Args:
+            sha256 (str): The SHA-256 hash of the content
+
+        Returns:
+            bytes: the decompressed content
+        """
+        with open(self._object_path(sha256), "rb") as object_file:
+            return gzip.decompress(object_file.read())
+
+    def latest_entries(self, url_prefix: str = "") -> list[ArchiveEntry]:
+        """
+        Returns the most recent fetch of every archived URL
+
+        Args:
+            url_prefix (str): Only return entries for URLs starting with this prefix
+
+        Returns:
+            list[ArchiveEntry]: the latest entry for each URL
+        """
+        if not os.path.exists(self.index_path):
+            return []
+        latest_entries = {}
+        with open(self.index_path) as index_file:
+            for line in index_file:
+                entry = ArchiveEntry(**json.loads(line))
+                if entry.url.startswith(url_prefix):
+                    latest_entries[entry.url] = entry
+        return list(latest_entries.values())
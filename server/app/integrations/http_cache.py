@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass, replace
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# there's no default location, cached pages are only worth keeping if they outlive the process
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR")
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    """
+    Creates a requests Session whose connections are kept alive and reused across requests and threads
+
+    Args:
+        pool_size (int): The maximum number of connections kept open per host
+
+    Returns:
+        requests.Session: the pooled session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@dataclass
+class HttpCacheStats:
+    """
+    Represents the usage of a ConditionalGetCache
+
+    Attributes:
+        hits (int): Number of requests answered with a 304 and served from the cache
+        misses (int): Number of requests that downloaded the response body
+        bytes_saved (int): Number of response body bytes that didn't have to be downloaded
+    """
+    hits: int = 0
+    misses: int = 0
+    bytes_saved: int = 0
+
+
+class ConditionalGetCache:
+    """
+    On-disk cache of GET responses that revalidates entries with conditional requests
+
+    Responses are stored with their ETag and Last-Modified headers, which are replayed as If-None-Match and
+        If-Modified-Since on the next request for the same URL, so unchanged pages come back as bodiless 304s
+    """
+
+    def __init__(self, cache_dir: str | None = HTTP_CACHE_DIR, session: requests.Session | None = None):
+        self._cache_dir = cache_dir
+        self.session = session or create_session()
+        self.stats = HttpCacheStats()
+        self._stats_lock = Lock()
+
+    @property
+    def cache_dir(self) -> str:
+        if not self._cache_dir:
+            raise RuntimeError("HTTP_CACHE_DIR is not set, set it to the directory fetched pages are cached in")
+        os.makedirs(self._cache_dir, exist_ok=True)
+        return self._cache_dir
+
+    def _entry_paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.body")
+
+    def _record(self, hit: bool, bytes_saved: int = 0) -> None:
+        with self._stats_lock:
+            if hit:
+                self.stats.hits += 1
+                self.stats.bytes_saved += bytes_saved
+            else:
+                self.stats.misses += 1
+
+    def _write_entry(self, url: str, content: bytes, validators: dict) -> None:
+        meta_path, body_path = self._entry_paths(url)
+        # write to temp files first so concurrent readers never see a partially written entry
+        for path, data in ((body_path, content), (meta_path, json.dumps(validators).encode())):
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+
+    def get(self, url: str, timeout: float = 30.0) -> tuple[int, bytes]:
+        """
+        Sends a GET request for the URL, revalidating any cached response
+
+        Args:
+            url (str): The URL to request
+            timeout (float): Seconds to wait for the server
+
+        Returns:
+            tuple[int, bytes]: the status code and content of the response - cached content is returned with a
+                200 status code when the server responds with 304
+        """
+        meta_path, body_path = self._entry_paths(url)
+        headers = {}
+        validators = {}
+        if os.path.exists(meta_path) and os.path.exists(body_path):
+            with open(meta_path) as meta_file:
+                validators = json.load(meta_file)
+            if etag := validators.get("etag"):
+                headers["If-None-Match"] = etag
+            if last_modified := validators.get("last_modified"):
+                headers["If-Modified-Since"] = last_modified
+
+        resp = self.session.get(url, headers=headers, timeout=timeout)
+        if resp.status_code == 304 and headers:
+            with open(body_path, "rb") as body_file:
+                content = body_file.read()
+            self._record(hit=True, bytes_saved=len(content))
+            return 200, content
+
+        self._record(hit=False)
+        new_validators = {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+        if resp.status_code == 200 and any(new_validators.values()):
+            self._write_entry(url, resp.content, new_validators)
+        return resp.status_code, resp.content
+
+    def reset_stats(self) -> HttpCacheStats:
+        """
+        Resets the cache's usage counters
+
+        Returns:
+            HttpCacheStats: the counters as they were before being reset
+        """
+        with self._stats_lock:
+            stats = replace(self.stats)
+            self.stats = HttpCacheStats()
+        return stats
@@ -0,0 +1,98 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from threading import Lock
+
+PLAYLIST_CACHE_MAX_ENTRIES = int(os.getenv("PLAYLIST_CACHE_MAX_ENTRIES", "1000"))
+
+
+@dataclass
+class PlaylistTrackIds:
+    """
+    Represents the tracks in a playlist at a point in time
+
+    Attributes:
+        snapshot_id (str): The playlist's snapshot ID, which changes whenever the playlist does
+        track_ids (set[str]): The IDs of the tracks in the playlist
+    """
+    snapshot_id: str
+    track_ids: set[str]
+
+
+@dataclass
+class PlaylistCacheStats:
+    """
+    Represents the usage of a PlaylistMembershipCache
+
+    Attributes:
+        hits (int): Number of lookups whose snapshot ID matched the cached one
+        misses (int): Number of lookups that required reading the whole playlist
+    """
+    hits: int = 0
+    misses: int = 0
+
+
+class PlaylistMembershipCache:
+    """
+    Per-process cache of the track IDs in playlists, keyed by each playlist's snapshot ID
+
+    A cached entry is only used while the playlist's current snapshot ID matches it. Our own adds update the entry in
+        place along with the snapshot ID Spotify returns for them, so consecutive adds don't need a full read. The least
+        recently used playlists are dropped beyond the maximum number of entries
+    """
+
+    def __init__(self, max_entries: int = PLAYLIST_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.stats = PlaylistCacheStats()
+        self._entries: OrderedDict[str, PlaylistTrackIds] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, playlist_id: str, snapshot_id: str) -> PlaylistTrackIds | None:
+        """
+        Looks up a playlist's tracks at its current snapshot
+
+        Args:
+            playlist_id (str): The ID of the playlist
+            snapshot_id (str): The playlist's current snapshot ID
+
+        Returns:
+            PlaylistTrackIds | None: a copy of the cached tracks, or None if the playlist isn't cached at this snapshot
+        """
+        with self._lock:
+            entry = self._entries.get(playlist_id)
+            if not entry or entry.snapshot_id != snapshot_id:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(playlist_id)
+            self.stats.hits += 1
+            return PlaylistTrackIds(snapshot_id=entry.snapshot_id, track_ids=set(entry.track_ids))
+
+    def put(self, playlist_id: str, playlist: PlaylistTrackIds) -> None:
+        """
+        Caches a playlist's tracks, replacing any earlier snapshot
+
+        Args:
+            playlist_id (str): The ID of the playlist
+            playlist (PlaylistTrackIds): The playlist's tracks and the snapshot they were read at
+        """
+        with self._lock:
+            self._entries[playlist_id] = PlaylistTrackIds(
+                snapshot_id=playlist.snapshot_id, track_ids=set(playlist.track_ids)
+            )
+            self._entries.move_to_end(playlist_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, playlist_id: str) -> None:
+        """
+        Removes a playlist from the cache
+        """
+        with self._lock:
+            self._entries.pop(playlist_id, None)
+
+    def get_stats(self) -> PlaylistCacheStats:
+        """
+        Returns a copy of the cache's usage counters
+        """
+        with self._lock:
+            return replace(self.stats)
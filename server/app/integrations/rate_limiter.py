@@ -0,0 +1,209 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass, replace
+from threading import Lock, local
+
+# the sustained number of Spotify requests per second allowed across every process sharing the limiter
+SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))
+# the number of requests that can be made at once after the limiter has been idle
+SPOTIFY_RATE_LIMIT_BURST = float(os.getenv("SPOTIFY_RATE_LIMIT_BURST", "20"))
+SPOTIFY_RATE_LIMIT_DB = os.getenv(
+    "SPOTIFY_RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "top-tracks-hub-spotify-rate-limit.sqlite")
+)
+
+
+@dataclass
+class RateLimiterStats:
+    """
+    Represents the usage of a SharedRateLimiter in this process
+
+    Attributes:
+        acquired (int): Number of requests let through
+        throttled_seconds (float): Total time requests spent waiting for the limiter
+        rate_limited (int): Number of rate limited responses reported to the limiter
+        retries_exhausted (int): Number of calls given up on after being rate limited on every try
+    """
+    acquired: int = 0
+    throttled_seconds: float = 0.0
+    rate_limited: int = 0
+    retries_exhausted: int = 0
+
+
+class SharedRateLimiter:
+    """
+    Token bucket that paces requests across every thread and process on the host
+
+    The bucket's state lives in a small SQLite database, so gunicorn workers draw from the same budget. A rate limited
+        response pauses the account whose token it was made with until its Retry-After deadline, instead of each
+        caller sleeping and retrying on its own, while requests made with other accounts carry on
+    """
+
+    def __init__(
+        self,
+        rate: float = SPOTIFY_RATE_LIMIT,
+        burst: float = SPOTIFY_RATE_LIMIT_BURST,
+        db_path: str = SPOTIFY_RATE_LIMIT_DB,
+        name: str = "spotify",
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.db_path = db_path
+        self.name = name
+        self.stats = RateLimiterStats()
+        self._stats_lock = Lock()
+        self._local = local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared across threads or forked processes, so each thread opens its own
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_bucket "
+                "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_pause "
+                "(name TEXT NOT NULL, account TEXT NOT NULL, paused_until REAL NOT NULL, PRIMARY KEY (name, account))"
+            )
+            conn.execute("INSERT OR IGNORE INTO token_bucket VALUES (?, ?, ?)", (self.name, self.burst, time.time()))
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _record(self, **increments: float) -> None:
+        with self._stats_lock:
+            for stat, increment in increments.items():
+                setattr(self.stats, stat, getattr(self.stats, stat) + increment)
+
+    def try_acquire(self, account: str | None = None) -> float:
+        """
+        Takes a token from the bucket if one is available and the account isn't paused
+
+        Args:
+            account (str | None): Identifies the account whose token the request is made with
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds to wait before trying again
+        """
+        return self._try_acquire(account)[0]
+
+    def _try_acquire(self, account: str | None) -> tuple[float, bool]:
+        # the wait, and whether it's for the account's rate limit pause rather than for the bucket to refill
+        conn = self._connect()
+        # an immediate transaction takes the database's write lock, so only one process updates the bucket at a time
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, updated_at = conn.execute(
+                "SELECT tokens, updated_at FROM token_bucket WHERE name = ?", (self.name,)
+            ).fetchone()
+            paused_until = conn.execute(
+                "SELECT paused_until FROM rate_limit_pause WHERE name = ? AND account = ?", (self.name, account or "")
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            is_paused = bool(paused_until) and now < paused_until[0]
+            if is_paused:
+                wait = paused_until[0] - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute("UPDATE token_bucket SET tokens = ?, updated_at = ? WHERE name = ?", (tokens, now, self.name))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait, is_paused
+
+    def acquire(self, account: str | None = None, block: bool = True) -> bool:
+        """
+        Blocks until a request can be made with the account
+
+        Args:
+            account (str | None): Identifies the account whose token the request is made with
+            block (bool): Whether to wait out a rate limit pause of the account, rather than give up on the request
+
+        Returns:
+            bool: whether the request can be made, which is only False if block is False and the account is paused
+        """
+        while True:
+            wait, is_paused = self._try_acquire(account)
+            if not wait:
+                break
+            if is_paused and not block:
+                return False
+            self._record(throttled_seconds=wait)
+            time.sleep(wait)
+        self._record(acquired=1)
+        return True
+
+    async def acquire_async(self, account: str | None = None, block: bool = True) -> bool:
+        """
+        Waits until a request can be made with the account without blocking the event loop, see acquire
+        """
+        while True:
+            # the bucket's database may be locked by another process, so it's updated on a worker thread
+            wait, is_paused = await asyncio.to_thread(self._try_acquire, account)
+            if not wait:
+                break
+            if is_paused and not block:
+                return False
+            self._record(throttled_seconds=wait)
+            await asyncio.sleep(wait)
+        self._record(acquired=1)
+        return True
+
+    def pause(self, seconds: float, account: str | None = None) -> None:
+        """
+        Stops every caller from making requests with an account until its rate limit has passed
+
+        Args:
+            seconds (float): How long the API asked us to wait before retrying
+            account (str | None): Identifies the account whose token the rate limited request was made with
+        """
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO rate_limit_pause VALUES (?, ?, ?) ON CONFLICT (name, account) "
+            "DO UPDATE SET paused_until = MAX(paused_until, excluded.paused_until)",
+            (self.name, account or "", time.time() + seconds),
+        )
+        self._record(rate_limited=1)
+
+    def record_retries_exhausted(self) -> None:
+        self._record(retries_exhausted=1)
+
+    def get_budget(self) -> dict[str, float]:
+        """
+        Reads the current state of the shared bucket
+
+        Returns:
+            dict[str, float]: the number of requests that can be made right now, the number of accounts in a rate
+                limit pause and the number of seconds left in the longest one
+        """
+        conn = self._connect()
+        tokens, updated_at = conn.execute(
+            "SELECT tokens, updated_at FROM token_bucket WHERE name = ?", (self.name,)
+        ).fetchone()
+        now = time.time()
+        paused_until = [
+            paused_until
+            for paused_until, in conn.execute(
+                "SELECT paused_until FROM rate_limit_pause WHERE name = ? AND paused_until > ?", (self.name, now)
+            )
+        ]
+        return {
+            "available_requests": min(self.burst, tokens + (now - updated_at) * self.rate),
+            "paused_accounts": len(paused_until),
+            "paused_for_seconds": max(paused_until, default=now) - now,
+        }
+
+    def get_stats(self) -> RateLimiterStats:
+        """
+        Returns a copy of the limiter's usage counters
+        """
+        with self._stats_lock:
+            return replace(self.stats)
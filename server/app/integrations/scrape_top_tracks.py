@@ -1,16 +1,48 @@
+import multiprocessing
+import os
 import re
+import resource
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from datetime import datetime, date
+from typing import Any, Callable, Iterable, Iterator
 
-import requests
-from bs4 import BeautifulSoup as bs
-from sqlalchemy import func
+from bs4 import BeautifulSoup as bs, SoupStrainer
+from bs4.builder import builder_registry
 
-from ..models import db, Artist, Genre, Song, Site
+from .html_archive import HtmlArchive
+from .http_cache import ConditionalGetCache, create_session
+from ..models import song_fingerprint
+from ..utils.logging_utils import logger
 
 
 TOP_TRACKS_URL = "https://pitchfork.com/reviews/best/tracks/"
 
+# concurrency limits for stream_top_tracks - a parse worker count of None uses one process per CPU
+SCRAPE_FETCH_WORKERS = int(os.getenv("SCRAPE_FETCH_WORKERS", "8"))
+SCRAPE_PARSE_WORKERS = int(workers) if (workers := os.getenv("SCRAPE_PARSE_WORKERS")) else None
+SCRAPE_MAX_PENDING_PAGES = int(os.getenv("SCRAPE_MAX_PENDING_PAGES", "16"))
+# parsing processes are forked from a clean server process rather than from the caller, which may be a threaded
+#   gunicorn worker whose open database connections and held locks a forked child would inherit
+PARSE_MP_CONTEXT = multiprocessing.get_context("forkserver")
+PARSE_MP_CONTEXT.set_forkserver_preload([__name__])
+
+# the BeautifulSoup tree builder used to parse pages, e.g. "html.parser" or "lxml" when lxml is installed
+HTML_PARSER = os.getenv("PITCHFORK_HTML_PARSER", "html.parser")
+if not builder_registry.lookup(HTML_PARSER):
+    logger.warning(f"HTML parser {HTML_PARSER} is not available, falling back to html.parser")
+    HTML_PARSER = "html.parser"
+# when true only the track elements are built into the tree, the rest of the page is skipped while parsing
+RESTRICTED_PARSE = os.getenv("PITCHFORK_RESTRICTED_PARSE", "false").lower() == "true"
+
+TRACK_ELEMS_SELECTOR = "div.track-hero, div.track-collection-item"
+TRACK_ELEMS_STRAINER = SoupStrainer("div", class_=["track-hero", "track-collection-item"])
+
+# shared by every fetch so connections are kept alive across pages and unchanged pages are served from disk
+pitchfork_http_cache = ConditionalGetCache(session=create_session(pool_size=SCRAPE_FETCH_WORKERS))
+# every fetched page is kept so changes to the parsing code can be re-applied without downloading pages again
+pitchfork_html_archive = HtmlArchive()
+
 QUOTES_CHARS = (
     34,
     39,
@@ -42,28 +74,31 @@ class Track:
     link: str
     date_published: date
 
-    def to_song(self, site):
+    def fingerprint(self, site: str) -> str:
+        """
+        Gets the fingerprint the track's Song is saved with, see models.song_fingerprint
+        """
+        return song_fingerprint(self.track_name, self.artists, site)
+
+    def to_song_values(self, site: str) -> dict[str, Any]:
         """
-        Converts the Track object to a Song object
+        Converts the Track object to the column values of a Song row, without its ID, artists and genres
 
         Args:
             site (str): The name of the site to associate with the Song
 
         Returns:
-            Song: The converted Song object
+            dict[str, Any]: the values to insert into the Song table
         """
-        song_artists = [Artist.query.get(artist) for artist in self.artists]
-        song_genres = [Genre.query.get(genre) for genre in self.genres]
-        max_id = db.session.query(func.max(Song.id)).scalar()
-        return Song(
-            id=max_id + 1,
-            name=self.track_name,
-            artists=song_artists,
-            genres=song_genres,
-            site=Site.query.get(site),
-            link=self.link,
-            date_published=self.date_published,
-        )
+        return {
+            "name": self.track_name,
+            "site_name": site,
+            "primary_artist": self.artists[0] if self.artists else "",
+            "link": self.link,
+            "date_published": self.date_published,
+            "spotify_lookup_status": "pending",
+            "fingerprint": self.fingerprint(site),
+        }
 
 
 def rm_quotes(text: str) -> str:
@@ -103,24 +138,34 @@ def get_pitchfork_top_tracks_html(page: int) -> bytes | None:
     Returns:
         bytes | None: the content of the response if successful, None otherwise
     """
-    resp = requests.get(f"{TOP_TRACKS_URL}?page={page}")
-    return resp.content if resp.status_code == 200 else None
+    url = f"{TOP_TRACKS_URL}?page={page}"
+    status_code, content = pitchfork_http_cache.get(url)
+    if status_code != 200:
+        return None
+    pitchfork_html_archive.store(url, content)
+    return content
 
 
-def parse_top_tracks_html(html: str) -> list[Track]:
+def parse_top_tracks_html(
+    html: str | bytes, parser: str = HTML_PARSER, restricted: bool = RESTRICTED_PARSE
+) -> list[Track]:
     """
     Parses the HTML and returns a list of Track objects
 
+    Every parser backend and mode yields the same list of Tracks, they only differ in speed and memory use
+
     Args:
-        html (str): The HTML to be parsed
+        html (str | bytes): The HTML to be parsed
+        parser (str): The BeautifulSoup tree builder to parse with
+        restricted (bool): Only build the track elements into the tree instead of the whole page
 
     Returns:
         list[Track]: A list of Track objects parsed from the HTML
     """
-    soup = bs(html, "html.parser")
+    soup = bs(html, parser, parse_only=TRACK_ELEMS_STRAINER if restricted else None)
     tracks = []
 
-    track_elems = soup.select("div.track-hero, div.track-collection-item")
+    track_elems = soup.select(TRACK_ELEMS_SELECTOR)
     for track_elem in track_elems:
         title_elem = track_elem.select_one("h2.track-collection-item__title, h2.title")
         track_name = sanitize_track_name(title_elem.text) if title_elem else None
@@ -152,3 +197,95 @@ def parse_top_tracks_html(html: str) -> list[Track]:
         )
 
     return tracks
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process in MiB
+    """
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _parse_page(html: bytes) -> tuple[list[Track], float]:
+    # runs in a parsing process, which reports its own peak RSS since it isn't a child the caller can measure
+    return parse_top_tracks_html(html), get_peak_rss_mb()
+
+
+@dataclass
+class StreamStats:
+    """
+    Represents the pages parsed by a run of stream_top_tracks
+
+    Attributes:
+        num_pages (int): Number of pages parsed
+        parse_peak_rss_mb (float): The highest peak resident set size of any of the parsing processes, in MiB
+    """
+    num_pages: int = 0
+    parse_peak_rss_mb: float = 0.0
+
+
+def stream_top_tracks(
+    pages: Iterable[Any],
+    fetch_html: Callable[[Any], bytes | None] = get_pitchfork_top_tracks_html,
+    max_fetch_workers: int = SCRAPE_FETCH_WORKERS,
+    max_parse_workers: int | None = SCRAPE_PARSE_WORKERS,
+    max_pending_pages: int = SCRAPE_MAX_PENDING_PAGES,
+    stats: StreamStats | None = None,
+) -> Iterator[tuple[int, list[Track]]]:
+    """
+    Fetches and parses pages concurrently, yielding the tracks from each page as soon as it has been parsed
+
+    Pages are downloaded on a thread pool and parsed on a pool of processes started from a fork server, so parsing
+        isn't serialized by the GIL and the calling process is never forked. At most max_pending_pages pages are
+        being fetched, parsed or waiting to be consumed at any time, which caps how much raw HTML is held in memory.
+        Pages are yielded in the order they finish, not in page order
+
+    Args:
+        pages (Iterable[Any]): The pages to fetch, e.g. page numbers or archived content hashes
+        fetch_html (Callable[[Any], bytes | None]): Function that returns the HTML for a page, or None
+        max_fetch_workers (int): The maximum number of pages to download at once
+        max_parse_workers (int | None): The number of parsing processes - defaults to the number of CPUs if None
+        max_pending_pages (int): The maximum number of pages in flight between the fetch and consume stages
+        stats (StreamStats | None): Updated with the number of pages parsed and the parsing processes' peak memory
+
+    Yields:
+        tuple[Any, list[Track]]: The page and the tracks parsed from it
+    """
+    pages = iter(pages)
+    fetching: dict[Future, int] = {}
+    parsing: dict[Future, int] = {}
+
+    with (
+        ThreadPoolExecutor(max_workers=max_fetch_workers) as fetch_pool,
+        ProcessPoolExecutor(max_workers=max_parse_workers, mp_context=PARSE_MP_CONTEXT) as parse_pool,
+    ):
+        def fetch_next_page() -> None:
+            if (page := next(pages, None)) is not None:
+                fetching[fetch_pool.submit(fetch_html, page)] = page
+
+        for _ in range(max_pending_pages):
+            fetch_next_page()
+
+        try:
+            while fetching or parsing:
+                done, _ = wait([*fetching, *parsing], return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in fetching:
+                        page = fetching.pop(future)
+                        if html := future.result():
+                            parsing[parse_pool.submit(_parse_page, html)] = page
+                        else:
+                            fetch_next_page()
+                    else:
+                        page = parsing.pop(future)
+                        fetch_next_page()
+                        tracks, parse_peak_rss_mb = future.result()
+                        if stats:
+                            stats.num_pages += 1
+                            stats.parse_peak_rss_mb = max(stats.parse_peak_rss_mb, parse_peak_rss_mb)
+                        yield page, tracks
+        finally:
+            # if the consumer stops early, don't wait on pages that haven't started yet
+            for future in [*fetching, *parsing]:
+                future.cancel()
@@ -0,0 +1,166 @@
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, replace
+from threading import Lock
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from tekore.model import FullTrackPaging
+
+from ..models import db, SpotifySearchCacheEntry
+from ..utils.logging_utils import logger
+
+SPOTIFY_SEARCH_CACHE_TTL = float(os.getenv("SPOTIFY_SEARCH_CACHE_TTL", str(7 * 24 * 60 * 60)))
+SPOTIFY_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SPOTIFY_SEARCH_CACHE_MAX_ENTRIES", "50000"))
+
+# how often, in seconds, an entry's last used time is updated when it's read
+TOUCH_INTERVAL = 60.0
+# the number of entries saved by this process between checks for entries to evict
+EVICTION_INTERVAL = 100
+
+
+@dataclass
+class SearchCacheStats:
+    """
+    Represents the usage of a SpotifySearchCache in this process
+
+    Attributes:
+        hits (int): Number of searches answered by a fresh cache entry
+        misses (int): Number of searches sent to Spotify
+        stale (int): Number of expired entries served because Spotify was rate limiting requests
+    """
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a search query so that trivially different queries share a cache entry
+    """
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def cache_key(query: str, **params) -> str:
+    """
+    Builds the key a search is cached under from its normalized query and every other parameter that changes
+        Spotify's response, e.g. the market, so searches that differ in any of them never share an entry
+    """
+    return json.dumps([normalize_query(query), params], sort_keys=True)
+
+
+class SpotifySearchCache:
+    """
+    Database-backed cache of Spotify track search results
+
+    Entries are keyed by the normalized query and the other search parameters, see cache_key, and shared by every
+        worker process. They expire after a TTL and the least recently used entries are evicted once the cache grows
+        beyond its maximum size. The cache reads and writes its entries in transactions of its own, so using it never
+        flushes or commits changes pending in the caller's session
+    """
+
+    def __init__(self, ttl: float = SPOTIFY_SEARCH_CACHE_TTL, max_entries: int = SPOTIFY_SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = SearchCacheStats()
+        self._lock = Lock()
+        self._num_saved = 0
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            setattr(self.stats, stat, getattr(self.stats, stat) + 1)
+
+    def get(self, query: str, **params) -> tuple[FullTrackPaging | None, bool]:
+        """
+        Looks up the cached results for a query
+
+        Args:
+            query (str): The search query
+            **params: The other parameters the search is made with
+
+        Returns:
+            tuple[FullTrackPaging | None, bool]: the cached results, or None if there are none,
+                and whether they are still fresh
+        """
+        key = cache_key(query, **params)
+        with db.engine.begin() as conn:
+            entry = conn.execute(
+                select(
+                    SpotifySearchCacheEntry.response,
+                    SpotifySearchCacheEntry.fetched_at,
+                    SpotifySearchCacheEntry.last_used_at,
+                ).where(SpotifySearchCacheEntry.search_query == key)
+            ).first()
+            if not entry:
+                return None, False
+            now = time.time()
+            if now - entry.last_used_at > TOUCH_INTERVAL:
+                conn.execute(
+                    update(SpotifySearchCacheEntry)
+                    .where(SpotifySearchCacheEntry.search_query == key)
+                    .values(last_used_at=now)
+                )
+        return FullTrackPaging(**json.loads(entry.response)), now - entry.fetched_at < self.ttl
+
+    def put(self, query: str, results: FullTrackPaging, **params) -> None:
+        """
+        Saves the results for a query, replacing any existing entry
+
+        Args:
+            query (str): The search query
+            results (FullTrackPaging): The search results
+            **params: The other parameters the search was made with
+        """
+        key = cache_key(query, **params)
+        now = time.time()
+        values = {"response": results.json(), "fetched_at": now, "last_used_at": now}
+        try:
+            with db.engine.begin() as conn:
+                replaced = conn.execute(
+                    update(SpotifySearchCacheEntry).where(SpotifySearchCacheEntry.search_query == key).values(**values)
+                )
+                if not replaced.rowcount:
+                    conn.execute(insert(SpotifySearchCacheEntry).values(search_query=key, **values))
+        except IntegrityError:
+            # another worker saved the same query first
+            return
+
+        with self._lock:
+            self._num_saved += 1
+            should_evict = self._num_saved % EVICTION_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used entries beyond the maximum size of the cache
+        """
+        excess_queries = (
+            select(SpotifySearchCacheEntry.search_query)
+            .order_by(SpotifySearchCacheEntry.last_used_at.desc())
+            .offset(self.max_entries)
+        )
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                delete(SpotifySearchCacheEntry).where(SpotifySearchCacheEntry.search_query.in_(excess_queries))
+            )
+        if result.rowcount:
+            logger.info(f"evicted {result.rowcount} Spotify search cache entries")
+
+    def record_hit(self) -> None:
+        self._count("hits")
+
+    def record_miss(self) -> None:
+        self._count("misses")
+
+    def record_stale(self) -> None:
+        self._count("stale")
+
+    def get_stats(self) -> SearchCacheStats:
+        """
+        Returns a copy of the cache's usage counters
+        """
+        with self._lock:
+            return replace(self.stats)
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, replace
+from threading import Event, Lock
+from typing import Any, Callable, Hashable
+
+
+@dataclass
+class SingleFlightStats:
+    """
+    Represents the usage of a SingleFlight
+
+    Attributes:
+        calls (int): Number of calls actually made
+        coalesced (int): Number of callers that shared another caller's in-flight call instead of making their own
+    """
+    calls: int = 0
+    coalesced: int = 0
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls so only one of them runs
+
+    The first caller with a given key makes the call, and any caller arriving with the same key while it's in flight
+        waits for it and gets the same result, or the same exception
+    """
+
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._calls: dict[Hashable, _InFlightCall] = {}
+        self._lock = Lock()
+
+    def do(self, key: Hashable, fnx: Callable[[], Any]) -> Any:
+        """
+        Runs a call unless an identical one is already in flight
+
+        Args:
+            key (Hashable): Identifies the call - calls with equal keys are treated as identical
+            fnx (Callable[[], Any]): Makes the call
+
+        Returns:
+            Any: the result of the call
+        """
+        with self._lock:
+            if call := self._calls.get(key):
+                self.stats.coalesced += 1
+                is_leader = False
+            else:
+                call = self._calls[key] = _InFlightCall()
+                self.stats.calls += 1
+                is_leader = True
+
+        if not is_leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fnx()
+            return call.result
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_stats(self) -> SingleFlightStats:
+        """
+        Returns a copy of the usage counters
+        """
+        with self._lock:
+            return replace(self.stats)
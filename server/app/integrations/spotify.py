@@ -1,25 +1,92 @@
-import tempfile
+import asyncio
 import time
-from typing import Callable, Iterable, Any
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Iterable, Iterator, Any
 from functools import wraps
 from dataclasses import dataclass
 
 import tekore as tk
-from tekore.model import FullTrackPaging, FullTrack, PlaylistTrack, Paging
+from flask import current_app
+from sqlalchemy import select
+from tekore.model import FullTrackPaging, FullTrack, Paging
 
 from .scrape_top_tracks import sanitize_track_name
+from .playlist_cache import PlaylistMembershipCache, PlaylistTrackIds
+from .rate_limiter import SharedRateLimiter
+from .search_cache import SpotifySearchCache
+from .single_flight import SingleFlight
+from .spotify_tokens import AccountPool, CachedToken, PooledAccount, UserTokenCache, spotify_sender
 from ..utils.logging_utils import logger
 from ..models import db, Song, User
 
+# the maximum number of track IDs accepted by Spotify's several tracks endpoint
+MAX_TRACKS_PER_REQUEST = 50
+# the maximum number of items Spotify returns per page of a playlist, and accepts per request to add to a playlist
+MAX_PLAYLIST_ITEMS_PER_REQUEST = 100
+# SafeSpotify methods whose endpoints accept the application's client credentials token instead of a user token
+CLIENT_CREDENTIALS_METHODS = {"search", "track", "tracks", "next"}
+# read-only SafeSpotify methods whose identical concurrent calls are coalesced into one request
+COALESCED_METHODS = CLIENT_CREDENTIALS_METHODS | {
+    "current_user",
+    "current_user_top_tracks",
+    "current_user_top_artists",
+    "playlists",
+    "playlist",
+    "playlist_items",
+}
+# identifies clients that make their calls through the app account pool
+APP_POOL_ACCOUNT_KEY = "app-pool"
+
+spotify_rate_limiter = SharedRateLimiter()
+spotify_search_cache = SpotifySearchCache()
+spotify_single_flight = SingleFlight()
+playlist_membership_cache = PlaylistMembershipCache()
+user_token_cache = UserTokenCache()
+app_account_pool = AccountPool(user_token_cache)
+
+
+@contextmanager
+def token_as(spotify_obj: tk.Spotify, token: Any) -> Iterator[tk.Spotify]:
+    """
+    Makes the client's calls in this context use another token, like tk.Spotify.token_as
+
+    tekore's token_as doesn't reset the token if the block raises, which leaves it set for every later call from the
+        same thread or task, whichever client makes them, since clients share the context variable it's kept in
+    """
+    cv_token = spotify_obj._token_cv.set(token)
+    try:
+        yield spotify_obj
+    finally:
+        spotify_obj._token_cv.reset(cv_token)
+
+
+def _drop_unusable_account(account_pool: AccountPool, account: PooledAccount, err: tk.ClientError) -> None:
+    """
+    Takes an account whose token Spotify refused to refresh, e.g. because the user revoked access, out of the pool so
+        calls move on to the next account instead of failing on it every time it comes round
+
+    Args:
+        account_pool (AccountPool): The pool the account was picked from
+        account (PooledAccount): The account
+        err (tk.ClientError): The error the refresh failed with
+    """
+    logger.warning(f"couldn't refresh the token of Spotify account {account.key}, leaving it out of the pool: {err}")
+    account_pool.remove(account)
 
 
 def safe_spotify_call(spotify_fnx: Callable[..., Any]):
     """
     Decorator function that executes a function through the Spotify API with rate limit error handling and thread safety
 
+    Every call waits for the shared rate limiter before it's sent, and a rate limited response pauses the account
+        whose token the call was made with for every caller until its Retry-After deadline. Callers with something
+        to fall back on pass block=False to give up instead of waiting out a pause
+
     Args:
         spotify_fnx (Callable): The Spotify function to be called - should be a method of the tekore.Spotify authentication object
         lock (Lock | None): A Lock object to prevent multiple threads modifying the authentication object concurrently
+        max_tries (int): The number of times the call is made before giving up on it while rate limited
+        block (bool): Whether to wait for a rate limited account to become available, rather than return None
         *args (Any): positional arguments to be passed to the Spotify function
         **kwargs (Any): Arbitrary keyword arguments to be passed to the Spotify function
 
@@ -32,24 +99,137 @@ def safe_spotify_call(spotify_fnx: Callable[..., Any]):
         *args,
         lock=None,
         max_tries: int = 10,
+        block: bool = True,
+        **kwargs,
+    ) -> Any | None:
+        spotify_obj = args[0]
+
+        def call_with_retries() -> Any | None:
+            account_pool = getattr(spotify_obj, "account_pool", None)
+            requires_user = spotify_fnx.__name__ not in CLIENT_CREDENTIALS_METHODS
+            num_tries = 0
+            while num_tries < max_tries:
+                account = None
+                if account_pool:
+                    if not (account := account_pool.acquire(requires_user=requires_user)):
+                        logger.error(f"no Spotify account in the pool can make the request: {spotify_fnx.__qualname__}")
+                        return None
+                    # every account is cooling down, so wait for the first one to become available
+                    if (wait := account.available_at - time.time()) > 0:
+                        if not block:
+                            return None
+                        time.sleep(wait)
+                    if isinstance(account.token, CachedToken) and account.token.is_expiring:
+                        try:
+                            str(account.token)
+                        except tk.ClientError as err:
+                            _drop_unusable_account(account_pool, account, err)
+                            continue
+                rate_limit_key = account.key if account else getattr(spotify_obj, "account_key", None)
+                if not spotify_rate_limiter.acquire(rate_limit_key, block=block):
+                    logger.debug(f"not waiting out the rate limit to make the request: {spotify_fnx.__qualname__}")
+                    return None
+                try:
+                    with lock or nullcontext(), token_as(spotify_obj, account.token) if account else nullcontext():
+                        return spotify_fnx(*args, **kwargs)
+                except tk.TooManyRequests as err:
+                    num_tries += 1
+                    logger.debug(
+                        f"reached rate limit making the following request: {spotify_fnx.__qualname__} with args: {args} and keyword args: {kwargs}"
+                    )
+                    logger.debug("trying again...")
+                    retry_after = int(err.response.headers.get("Retry-After", "1"))
+                    # every caller using the account waits out the rate limit rather than each one retrying on its own
+                    spotify_rate_limiter.pause(retry_after, rate_limit_key)
+                    if account:
+                        # once the pause is over the next try goes to another account if one isn't cooling down
+                        account_pool.cool_down(account, retry_after)
+
+            spotify_rate_limiter.record_retries_exhausted()
+            logger.error(
+                f"Unable to execute request. Maximum retries attempted for request: {spotify_fnx} with args: {args} and keyword args: {kwargs}"
+            )
+            return None
+
+        # identical reads made concurrently with the same account share one request instead of each using up quota -
+        # calls that give up sooner don't share a call that waits out rate limits, so their fallbacks still apply
+        account_key = getattr(spotify_obj, "account_key", None)
+        if account_key is None or spotify_fnx.__name__ not in COALESCED_METHODS:
+            return call_with_retries()
+        key = (spotify_fnx.__name__, account_key, max_tries, block, repr(args[1:]), repr(sorted(kwargs.items())))
+        return spotify_single_flight.do(key, call_with_retries)
+
+    return wrapper
+
+
+def async_safe_spotify_call(spotify_fnx: Callable[..., Any]):
+    """
+    Asynchronous counterpart of safe_spotify_call for methods of clients created with an asynchronous sender
+
+    Calls wait for the shared rate limiter and are retried after rate limited responses exactly like
+        safe_spotify_call, but waiting doesn't block the event loop so other calls carry on in the meantime
+
+    Args:
+        spotify_fnx (Callable): The Spotify coroutine function to be called
+        max_tries (int): The number of times the call is made before giving up on it while rate limited
+        block (bool): Whether to wait for a rate limited account to become available, rather than return None
+        *args (Any): positional arguments to be passed to the Spotify function
+        **kwargs (Any): Arbitrary keyword arguments to be passed to the Spotify function
+
+    Returns:
+        Any | None: The result of the Spotify function call, or None if the call fails after maximum retries
+    """
+
+    @wraps(spotify_fnx)
+    async def wrapper(
+        *args,
+        max_tries: int = 10,
+        block: bool = True,
         **kwargs,
     ) -> Any | None:
+        spotify_obj = args[0]
+        account_pool = getattr(spotify_obj, "account_pool", None)
+        requires_user = spotify_fnx.__name__ not in CLIENT_CREDENTIALS_METHODS
         num_tries = 0
         while num_tries < max_tries:
+            account = None
+            if account_pool:
+                if not (account := account_pool.acquire(requires_user=requires_user)):
+                    logger.error(f"no Spotify account in the pool can make the request: {spotify_fnx.__qualname__}")
+                    return None
+                if (wait := account.available_at - time.time()) > 0:
+                    if not block:
+                        return None
+                    await asyncio.sleep(wait)
+            # tekore reads the token while building the request, which would refresh an expiring one on the event loop
+            # and stall every other call until Spotify answers
+            if isinstance(token := account.token if account else spotify_obj.token, CachedToken) and token.is_expiring:
+                try:
+                    await asyncio.to_thread(str, token)
+                except tk.ClientError as err:
+                    if not account:
+                        raise
+                    _drop_unusable_account(account_pool, account, err)
+                    continue
+            rate_limit_key = account.key if account else getattr(spotify_obj, "account_key", None)
+            if not await spotify_rate_limiter.acquire_async(rate_limit_key, block=block):
+                logger.debug(f"not waiting out the rate limit to make the request: {spotify_fnx.__qualname__}")
+                return None
             try:
-                if not lock:
-                    return spotify_fnx(*args, **kwargs)
-                with lock:
-                    return spotify_fnx(*args, **kwargs)
+                # the token is set in a context variable, so it only applies to this task
+                with token_as(spotify_obj, account.token) if account else nullcontext():
+                    return await spotify_fnx(*args, **kwargs)
             except tk.TooManyRequests as err:
                 num_tries += 1
                 logger.debug(
                     f"reached rate limit making the following request: {spotify_fnx.__qualname__} with args: {args} and keyword args: {kwargs}"
                 )
-                logger.debug("trying again...")
                 retry_after = int(err.response.headers.get("Retry-After", "1"))
-                time.sleep(retry_after)
+                await asyncio.to_thread(spotify_rate_limiter.pause, retry_after, rate_limit_key)
+                if account:
+                    account_pool.cool_down(account, retry_after)
 
+        spotify_rate_limiter.record_retries_exhausted()
         logger.error(
             f"Unable to execute request. Maximum retries attempted for request: {spotify_fnx} with args: {args} and keyword args: {kwargs}"
         )
@@ -63,9 +243,18 @@ class SafeSpotify(tk.Spotify):
     Extended Spotify class with built-in rate limit handling and thread safety
 
     This class inherits from tekore.Spotify and adds automatic handling for rate limits
-    and optional thread safety for its methods
+    and optional thread safety for its methods. Clients created with an account pool pick the token
+    for each call from the pool instead of using a fixed token. Clients with an account key share
+    identical concurrent reads with other clients that have the same key
     """
 
+    def __init__(
+        self, *args, account_pool: AccountPool | None = None, account_key: str | None = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.account_pool = account_pool
+        self.account_key = account_key
+
     @safe_spotify_call
     def current_user(self):
         return super().current_user()
@@ -82,6 +271,10 @@ class SafeSpotify(tk.Spotify):
     def track(self, track_id: str, market: str | None = None):
         return super().track(track_id, market=market)
 
+    @safe_spotify_call
+    def tracks(self, track_ids: list[str], market: str | None = None):
+        return super().tracks(track_ids, market=market)
+
     @safe_spotify_call
     def next(self, page: Paging):
         return super().next(page)
@@ -100,6 +293,20 @@ class SafeSpotify(tk.Spotify):
     ):
         return super().playlist(playlist_id, fields=fields, market=market, as_tracks=as_tracks)
 
+    @safe_spotify_call
+    def playlist_items(
+        self,
+        playlist_id: str,
+        fields: str | None = None,
+        market: str | None = None,
+        as_tracks: bool | Iterable[str] = False,
+        limit: int = 100,
+        offset: int = 0,
+    ):
+        return super().playlist_items(
+            playlist_id, fields=fields, market=market, as_tracks=as_tracks, limit=limit, offset=offset
+        )
+
     @safe_spotify_call
     def playlist_create(self, user_id: str, name: str, public: bool = True, description: str = ""):
         return super().playlist_create(user_id, name, public=public, description=description)
@@ -123,6 +330,92 @@ class SafeSpotify(tk.Spotify):
         )
 
 
+class AsyncSafeSpotify(tk.Spotify):
+    """
+    Asynchronous variant of SafeSpotify
+
+    Its methods are coroutines that must be awaited, so several independent calls can be run concurrently,
+        e.g. with asyncio.gather. It must be created with an asynchronous sender
+    """
+
+    def __init__(
+        self, *args, account_pool: AccountPool | None = None, account_key: str | None = None, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.account_pool = account_pool
+        self.account_key = account_key
+
+    @async_safe_spotify_call
+    async def current_user(self):
+        return await super().current_user()
+
+    @async_safe_spotify_call
+    async def current_user_top_tracks(self, time_range: str = "medium_term", limit: int = 20, offset: int = 0):
+        return await super().current_user_top_tracks(time_range=time_range, limit=limit, offset=offset)
+
+    @async_safe_spotify_call
+    async def current_user_top_artists(self, time_range: str = "medium_term", limit: int = 20, offset: int = 0):
+        return await super().current_user_top_artists(time_range=time_range, limit=limit, offset=offset)
+
+    @async_safe_spotify_call
+    async def track(self, track_id: str, market: str | None = None):
+        return await super().track(track_id, market=market)
+
+    @async_safe_spotify_call
+    async def tracks(self, track_ids: list[str], market: str | None = None):
+        return await super().tracks(track_ids, market=market)
+
+    @async_safe_spotify_call
+    async def next(self, page: Paging):
+        return await super().next(page)
+
+    @async_safe_spotify_call
+    async def playlists(self, user_id: str, limit: int = 20, offset: int = 0):
+        return await super().playlists(user_id, limit=limit, offset=offset)
+
+    @async_safe_spotify_call
+    async def playlist(
+        self,
+        playlist_id: str,
+        fields: str | None = None,
+        market: str | None = None,
+        as_tracks: bool | Iterable[str] = False,
+    ):
+        return await super().playlist(playlist_id, fields=fields, market=market, as_tracks=as_tracks)
+
+    @async_safe_spotify_call
+    async def playlist_items(
+        self,
+        playlist_id: str,
+        fields: str | None = None,
+        market: str | None = None,
+        as_tracks: bool | Iterable[str] = False,
+        limit: int = 100,
+        offset: int = 0,
+    ):
+        return await super().playlist_items(
+            playlist_id, fields=fields, market=market, as_tracks=as_tracks, limit=limit, offset=offset
+        )
+
+    @async_safe_spotify_call
+    async def playlist_add(self, playlist_id: str, uris: list[str], position: int | None = None):
+        return await super().playlist_add(playlist_id, uris, position=position)
+
+    @async_safe_spotify_call
+    async def search(
+        self,
+        query: str,
+        types: tuple = ("track",),
+        market: str | None = None,
+        include_external: str | None = None,
+        limit: int = 20,
+        offset: int = 0,
+    ):
+        return await super().search(
+            query, types=types, market=market, include_external=include_external, limit=limit, offset=offset
+        )
+
+
 def track_id_to_uri(track_id: str):
     """
     Formats the Track ID to the URI
@@ -136,43 +429,48 @@ def track_id_to_uri(track_id: str):
     return f"spotify:track:{track_id}"
 
 
-def get_spotify_obj(user: User | None = None) -> SafeSpotify | None:
+def _create_sender(asynchronous: bool) -> tk.Sender:
+    # an asynchronous sender's HTTP client has to be closed by whoever uses it, so one is only created for a client
+    #   that's returned
+    return tk.AsyncSender() if asynchronous else spotify_sender
+
+
+def get_spotify_obj(user: User | None = None, asynchronous: bool = False) -> SafeSpotify | AsyncSafeSpotify | None:
     """
     Creates and returns a Spotify authentication object for a given user
 
     Because not all calls to the Spotify API require authentication with a specific user,
-        if no user is specified it selects the first user in the list of returned users
+        if no user is specified the client makes its calls with the app account pool, which uses the client
+        credentials flow where possible and otherwise rotates across the authorized users' accounts
 
     Args:
-        user (User | None): The user to authenticate with - defaults to the first user with a config file if None
+        user (User | None): The user to authenticate with - defaults to the app account pool if None
+        asynchronous (bool): Return an AsyncSafeSpotify with its own asynchronous sender, whose client
+            should be closed with `await spotify_obj.sender.client.aclose()` when it's no longer needed
 
     Returns:
         tk.Spotify | None: A Spotify client object or None if no valid user is found
     """
+    spotify_cls = AsyncSafeSpotify if asynchronous else SafeSpotify
     if user is None:
-        if users := User.query.filter(User.config_file.is_not(None)).all():
-            user = users[0]
-        else:
+        if app_account_pool.needs_reload():
+            app_account_pool.load(
+                db.session.execute(select(User.email, User.config_file).where(User.config_file.is_not(None))).all()
+            )
+        if app_account_pool.is_empty():
             logger.debug("Returning None for spotify obj function")
             return None
+        return spotify_cls(
+            sender=_create_sender(asynchronous), account_pool=app_account_pool, account_key=APP_POOL_ACCOUNT_KEY
+        )
 
-    elif user.config_file is None:
+    if user.config_file is None:
         logger.debug("Returning None for spotify obj function")
         return None
 
-    # tekore provides a convenient function for parsing the credentials necessary for authenticating to the
-    #   Spotify API, so first we first write the credentials to a temp file
-    with tempfile.NamedTemporaryFile() as temp_config_file:
-        temp_config_file.write(user.config_file)
-        temp_config_file.seek(0)
-        config = tk.config_from_file(temp_config_file.name, return_refresh=True)
-
-    token = tk.refresh_user_token(
-        config[0],
-        config[1],
-        config[3],
-    )
-    return SafeSpotify(token)
+    # the access token is reused until shortly before it expires rather than refreshed for every client
+    token = user_token_cache.get(user.email, user.config_file)
+    return spotify_cls(token, sender=_create_sender(asynchronous), account_key=user.email)
 
 
 def get_track_match(song: Song, tracks: list[FullTrack]) -> FullTrack | None:
@@ -197,31 +495,100 @@ def get_track_match(song: Song, tracks: list[FullTrack]) -> FullTrack | None:
     return None
 
 
-def search_spotify_track_id(spotify_obj: tk.Spotify, song: Song) -> str | None:
+async def run_in_app_context(fnx: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs a function that uses the database on a worker thread, so it doesn't block the event loop
+
+    The function runs in an app context of its own, so it gets its own database session rather than sharing the
+        calling task's session across threads
+
+    Args:
+        fnx (Callable): The function to run
+        *args (Any): positional arguments to be passed to the function
+        **kwargs (Any): Arbitrary keyword arguments to be passed to the function
+
+    Returns:
+        Any: the function's return value
+    """
+    app = current_app._get_current_object()
+
+    def run() -> Any:
+        with app.app_context():
+            return fnx(*args, **kwargs)
+
+    return await asyncio.to_thread(run)
+
+
+def search_spotify_track(spotify_obj: tk.Spotify, song: Song) -> FullTrack | None:
     """
-    Searches for a Spotify track ID that matches the given song
+    Searches for the Spotify track that matches the given song
 
     Args:
-        spotify_obj (tk.Spotify): The Spotify authenticatino object
+        spotify_obj (tk.Spotify): The Spotify authentication object
         song (Song): The song to search for on Spotify
 
     Returns:
-        str | None: The Spotify track ID if a match is found, otherwise None
+        tk.model.FullTrack | None: The matching Spotify track from the search results if one is found, otherwise None
     """
     logger.debug(f"Searching for track info - song name: {song.name}, song artists: {song.artists}")
 
-    search_results = search_spotify_tracks(spotify_obj, song.name, song.artists[0].name)
+    if not (search_results := search_spotify_tracks(spotify_obj, song.name, song.artists[0].name)):
+        return None
     if track := get_track_match(song, search_results.items):
-        return track.id
+        return track
     
     while search_results.next:
         search_results = spotify_obj.next(search_results)
         if track := get_track_match(song, search_results.items):
-            return track.id
+            return track
 
     return None
 
 
+async def async_search_spotify_track(spotify_obj: AsyncSafeSpotify, song: Song) -> FullTrack | None:
+    """
+    Asynchronous counterpart of search_spotify_track
+
+    Args:
+        spotify_obj (AsyncSafeSpotify): The asynchronous Spotify client object
+        song (Song): The song to search for on Spotify
+
+    Returns:
+        tk.model.FullTrack | None: The matching Spotify track from the search results if one is found, otherwise None
+    """
+    logger.debug(f"Searching for track info - song name: {song.name}, song artists: {song.artists}")
+
+    if not (search_results := await async_search_spotify_tracks(spotify_obj, song.name, song.artists[0].name)):
+        return None
+    if track := get_track_match(song, search_results.items):
+        return track
+
+    while search_results.next:
+        search_results = await spotify_obj.next(search_results)
+        if track := get_track_match(song, search_results.items):
+            return track
+
+    return None
+
+
+def get_preview_urls(spotify_obj: tk.Spotify, track_ids: list[str]) -> dict[str, str | None]:
+    """
+    Looks up the preview URLs of Spotify tracks, requesting up to 50 tracks per call
+
+    Args:
+        spotify_obj (tk.Spotify): The Spotify authentication object
+        track_ids (list[str]): The IDs of the tracks
+
+    Returns:
+        dict[str, str | None]: the preview URL of each track keyed by track ID
+    """
+    preview_urls = {}
+    for i in range(0, len(track_ids), MAX_TRACKS_PER_REQUEST):
+        if tracks := spotify_obj.tracks(track_ids[i:i + MAX_TRACKS_PER_REQUEST]):
+            preview_urls.update({track.id: track.preview_url for track in tracks if track})
+    return preview_urls
+
+
 def get_user_spotify_playlists(spotify_obj: tk.Spotify, filter_keyword="Pitchfork") -> list[dict]:
     """
     Retrieves a list of the user's Spotify playlists filtered by a keyword
@@ -261,18 +628,56 @@ def create_spotify_playlist(user: User, spotify_obj: tk.Spotify, playlist_name="
     db.session.commit()
 
 
-def get_playlist_tracks(
-    spotify_obj: tk.Spotify, playlist_id: str, ids_as_set=False
-) -> list[PlaylistTrack] | set[str]:
+def _page_track_ids(page: dict) -> set[str]:
+    # local files and unavailable tracks have no track object or no ID
+    return {item["track"]["id"] for item in page["items"] if item.get("track") and item["track"].get("id")}
+
+
+def get_playlist_track_ids(spotify_obj: tk.Spotify, playlist_id: str) -> PlaylistTrackIds | None:
+    """
+    Retrieves the IDs of every track in a playlist, requesting only the fields needed
+
+    The first page comes with the playlist's snapshot ID and total number of tracks, the rest are read
+        100 tracks at a time
+
+    Args:
+        spotify_obj (tk.Spotify): The Spotify authentication object
+        playlist_id (str): The ID of the playlist
+
+    Returns:
+        PlaylistTrackIds | None: the playlist's snapshot ID and track IDs, or None if the playlist couldn't be read
     """
-    Retrieves the tracks that are in the given user's playlist
+    if not (playlist := spotify_obj.playlist(playlist_id, fields="snapshot_id,tracks(total,items(track(id)))")):
+        return None
+    track_ids = _page_track_ids(playlist["tracks"])
+    for offset in range(MAX_PLAYLIST_ITEMS_PER_REQUEST, playlist["tracks"]["total"], MAX_PLAYLIST_ITEMS_PER_REQUEST):
+        page = spotify_obj.playlist_items(
+            playlist_id, fields="items(track(id))", limit=MAX_PLAYLIST_ITEMS_PER_REQUEST, offset=offset
+        )
+        if not page:
+            return None
+        track_ids |= _page_track_ids(page)
+    return PlaylistTrackIds(snapshot_id=playlist["snapshot_id"], track_ids=track_ids)
+
+
+def get_cached_playlist_track_ids(spotify_obj: tk.Spotify, playlist_id: str) -> PlaylistTrackIds | None:
     """
-    playlist = spotify_obj.playlist(playlist_id)
-    if not ids_as_set:
-        return playlist.tracks.items
-    
-    playlist_tracks = playlist.tracks.items
-    return {playlist_track.track.id for playlist_track in playlist_tracks}
+    Retrieves the IDs of every track in a playlist, reading the whole playlist only if it changed since it was cached
+
+    Args:
+        spotify_obj (tk.Spotify): The Spotify authentication object
+        playlist_id (str): The ID of the playlist
+
+    Returns:
+        PlaylistTrackIds | None: the playlist's snapshot ID and track IDs, or None if the playlist couldn't be read
+    """
+    if not (snapshot := spotify_obj.playlist(playlist_id, fields="snapshot_id")):
+        return None
+    if playlist := playlist_membership_cache.get(playlist_id, snapshot["snapshot_id"]):
+        return playlist
+    if playlist := get_playlist_track_ids(spotify_obj, playlist_id):
+        playlist_membership_cache.put(playlist_id, playlist)
+    return playlist
 
 
 @dataclass
@@ -291,56 +696,150 @@ class PlaylistAddResults:
 
 
 def add_tracks_to_playlist(
-    spotify_obj: tk.Spotify, playlist_id: str, new_track_ids: set[str]
+    spotify_obj: tk.Spotify,
+    playlist_id: str,
+    new_track_ids: Iterable[str],
+    on_progress: Callable[[PlaylistAddResults], None] | None = None,
 ) -> PlaylistAddResults:
     """
     Adds a list of track IDs to a Spotify playlist without duplicating any tracks in the playlist
 
+    Tracks are added 100 at a time, so a sync costs one read per 100 tracks in the playlist
+        plus one write per 100 new tracks. The playlist's tracks are cached by snapshot ID, so when it hasn't changed
+        since the last sync, reading it costs a single snapshot check
+
     Args:
         spotify_obj (tk.Spotify): The Spotify authentication object
         playlist_id (str): The ID of the playlist the tracks should be added to
-        new_track_ids (list[str]): A list of Spotify track IDs to add
+        new_track_ids (Iterable[str]): The Spotify track IDs to add, in the order they should be added
+        on_progress (Callable | None): Called with the results so far after each chunk of tracks is added
 
     Returns:
         dict: PlaylistAddResults object with success, failure, and duplicate fields to indicate the result of each track ID
     """
-    playlist_track_ids = get_playlist_tracks(spotify_obj, playlist_id, ids_as_set=True)
+    if not (playlist := get_cached_playlist_track_ids(spotify_obj, playlist_id)):
+        logger.error(f"unable to read the tracks in playlist {playlist_id}")
+        return PlaylistAddResults(success=(), failure=tuple(new_track_ids), duplicate=())
 
     # Spotify allows duplicate tracks in playlists, so we check which track IDs are already in the playlist
     #   to avoid adding duplicates
-    filtered_track_ids = set()
+    filtered_track_ids = []
     duplicates = set()
-    for track_id in new_track_ids:
-        if track_id in playlist_track_ids:
+    for track_id in dict.fromkeys(new_track_ids):
+        if track_id in playlist.track_ids:
             logger.warning(f"skipping duplicate track with id {track_id} to playlist")
             duplicates.add(track_id)
         else:
-            filtered_track_ids.add(track_id)
+            filtered_track_ids.append(track_id)
+
+    # a snapshot ID is only returned once every track in the request has been added, so the playlist doesn't need
+    #   to be read again to find out which tracks made it in
+    added_track_ids = set()
+    missing_track_ids = set()
+    for i in range(0, len(filtered_track_ids), MAX_PLAYLIST_ITEMS_PER_REQUEST):
+        chunk = filtered_track_ids[i:i + MAX_PLAYLIST_ITEMS_PER_REQUEST]
+        if snapshot_id := spotify_obj.playlist_add(playlist_id, [track_id_to_uri(track_id) for track_id in chunk]):
+            logger.info(f"Successfully updated playlist - snapshot ID returned: {snapshot_id}")
+            added_track_ids.update(chunk)
+            playlist.snapshot_id = snapshot_id
+        else:
+            missing_track_ids.update(chunk)
+        if on_progress:
+            on_progress(
+                PlaylistAddResults(
+                    success=tuple(added_track_ids), failure=tuple(missing_track_ids), duplicate=tuple(duplicates)
+                )
+            )
 
-    if filtered_track_ids:
-        snapshot_id = spotify_obj.playlist_add(
-            playlist_id, [track_id_to_uri(track_id) for track_id in filtered_track_ids]
-        )
-        logger.info(f"Successfully updated playlist - snapshot ID returned: {snapshot_id}")
-        playlist_track_ids = get_playlist_tracks(spotify_obj, playlist_id, ids_as_set=True)
+    if added_track_ids:
+        # the cached tracks are brought up to date with our own adds, so the next add only has to check the snapshot ID
+        playlist.track_ids |= added_track_ids
+        playlist_membership_cache.put(playlist_id, playlist)
 
-    added_track_ids = filtered_track_ids & playlist_track_ids
-    missing_track_ids = filtered_track_ids - playlist_track_ids
     return PlaylistAddResults(
         success=tuple(added_track_ids), failure=tuple(missing_track_ids), duplicate=tuple(duplicates)
     )
 
 
-def search_spotify_tracks(spotify_obj: tk.Spotify, song_name: str, artist_name: str) -> FullTrackPaging:
+def _track_search_params(market: str | None) -> dict:
+    # every parameter that changes the response is passed explicitly, since they're all part of the cache key
+    return {"types": ("track",), "market": market, "include_external": None, "limit": 20, "offset": 0}
+
+
+def search_spotify_tracks(
+    spotify_obj: tk.Spotify, song_name: str, artist_name: str, market: str | None = None
+) -> FullTrackPaging | None:
     """
     Searches Spotify for tracks matching a specific song name and artist
 
+    Results are cached, so repeated searches are answered from the cache until they expire. Expired results are still
+        served if Spotify is rate limiting requests
+
     Args:
         spotify_obj (tk.Spotify): The Spotify client object
         song_name (str): The name of the song to search for
         artist_name (str): The name of the artist of the song
+        market (str | None): Only return tracks available in this market, an ISO 3166-1 alpha-2 country code
+
+    Returns:
+        tk.model.FullTrackPaging | None: A paging object containing the search results,
+            or None if the search could not be made
+    """
+    query = f"{song_name} artist:{artist_name}"
+    params = _track_search_params(market)
+    cached_results, is_fresh = spotify_search_cache.get(query, **params)
+    if cached_results and is_fresh:
+        spotify_search_cache.record_hit()
+        return cached_results
+
+    # with stale results to fall back on, serve them rather than wait out or retry a rate limit
+    if cached_results:
+        search_results = spotify_obj.search(query, **params, max_tries=1, block=False)
+    else:
+        search_results = spotify_obj.search(query, **params)
+    return _save_search_results(query, params, search_results, cached_results)
+
+
+async def async_search_spotify_tracks(
+    spotify_obj: AsyncSafeSpotify, song_name: str, artist_name: str, market: str | None = None
+) -> FullTrackPaging | None:
+    """
+    Asynchronous counterpart of search_spotify_tracks, sharing its cache
+
+    The cache is read and written on a worker thread, so the event loop never waits on the database
+
+    Args:
+        spotify_obj (AsyncSafeSpotify): The asynchronous Spotify client object
+        song_name (str): The name of the song to search for
+        artist_name (str): The name of the artist of the song
+        market (str | None): Only return tracks available in this market, an ISO 3166-1 alpha-2 country code
 
     Returns:
-        tk.model.FullTrackPaging: A paging object containing the search results
+        tk.model.FullTrackPaging | None: A paging object containing the search results,
+            or None if the search could not be made
     """
-    return spotify_obj.search(f"{song_name} artist:{artist_name}")[0]
+    query = f"{song_name} artist:{artist_name}"
+    params = _track_search_params(market)
+    cached_results, is_fresh = await run_in_app_context(spotify_search_cache.get, query, **params)
+    if cached_results and is_fresh:
+        spotify_search_cache.record_hit()
+        return cached_results
+
+    if cached_results:
+        search_results = await spotify_obj.search(query, **params, max_tries=1, block=False)
+    else:
+        search_results = await spotify_obj.search(query, **params)
+    return await run_in_app_context(_save_search_results, query, params, search_results, cached_results)
+
+
+def _save_search_results(
+    query: str, params: dict, search_results: tuple | None, cached_results: FullTrackPaging | None
+) -> FullTrackPaging | None:
+    if not search_results:
+        if cached_results:
+            spotify_search_cache.record_stale()
+        return cached_results
+
+    spotify_search_cache.record_miss()
+    spotify_search_cache.put(query, search_results[0], **params)
+    return search_results[0]
@@ -0,0 +1,289 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from configparser import ConfigParser
+from dataclasses import dataclass
+from threading import Lock
+
+import tekore as tk
+
+from ..utils.logging_utils import logger
+
+# seconds between reloads of the authorized accounts in an AccountPool
+ACCOUNT_POOL_RELOAD_INTERVAL = float(os.getenv("SPOTIFY_ACCOUNT_POOL_RELOAD_INTERVAL", "600"))
+
+# key of the client credentials token in an AccountPool
+APP_ACCOUNT_KEY = "app"
+
+# one HTTP client shared by every Spotify client in the process so connections are kept alive and reused
+spotify_sender = tk.SyncSender()
+
+
+def parse_config_file(config_file: bytes) -> tuple[str | None, str | None, str | None, str | None]:
+    """
+    Parses a user's stored tekore config file in memory
+
+    Args:
+        config_file (bytes): The contents of the config file written by tk.config_to_file
+
+    Returns:
+        tuple[str | None, str | None, str | None, str | None]: the client ID, client secret, redirect URI
+            and user refresh token
+    """
+    # tekore's config parser only reads files, so we read the same INI format here instead of writing a temp file
+    parser = ConfigParser()
+    parser.optionxform = str
+    parser.read_string(config_file.decode())
+    section = parser["DEFAULT"]
+    return tuple(
+        section.get(var) for var in (tk.client_id_var, tk.client_secret_var, tk.redirect_uri_var, tk.user_refresh_var)
+    )
+
+
+class CachedToken(ABC):
+    """
+    An access token that's requested lazily and refreshed shortly before it expires
+
+    tekore reads the token with str() for every request it sends, so an instance can be passed to a Spotify client in
+        place of a token. Concurrent requests that find the token expiring wait for a single refresh. The refresh is a
+        blocking request, so asynchronous callers refresh an expiring token in a thread before sending their request
+    """
+
+    def __init__(self, credentials: tk.Credentials):
+        self.credentials = credentials
+        self._token: tk.Token | None = None
+        self._lock = Lock()
+
+    @abstractmethod
+    def _request_token(self) -> tk.Token:
+        """
+        Requests a new access token from Spotify
+        """
+
+    @property
+    def is_expiring(self) -> bool:
+        """
+        Whether reading the access token would request a new one
+        """
+        return self._token is None or self._token.is_expiring
+
+    @property
+    def access_token(self) -> str:
+        with self._lock:
+            if self.is_expiring:
+                self._token = self._request_token()
+            return self._token.access_token
+
+    def __str__(self) -> str:
+        return self.access_token
+
+
+class CachedUserToken(CachedToken):
+    """
+    A user's access token, refreshed with their refresh token
+    """
+
+    def __init__(self, credentials: tk.Credentials, refresh_token: str):
+        super().__init__(credentials)
+        self.refresh_token = refresh_token
+
+    def _request_token(self) -> tk.Token:
+        logger.debug("refreshing Spotify user access token")
+        token = self.credentials.refresh_user_token(self.refresh_token)
+        # Spotify may issue a new refresh token along with the access token
+        self.refresh_token = token.refresh_token or self.refresh_token
+        return token
+
+
+class CachedClientToken(CachedToken):
+    """
+    The application's own access token from the client credentials flow, which isn't tied to any user
+    """
+
+    def _request_token(self) -> tk.Token:
+        logger.debug("requesting Spotify client access token")
+        return self.credentials.request_client_token()
+
+
+class UserTokenCache:
+    """
+    Per-process cache of users' access tokens
+
+    Tokens are keyed by user and rebuilt whenever the user's stored config file changes, e.g. after they reauthorize
+    """
+
+    def __init__(self, sender: tk.Sender = spotify_sender):
+        self.sender = sender
+        self._tokens: dict[str, tuple[bytes, CachedUserToken]] = {}
+        self._lock = Lock()
+
+    def get(self, key: str, config_file: bytes) -> CachedUserToken:
+        """
+        Returns the cached token for a user, creating it if the user's config file isn't cached yet
+
+        Args:
+            key (str): Identifies the user, e.g. their email
+            config_file (bytes): The user's stored tekore config file
+
+        Returns:
+            CachedUserToken: the user's token
+        """
+        with self._lock:
+            cached = self._tokens.get(key)
+            if cached and cached[0] == config_file:
+                return cached[1]
+            client_id, client_secret, redirect_uri, refresh_token = parse_config_file(config_file)
+            credentials = tk.Credentials(client_id, client_secret, redirect_uri, sender=self.sender)
+            token = CachedUserToken(credentials, refresh_token)
+            self._tokens[key] = (config_file, token)
+            return token
+
+    def invalidate(self, key: str) -> None:
+        """
+        Removes a user's cached token
+
+        Args:
+            key (str): Identifies the user
+        """
+        with self._lock:
+            self._tokens.pop(key, None)
+
+
+@dataclass
+class PooledAccount:
+    """
+    Represents an account in an AccountPool
+
+    Attributes:
+        key (str): Identifies the account
+        token (CachedToken): The account's access token
+        available_at (float): When the account's rate limit cool-down ends, as a Unix timestamp
+        num_rate_limited (int): Number of rate limited responses received with the account's token
+    """
+    key: str
+    token: CachedToken
+    available_at: float = 0.0
+    num_rate_limited: int = 0
+
+
+class AccountPool:
+    """
+    Pool of access tokens for Spotify calls that aren't made on behalf of a particular user
+
+    Endpoints that don't need a user use the application's client credentials token when SPOTIFY_CLIENT_ID and
+        SPOTIFY_CLIENT_SECRET are set. Other calls rotate across the authorized users' accounts, skipping any account
+        that is cooling down after being rate limited
+    """
+
+    def __init__(self, token_cache: UserTokenCache, sender: tk.Sender = spotify_sender):
+        self.token_cache = token_cache
+        self.sender = sender
+        self._app_account: PooledAccount | None = None
+        self._user_accounts: list[PooledAccount] = []
+        self._next_index = 0
+        self._loaded_at: float | None = None
+        self._lock = Lock()
+
+    def needs_reload(self) -> bool:
+        return self._loaded_at is None or time.time() - self._loaded_at > ACCOUNT_POOL_RELOAD_INTERVAL
+
+    def load(self, accounts: list[tuple[str, bytes]]) -> None:
+        """
+        Replaces the accounts in the pool, keeping the cool-downs of accounts that are still authorized
+
+        Args:
+            accounts (list[tuple[str, bytes]]): The key and stored config file of each authorized user
+        """
+        client_id, client_secret = os.getenv(tk.client_id_var), os.getenv(tk.client_secret_var)
+        with self._lock:
+            if client_id and client_secret and not self._app_account:
+                credentials = tk.Credentials(client_id, client_secret, sender=self.sender)
+                self._app_account = PooledAccount(key=APP_ACCOUNT_KEY, token=CachedClientToken(credentials))
+            existing_accounts = {account.key: account for account in self._user_accounts}
+            self._user_accounts = []
+            for key, config_file in accounts:
+                token = self.token_cache.get(key, config_file)
+                if (account := existing_accounts.get(key)) and account.token is token:
+                    self._user_accounts.append(account)
+                else:
+                    self._user_accounts.append(PooledAccount(key=key, token=token))
+            self._loaded_at = time.time()
+        logger.debug(f"loaded {len(self._user_accounts)} authorized Spotify accounts into the pool")
+
+    def invalidate(self) -> None:
+        """
+        Makes the pool reload its accounts the next time it's used, e.g. after a user authorizes or unauthorizes
+        """
+        with self._lock:
+            self._loaded_at = None
+
+    def is_empty(self) -> bool:
+        return not (self._app_account or self._user_accounts)
+
+    def acquire(self, requires_user: bool = False) -> PooledAccount | None:
+        """
+        Picks the account to make a call with
+
+        Args:
+            requires_user (bool): Whether the endpoint needs a user token rather than the client credentials token
+
+        Returns:
+            PooledAccount | None: the client credentials account if it can be used and isn't cooling down,
+                otherwise the next user account that isn't cooling down - if every account is cooling down,
+                the one that becomes available first. None if the pool is empty
+        """
+        now = time.time()
+        with self._lock:
+            if not requires_user and self._app_account and self._app_account.available_at <= now:
+                return self._app_account
+            if not self._user_accounts:
+                return self._app_account if not requires_user else None
+            for i in range(len(self._user_accounts)):
+                account = self._user_accounts[(self._next_index + i) % len(self._user_accounts)]
+                if account.available_at <= now:
+                    self._next_index = (self._next_index + i + 1) % len(self._user_accounts)
+                    return account
+            candidates = self._user_accounts + ([self._app_account] if self._app_account and not requires_user else [])
+            return min(candidates, key=lambda account: account.available_at)
+
+    def cool_down(self, account: PooledAccount, seconds: float) -> None:
+        """
+        Stops an account from being picked until its rate limit has passed
+
+        Args:
+            account (PooledAccount): The account that was rate limited
+            seconds (float): How long Spotify asked us to wait before retrying
+        """
+        with self._lock:
+            account.available_at = max(account.available_at, time.time() + seconds)
+            account.num_rate_limited += 1
+
+    def remove(self, account: PooledAccount) -> None:
+        """
+        Takes an account out of rotation until the pool is next reloaded, e.g. after its token couldn't be refreshed
+
+        Args:
+            account (PooledAccount): The account to take out
+        """
+        with self._lock:
+            if account is self._app_account:
+                self._app_account = None
+            self._user_accounts = [user_account for user_account in self._user_accounts if user_account is not account]
+
+    def get_stats(self) -> dict[str, int | bool]:
+        """
+        Summarizes the state of the pool
+
+        Returns:
+            dict[str, int | bool]: whether the client credentials flow is used, the number of user accounts,
+                how many are currently available and the number of rate limited responses across all accounts
+        """
+        now = time.time()
+        with self._lock:
+            accounts = self._user_accounts + ([self._app_account] if self._app_account else [])
+            return {
+                "client_credentials": self._app_account is not None,
+                "user_accounts": len(self._user_accounts),
+                "available_user_accounts": sum(account.available_at <= now for account in self._user_accounts),
+                "rate_limited": sum(account.num_rate_limited for account in accounts),
+            }
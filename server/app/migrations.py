@@ -0,0 +1,69 @@
+import os
+import time
+
+from sqlalchemy import text
+
+from .models import db
+from .utils.logging_utils import logger
+
+MIGRATIONS_DIR = os.path.abspath(os.path.join(__file__, "../../migrations"))
+
+
+def get_migrations() -> list[str]:
+    """
+    Lists the migrations in the order they're applied in
+
+    Returns:
+        list[str]: the file names of the SQL migrations in MIGRATIONS_DIR
+    """
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+
+
+def get_applied_migrations() -> set[str]:
+    """
+    Reads which migrations have been applied to the database, creating the table that records them if needed
+    """
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations "
+                "(version VARCHAR(255) PRIMARY KEY, applied_at DOUBLE PRECISION NOT NULL)"
+            )
+        )
+        return set(conn.scalars(text("SELECT version FROM schema_migrations")))
+
+
+def upgrade_db() -> list[str]:
+    """
+    Applies every migration that hasn't been applied yet, in order
+
+    Each migration runs in its own transaction along with the row recording it, so a failed migration leaves nothing
+        behind and the next upgrade starts from it again. On postgres the record table is locked while a migration
+        runs, so concurrent upgrades apply each migration once. Migrations are written to be safe to rerun, so a
+        database that had some of them applied by hand is brought up to date the same way. The migrations in
+        MIGRATIONS_DIR are postgres SQL, the runner only skips the lock on other databases
+
+    Returns:
+        list[str]: the migrations that were applied
+    """
+    applied = get_applied_migrations()
+    newly_applied = []
+    for version in get_migrations():
+        if version in applied:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, version)) as f:
+            sql = f.read()
+        with db.engine.begin() as conn:
+            # other databases can only be upgraded by one process at a time
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("LOCK TABLE schema_migrations IN EXCLUSIVE MODE"))
+            if conn.scalar(text("SELECT 1 FROM schema_migrations WHERE version = :version"), {"version": version}):
+                continue
+            logger.info(f"applying migration {version}")
+            conn.exec_driver_sql(sql)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)"),
+                {"version": version, "applied_at": time.time()},
+            )
+        newly_applied.append(version)
+    return newly_applied
@@ -1,3 +1,8 @@
+import hashlib
+import time
+import unicodedata
+from typing import Iterable
+
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 
@@ -6,20 +11,23 @@ db = SQLAlchemy()
 
 track_artists_table = db.Table(
     "track_artists_table",
-    db.Column("song_id", db.Integer, db.ForeignKey("song.id")),
-    db.Column("artist_name", db.String(80), db.ForeignKey("artist.name")),
+    db.Column("song_id", db.Integer, db.ForeignKey("song.id"), primary_key=True),
+    db.Column("artist_name", db.String(80), db.ForeignKey("artist.name"), primary_key=True),
+    db.Index("ix_track_artists_table_artist_name", "artist_name", "song_id"),
 )
 
 track_genres_table = db.Table(
     "track_genres_table",
-    db.Column("song_id", db.Integer, db.ForeignKey("song.id")),
-    db.Column("genre_name", db.String(80), db.ForeignKey("genre.name")),
+    db.Column("song_id", db.Integer, db.ForeignKey("song.id"), primary_key=True),
+    db.Column("genre_name", db.String(80), db.ForeignKey("genre.name"), primary_key=True),
+    db.Index("ix_track_genres_table_genre_name", "genre_name", "song_id"),
 )
 
 sites_table = db.Table(
     "sites_table",
-    db.Column("song_id", db.Integer, db.ForeignKey("song.id")),
-    db.Column("site_name", db.String(80), db.ForeignKey("site.name")),
+    db.Column("song_id", db.Integer, db.ForeignKey("song.id"), primary_key=True),
+    db.Column("site_name", db.String(80), db.ForeignKey("site.name"), primary_key=True),
+    db.Index("ix_sites_table_site_name", "site_name", "song_id"),
 )
 
 
@@ -51,16 +59,78 @@ class Artist(db.Model):
     name = db.Column(db.String(80), primary_key=True)
 
 
+song_id_seq = db.Sequence("song_id_seq")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def song_fingerprint(name: str, artists: Iterable[str], site_name: str) -> str:
+    """
+    Identifies a song by its name and artists, ignoring case, spacing and the order the artists are listed in, and
+        the site it was recommended on
+
+    Returns:
+        str: an MD5 hex digest
+    """
+    parts = [_normalize(name), *sorted(_normalize(artist) for artist in artists), _normalize(site_name)]
+    return hashlib.md5("\x1f".join(parts).encode()).hexdigest()
+
+
 class Song(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, song_id_seq, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
-    artists = db.relationship("Artist", secondary=track_artists_table, lazy="subquery", backref="song")
-    genres = db.relationship("Genre", secondary=track_genres_table, lazy="subquery", backref="song")
+    # loaded on access - listings choose their own eager loading, see SONG_LISTING_OPTIONS in routes/tracks_routes.py
+    artists = db.relationship("Artist", secondary=track_artists_table, lazy="select", backref="song")
+    genres = db.relationship("Genre", secondary=track_genres_table, lazy="select", backref="song")
     site_name = db.Column(db.String(80), db.ForeignKey("site.name"), nullable=False)
+    # the first credited artist, which listings sorted by artist are ordered by
+    primary_artist = db.Column(db.String(80), nullable=False, server_default="")
     link = db.Column(db.String(80))
     date_published = db.Column(db.Date)
     spotify_track_id = db.Column(db.String(100))
     preview_url = db.Column(db.String)
+    # "pending", "done" or "failed" depending on whether the song has been matched to a Spotify track
+    spotify_lookup_status = db.Column(db.String(20))
+    # see song_fingerprint - only null for songs saved before it was added that duplicate another song
+    fingerprint = db.Column(db.String(32), index=True, unique=True)
+    # when the song was saved or its name, artists or genres last changed, which the search index finds changes by -
+    #   null for songs saved before it was added, see migrations/0010_song_updated_at.sql
+    updated_at = db.Column(db.Float, default=time.time, index=True)
+
+    # indexes backing the song listings and filters, see migrations/0006_song_listing_indexes.sql,
+    #   migrations/0008_association_keys_and_filter_indexes.sql and migrations/0009_song_name_trigram_index.sql - the
+    #   indexes on the default date ordering sort nulls last, which sqlite can't declare, and the trigram index on
+    #   names is postgres only, so they're only created there
+    __table_args__ = (
+        db.Index("ix_song_name_id", "name", "id"),
+        db.Index("ix_song_primary_artist_id", "primary_artist", "id"),
+    )
+
+
+class SpotifySearchCacheEntry(db.Model):
+    __tablename__ = "spotify_search_cache"
+    search_query = db.Column(db.String, primary_key=True)
+    response = db.Column(db.Text, nullable=False)
+    fetched_at = db.Column(db.Float, nullable=False)
+    last_used_at = db.Column(db.Float, nullable=False, index=True)
+
+
+class PlaylistSyncJob(db.Model):
+    __tablename__ = "playlist_sync_job"
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), nullable=False, index=True)
+    playlist_id = db.Column(db.String(120), nullable=False)
+    # "queued", "running", "done" or "failed"
+    status = db.Column(db.String(20), nullable=False)
+    num_tracks = db.Column(db.Integer, nullable=False, default=0)
+    num_added = db.Column(db.Integer, nullable=False, default=0)
+    num_duplicate = db.Column(db.Integer, nullable=False, default=0)
+    num_failed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String)
+    created_at = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)
 
 
 class Genre(db.Model):
@@ -70,3 +140,6 @@ class Genre(db.Model):
 class Site(db.Model):
     name = db.Column(db.String(80), primary_key=True)
     songs = db.relationship("Song", backref="site", lazy=True)
+    # watermark of the newest track seen when the site was last scraped, used for incremental updates
+    last_date_published = db.Column(db.Date)
+    last_link = db.Column(db.String(80))
@@ -0,0 +1,103 @@
+import time
+from threading import Thread
+
+from flask import Flask, current_app
+from sqlalchemy import select
+
+from .models import db, Song, User, PlaylistSyncJob
+from .controller import filter_songs
+from .integrations.spotify import PlaylistAddResults, add_tracks_to_playlist, get_spotify_obj
+from .utils.logging_utils import logger
+
+# values of PlaylistSyncJob.status
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def get_matching_spotify_track_ids(filters: dict) -> list[str]:
+    """
+    Resolves the Spotify track IDs of every song matching the filters in one query
+
+    Args:
+        filters (dict): The song filters accepted by the tracks endpoint
+
+    Returns:
+        list[str]: the distinct track IDs, oldest songs first
+    """
+    query = filter_songs(select(Song.spotify_track_id).where(Song.spotify_track_id.is_not(None)), filters)
+    return list(dict.fromkeys(db.session.scalars(query.order_by(Song.date_published, Song.id))))
+
+
+def start_playlist_sync(user: User, filters: dict) -> PlaylistSyncJob:
+    """
+    Starts a background job that adds every song matching the filters to the user's playlist
+
+    Args:
+        user (User): The user whose playlist the songs are added to
+        filters (dict): The song filters accepted by the tracks endpoint
+
+    Returns:
+        PlaylistSyncJob: the queued job
+    """
+    now = time.time()
+    job = PlaylistSyncJob(
+        email=user.email, playlist_id=user.playlist_id, status=JOB_QUEUED, created_at=now, updated_at=now
+    )
+    db.session.add(job)
+    db.session.commit()
+    Thread(target=_run_playlist_sync, args=(current_app._get_current_object(), job.id, filters), daemon=True).start()
+    return job
+
+
+def _update_job(job: PlaylistSyncJob, **values) -> None:
+    for key, value in values.items():
+        setattr(job, key, value)
+    job.updated_at = time.time()
+    db.session.commit()
+
+
+def _record_results(job: PlaylistSyncJob, results: PlaylistAddResults) -> None:
+    _update_job(
+        job,
+        num_added=len(results.success),
+        num_duplicate=len(results.duplicate),
+        num_failed=len(results.failure),
+    )
+
+
+def _run_playlist_sync(app: Flask, job_id: int, filters: dict) -> None:
+    with app.app_context():
+        job = db.session.get(PlaylistSyncJob, job_id)
+        try:
+            track_ids = get_matching_spotify_track_ids(filters)
+            _update_job(job, status=JOB_RUNNING, num_tracks=len(track_ids))
+            if not (spotify_obj := get_spotify_obj(db.session.get(User, job.email))):
+                _update_job(job, status=JOB_FAILED, error="Unable to authenticate to Spotify API")
+                return
+            results = add_tracks_to_playlist(
+                spotify_obj, job.playlist_id, track_ids, on_progress=lambda results: _record_results(job, results)
+            )
+            _record_results(job, results)
+            _update_job(job, status=JOB_DONE)
+            logger.info(f"playlist sync job {job_id} added {job.num_added} of {job.num_tracks} tracks")
+        except Exception:
+            logger.exception(f"playlist sync job {job_id} failed")
+            db.session.rollback()
+            _update_job(job, status=JOB_FAILED, error="Unexpected error syncing playlist")
+
+
+def playlist_sync_job_to_dict(job: PlaylistSyncJob) -> dict:
+    """
+    Converts a job to its API representation
+    """
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "num_tracks": job.num_tracks,
+        "num_added": job.num_added,
+        "num_duplicate": job.num_duplicate,
+        "num_failed": job.num_failed,
+        "error": job.error,
+    }
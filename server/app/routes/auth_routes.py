@@ -15,9 +15,11 @@ import tekore as tk
 
 from ..models import db, User, Auth
 from ..integrations.spotify import (
+    app_account_pool,
     get_spotify_obj,
     create_spotify_playlist,
     get_user_spotify_playlists,
+    user_token_cache,
 )
 from ..utils.logging_utils import logger
 
@@ -83,6 +85,7 @@ class AuthCallback(Resource):
         user.config_file = config_file_bytes
         db.session.delete(auth)
         db.session.commit()
+        app_account_pool.invalidate()
 
         spotify_obj = get_spotify_obj(user)
         playlists = get_user_spotify_playlists(spotify_obj)
@@ -104,6 +107,8 @@ class Unauthorize(Resource):
             return "account authorization not found", 400
         user.config_file = None
         db.session.commit()
+        user_token_cache.invalidate(email)
+        app_account_pool.invalidate()
         return 200
 
 
@@ -1,6 +1,7 @@
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, validate, validates_schema
 
-from ..utils.validator_utils import CommaDelimitedStringField
+from ..controller import SONG_SORTS, is_valid_song_sort_key
+from ..utils.validator_utils import CommaDelimitedStringField, CursorField
 
 
 class SignupSchema(Schema):
@@ -18,14 +19,51 @@ class LoginSchema(Schema):
     password = fields.Str(required=True)
 
 
-class TracksSchema(Schema):
-    song_id = fields.Str(data_key="song-id")
+class SongFiltersSchema(Schema):
     site_name = fields.Str(data_key="site-name")
     song_name = fields.Str(data_key="song-name")
     artists = CommaDelimitedStringField()
     genres = CommaDelimitedStringField()
-    limit = fields.Int()
-    offset = fields.Int()
+    date_from = fields.Date(data_key="date-from")
+    date_to = fields.Date(data_key="date-to")
+
+
+class TracksSchema(SongFiltersSchema):
+    song_id = fields.Str(data_key="song-id")
+    limit = fields.Int(validate=validate.Range(min=1, max=500))
+    offset = fields.Int(validate=validate.Range(min=0))
+    sort = fields.Str(validate=validate.OneOf(SONG_SORTS))
+    cursor = CursorField()
+    facets = fields.Bool()
+
+    @validates_schema
+    def validate_cursor(self, data, **kwargs):
+        if "cursor" not in data:
+            return
+        if "offset" in data:
+            raise ValidationError("A cursor can't be combined with an offset.", "cursor")
+        # a cursor starts with the sort order it was made for, followed by the sort key of the song it points after
+        sort = data.get("sort", "date")
+        if data["cursor"][0] != sort or not is_valid_song_sort_key(data["cursor"][1:], sort):
+            raise ValidationError("Invalid cursor.", "cursor")
+
+
+class SongSearchSchema(Schema):
+    query = fields.Str(required=True, validate=validate.Length(min=1, max=200))
+    limit = fields.Int(load_default=20, validate=validate.Range(min=1, max=100))
+
+
+class AutocompleteSchema(Schema):
+    prefix = fields.Str(required=True, validate=validate.Length(min=1, max=100))
+    limit = fields.Int(load_default=10, validate=validate.Range(min=1, max=50))
+
+
+class PlaylistSyncSchema(SongFiltersSchema):
+    pass
+
+
+class PlaylistSyncJobSchema(Schema):
+    job_id = fields.Int(required=True, data_key="job-id")
 
 
 class SpotifyTrackIdSchema(Schema):
@@ -45,6 +83,7 @@ class SearchSpotifyTracksSchema(Schema):
 
 class PitchforkTracksSchema(Schema):
     max_page_num = fields.Int(validate=validate.Range(min=1, max=257))
+    incremental = fields.Bool()
 
 
 class PersonalizationSchema(Schema):
@@ -1,6 +1,10 @@
-from flask import request, jsonify
+import json
+from dataclasses import asdict
+
+from flask import current_app, request, jsonify
 from flask_restful import Resource
 from marshmallow import ValidationError
+from sqlalchemy.orm import selectinload
 from flask_jwt_extended import (
     get_jwt_identity,
     jwt_required,
@@ -12,19 +16,43 @@ from .schemas import (
     PlaylistTracksSchema, 
     SearchSpotifyTracksSchema, 
     PitchforkTracksSchema, 
-    PersonalizationSchema
+    PersonalizationSchema,
+    PlaylistSyncSchema,
+    PlaylistSyncJobSchema,
+    SongSearchSchema,
+    AutocompleteSchema,
 )
-from ..models import db, Song, User
-from ..utils.api_utils import row_to_dict
-from ..controller import update_pitchfork_top_tracks_db
+from ..models import db, Song, User, PlaylistSyncJob
+from ..utils.api_utils import RowSerializer, dataclass_to_builtin, encode_cursor, row_to_dict
+from ..controller import count_song_facets, filter_songs, get_song_page, sort_songs, update_pitchfork_top_tracks_db
+from ..enrichment import LOOKUP_DONE, get_enrichment_progress
+from ..search_index import song_search_index
+from ..playlist_sync import start_playlist_sync, playlist_sync_job_to_dict
 from ..integrations.spotify import (
+    app_account_pool,
     get_spotify_obj,
     add_tracks_to_playlist,
     get_user_spotify_playlists,
+    playlist_membership_cache,
     search_spotify_tracks,
+    spotify_rate_limiter,
+    spotify_search_cache,
+    spotify_single_flight,
 )
 from ..utils.logging_utils import logger
 
+# every relationship serialized in a song listing is loaded with one extra query per relationship for the whole page,
+#   rather than one query per song
+SONG_LISTING_OPTIONS = (selectinload(Song.artists), selectinload(Song.genres))
+
+# song columns that are only used internally, for deduplication and the search index, and left out of responses
+SONG_INTERNAL_COLUMNS = ("fingerprint", "updated_at")
+
+song_serializer = RowSerializer(Song, exclude=SONG_INTERNAL_COLUMNS)
+
+# the number of songs on a page of a cursor paginated listing when no limit is given
+TRACKS_PAGE_SIZE = 50
+
 
 class Tracks(Resource):
     def get(self):
@@ -35,31 +63,83 @@ class Tracks(Resource):
             return err.messages, 400
 
         logger.info(f"received request to /tracks with params: {args}")
-        query = Song.query
+        query = Song.query.options(*SONG_LISTING_OPTIONS)
 
         if song_id := args.get("song_id"):
-            song = Song.query.get(song_id)
-            return jsonify(row_to_dict(song)) if song else jsonify([])
-
-        if site_name := args.get("site_name"):
-            query = query.filter(Song.site_name == site_name)
-
-        if song_name := args.get("song_name"):
-            query = query.filter(Song.name.icontains(song_name))
+            song = db.session.get(Song, song_id, options=SONG_LISTING_OPTIONS)
+            return jsonify(row_to_dict(song, SONG_INTERNAL_COLUMNS)) if song else jsonify([])
 
-        if artists := args.get("artists"):
-            for artist in artists:
-                query = query.filter(Song.artists.any(name=artist))
+        query = filter_songs(query, args)
 
-        if genres := args.get("genres"):
-            for genre in genres:
-                query = query.filter(Song.genres.any(name=genre))
+        # asking for a sort order, facets or passing a cursor returns a page of songs along with the cursor for the
+        #   next page, and the facet counts of every song matching the filters if they were asked for
+        if "sort" in args or "cursor" in args or args.get("facets"):
+            page = {}
+            # facets are counted first since their savepoint's rollback could expire the songs on the page
+            if args.get("facets"):
+                page["facets"] = count_song_facets(args)
+            sort = args.get("sort", "date")
+            after = args["cursor"][1:] if "cursor" in args else None
+            songs, next_key = get_song_page(query, sort, after, args.get("limit") or TRACKS_PAGE_SIZE)
+            page["next_cursor"] = encode_cursor([sort, *next_key]) if next_key else None
+            if current_app.debug or current_app.config.get("RESTFUL_JSON"):
+                return {"tracks": [row_to_dict(song, SONG_INTERNAL_COLUMNS) for song in songs], **page}, 200
+            fields = "".join(f", {json.dumps(key)}: {json.dumps(value)}" for key, value in page.items())
+            return current_app.response_class(
+                f'{{"tracks": {song_serializer.dumps_array(songs)}{fields}}}\n', mimetype="application/json"
+            )
 
+        query = sort_songs(query)
         if limit := args.get("limit"):
             query = query.limit(limit)
         if offset := args.get("offset"):
             query = query.offset(offset)
-        return [row_to_dict(song) for song in query.all()], 200
+        songs = query.all()
+        # flask-restful pretty prints in debug mode or when configured to, which only the generic path reproduces
+        if current_app.debug or current_app.config.get("RESTFUL_JSON"):
+            return [row_to_dict(song, SONG_INTERNAL_COLUMNS) for song in songs], 200
+        return current_app.response_class(song_serializer.dumps_list(songs), mimetype="application/json")
+
+
+def _search_index_is_ready() -> bool:
+    # the index is normally built when the worker starts, this covers workers started some other way
+    if song_search_index.is_loaded:
+        song_search_index.refresh_if_stale()
+        return True
+    song_search_index.start_loading(current_app._get_current_object())
+    return False
+
+
+class SongSearch(Resource):
+    def get(self):
+        schema = SongSearchSchema()
+        try:
+            args = schema.load(request.args)
+        except ValidationError as err:
+            return err.messages, 400
+        if not _search_index_is_ready():
+            return "search index is loading", 503
+
+        song_ids = song_search_index.search(args["query"], args["limit"])
+        songs_by_id = {
+            song.id: song for song in Song.query.options(*SONG_LISTING_OPTIONS).filter(Song.id.in_(song_ids))
+        }
+        songs = [songs_by_id[song_id] for song_id in song_ids if song_id in songs_by_id]
+        if current_app.debug or current_app.config.get("RESTFUL_JSON"):
+            return [row_to_dict(song, SONG_INTERNAL_COLUMNS) for song in songs], 200
+        return current_app.response_class(song_serializer.dumps_list(songs), mimetype="application/json")
+
+
+class Autocomplete(Resource):
+    def get(self):
+        schema = AutocompleteSchema()
+        try:
+            args = schema.load(request.args)
+        except ValidationError as err:
+            return err.messages, 400
+        if not _search_index_is_ready():
+            return "search index is loading", 503
+        return song_search_index.autocomplete(args["prefix"], args["limit"]), 200
 
 
 class SpotifyTrackId(Resource):
@@ -75,7 +155,8 @@ class SpotifyTrackId(Resource):
         spotify_obj = get_spotify_obj()
         if not spotify_obj:
             return "Unable to authenticate to Spotify API", 500
-        tracks = search_spotify_tracks(spotify_obj, song.name, song.artists[0].name)
+        if not (tracks := search_spotify_tracks(spotify_obj, song.name, song.artists[0].name)):
+            return "Unable to execute search through Spotify API", 500
         preview_url = next((track.preview_url for track in tracks.items if track.id == req["spotify_track_id"]), None)
         # if preview_url is not assigned, none of the track IDs in the search results matched
         if not preview_url:
@@ -83,6 +164,7 @@ class SpotifyTrackId(Resource):
             return "invalid spotify track ID", 400
         song.spotify_track_id = req["spotify_track_id"]
         song.preview_url = preview_url
+        song.spotify_lookup_status = LOOKUP_DONE
         db.session.commit()
         return (
             f"The Spotify Track ID for {song.name} with Song ID: {song.id} has been updated.",
@@ -115,6 +197,37 @@ class PlaylistTracks(Resource):
         return jsonify(results)
 
 
+class PlaylistSync(Resource):
+    @jwt_required()
+    def post(self):
+        schema = PlaylistSyncSchema()
+        try:
+            filters = schema.load(request.get_json(silent=True) or {})
+        except ValidationError as err:
+            return err.messages, 400
+        email = get_jwt_identity()
+        user = User.query.get(email)
+        if not user.config_file:
+            return "account not authorized", 400
+        if not user.playlist_id:
+            return "no playlist found", 400
+        # the matching songs are added by a background job whose progress is reported by the get method
+        job = start_playlist_sync(user, filters)
+        return {"job_id": job.id}, 202
+
+    @jwt_required()
+    def get(self):
+        schema = PlaylistSyncJobSchema()
+        try:
+            req = schema.load(request.args)
+        except ValidationError as err:
+            return err.messages, 400
+        job = db.session.get(PlaylistSyncJob, req["job_id"])
+        if not job or job.email != get_jwt_identity():
+            return "job not found", 404
+        return playlist_sync_job_to_dict(job), 200
+
+
 class SearchSpotifyTracks(Resource):
     @jwt_required()
     def get(self):
@@ -127,8 +240,9 @@ class SearchSpotifyTracks(Resource):
         spotify_obj = get_spotify_obj()
         if not spotify_obj:
             return "Unable to execute search through Spotify API", 500
-        tracks = search_spotify_tracks(spotify_obj, req["song_name"], req["artists"].split(",")[0])
-        return jsonify(tracks)
+        if not (tracks := search_spotify_tracks(spotify_obj, req["song_name"], req["artists"].split(",")[0])):
+            return "Unable to execute search through Spotify API", 500
+        return jsonify(dataclass_to_builtin(tracks))
 
 
 class PitchforkTracks(Resource):
@@ -141,10 +255,35 @@ class PitchforkTracks(Resource):
             return err.message, 400
         if not (max_page_num := req.get("max_page_num")):
             max_page_num = 25
-        num_new_tracks = update_pitchfork_top_tracks_db(max_page_num=max_page_num)
+        # Spotify matching carries on after the response, its progress is reported by /api/spotify-enrichment
+        num_new_tracks = update_pitchfork_top_tracks_db(
+            max_page_num=max_page_num, incremental=req.get("incremental", False), wait_for_enrichment=False
+        )
         return {"num_new_tracks": num_new_tracks}, 200
 
 
+class SpotifyEnrichment(Resource):
+    @jwt_required()
+    def get(self):
+        return get_enrichment_progress(), 200
+
+
+class SpotifyStats(Resource):
+    @jwt_required()
+    def get(self):
+        return {
+            "search_cache": asdict(spotify_search_cache.get_stats()),
+            "account_pool": app_account_pool.get_stats(),
+            "single_flight": asdict(spotify_single_flight.get_stats()),
+            "playlist_cache": asdict(playlist_membership_cache.get_stats()),
+            "search_index": asdict(song_search_index.get_stats()),
+            "rate_limiter": {
+                **spotify_rate_limiter.get_budget(),
+                **asdict(spotify_rate_limiter.get_stats()),
+            },
+        }, 200
+
+
 class Personalization(Resource):
     @jwt_required()
     def get(self):
@@ -159,7 +298,7 @@ class Personalization(Resource):
         # limit = 50
         if req["personalization_type"] == "tracks":
             # return jsonify(spotify_obj.current_user_top_tracks(req["time_period"], limit=limit).items)
-            return jsonify(spotify_obj.current_user_top_tracks(req["time_period"]).items)
+            return jsonify(dataclass_to_builtin(spotify_obj.current_user_top_tracks(req["time_period"]).items))
         else:
             # return jsonify(spotify_obj.current_user_top_artists(req["time_period"], limit=limit).items)
-            return jsonify(spotify_obj.current_user_top_artists(req["time_period"]).items)
+            return jsonify(dataclass_to_builtin(spotify_obj.current_user_top_artists(req["time_period"]).items))
@@ -0,0 +1,488 @@
+import heapq
+import os
+import re
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from dataclasses import dataclass
+from itertools import islice
+from threading import Lock, Thread
+from typing import Iterable
+
+from flask import Flask
+from sqlalchemy import func, select, true
+
+from .models import db, track_artists_table, track_genres_table, Song
+from .utils.logging_utils import logger
+
+# how often a worker's index picks up songs saved by other processes, in seconds
+SEARCH_INDEX_REFRESH_INTERVAL = float(os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", "60"))
+# how far before the latest change it has seen a refresh looks for changed songs again, in seconds - songs are stamped
+#   before their transaction commits, so one that commits late, or was stamped by a host whose clock is behind, can
+#   become visible after songs stamped later than it
+SEARCH_INDEX_REFRESH_OVERLAP = float(os.getenv("SEARCH_INDEX_REFRESH_OVERLAP", "300"))
+# the lowest trigram similarity between a query word and an indexed word for them to match, which allows roughly one
+#   typo in a word of five or more letters
+SEARCH_MIN_WORD_SIMILARITY = float(os.getenv("SEARCH_MIN_WORD_SIMILARITY", "0.5"))
+
+# how much matching a song's artists or genres counts towards its score, relative to matching its name
+ARTIST_WEIGHT = 0.8
+GENRE_WEIGHT = 0.5
+# the most indexed words a misspelled query word can match
+MAX_WORD_MATCHES = 10
+# words in more than this share of song names or artists, like "the", only rank songs that matched some other word
+STOP_WORD_FRACTION = 0.02
+# a query made only of such common words is matched against this many of the newest songs containing them
+STOP_WORD_SONG_LIMIT = 2000
+# the most names an autocomplete looks at before ranking them by number of songs
+AUTOCOMPLETE_SCAN_LIMIT = 500
+# the index is rebuilt once more than this share of the songs in it are replaced or deleted versions
+MAX_REMOVED_FRACTION = 0.25
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercases text and reduces it to its words separated by single spaces
+    """
+    return " ".join(re.findall(r"\w+", unicodedata.normalize("NFKC", text).casefold()))
+
+
+def trigrams(word: str) -> set[str]:
+    """
+    Splits a normalized word into trigrams, padded like postgres' pg_trgm does so short words still have some
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Completions:
+    """
+    Counts the songs with each of a set of names, like artists or genres, and finds the names with a word starting
+        with a prefix
+    """
+
+    def __init__(self):
+        self.num_songs: Counter[str] = Counter()
+        # the normalized name and every suffix of it starting at a word, sorted so prefixes can be found by bisection,
+        #   which are kept for names that no longer have any songs in case they're added again
+        self._completions: list[tuple[str, str]] = []
+        self._completed_names: set[str] = set()
+
+    def add(self, name: str, keep_sorted: bool = True) -> None:
+        self.num_songs[name] += 1
+        if name in self._completed_names:
+            return
+        self._completed_names.add(name)
+        words = normalize(name).split()
+        for i in range(len(words)):
+            if keep_sorted:
+                insort(self._completions, (" ".join(words[i:]), name))
+            else:
+                self._completions.append((" ".join(words[i:]), name))
+
+    def remove(self, name: str) -> None:
+        self.num_songs[name] -= 1
+        if not self.num_songs[name]:
+            del self.num_songs[name]
+
+    def sort(self) -> None:
+        self._completions.sort()
+
+    def complete(self, prefix: str, limit: int) -> list[dict]:
+        if not (prefix := normalize(prefix)):
+            return []
+        names = set()
+        i = bisect_left(self._completions, (prefix,))
+        while i < len(self._completions) and len(names) < AUTOCOMPLETE_SCAN_LIMIT:
+            completion, name = self._completions[i]
+            if not completion.startswith(prefix):
+                break
+            if name in self.num_songs:
+                names.add(name)
+            i += 1
+        ranked = sorted(names, key=lambda name: (-self.num_songs[name], name))[:limit]
+        return [{"name": name, "num_songs": self.num_songs[name]} for name in ranked]
+
+
+@dataclass
+class SearchIndexStats:
+    """
+    Represents the size and state of a SongSearchIndex
+
+    Attributes:
+        loaded (bool): Whether the index has been built
+        num_songs (int): Number of songs indexed
+        num_words (int): Number of distinct words in song names, artists and genres
+        num_artists (int): Number of distinct artists indexed
+        num_genres (int): Number of distinct genres indexed
+        refreshed_at (float): When songs saved or changed since the index was built were last picked up
+    """
+    loaded: bool
+    num_songs: int
+    num_words: int
+    num_artists: int
+    num_genres: int
+    refreshed_at: float
+
+
+class SongSearchIndex:
+    """
+    Per-process search index over song names, artists and genres
+
+    Each query word is matched to the indexed words it shares enough trigrams with, so misspelled words still match,
+        and songs are ranked by how well their name, artists and genres cover the query. Only the vocabulary of
+        distinct words is matched by trigram, which keeps queries to a few milliseconds on large catalogs. The index
+        is built from the database once and then refreshed with the songs stamped as saved or changed since the
+        latest change it has seen, less an overlap for transactions that committed late. A changed song is added
+        again and its old version removed, and deleted songs are removed once the database has fewer songs than the
+        index. The index is rebuilt once removed versions make up too much of it.
+
+    Memory use is about 35MB per 100k songs, peaking around 100MB while the index is built
+    """
+
+    def __init__(self):
+        self.is_loaded = False
+        self._load_started = False
+        self._lock = Lock()
+        self._refresh_lock = Lock()
+        self._max_updated_at = 0.0
+        self._refreshed_at = 0.0
+        # songs are numbered in the order they're added, and each numbered song's details are kept at its number
+        self._song_ids = array("I")
+        self._song_updated_at = array("d")
+        self._name_num_words = array("B")
+        self._song_artists: list[tuple[str, ...]] = []
+        self._song_genres: list[tuple[str, ...]] = []
+        # the number of each song's current version, and the numbers of versions that were replaced or deleted, which
+        #   are left in the word lists and skipped when searching
+        self._doc_by_song_id: dict[int, int] = {}
+        self._removed_docs: set[int] = set()
+        # the songs whose name contains each word, and the artists whose name does
+        self._name_word_docs: dict[str, array] = {}
+        self._artist_word_artists: dict[str, list[str]] = {}
+        self._artist_docs: dict[str, array] = {}
+        self._artist_num_words: dict[str, int] = {}
+        self._genre_docs: dict[str, array] = {}
+        self._genre_words: dict[str, tuple[str, ...]] = {}
+        # every distinct word, and the words containing each trigram
+        self._word_num_grams: dict[str, int] = {}
+        self._word_postings: dict[str, list[str]] = {}
+        self._artists = _Completions()
+        self._genres = _Completions()
+
+    def _add_word(self, word: str) -> None:
+        if word in self._word_num_grams:
+            return
+        grams = trigrams(word)
+        self._word_num_grams[word] = len(grams)
+        for gram in grams:
+            self._word_postings.setdefault(gram, []).append(word)
+
+    def _add_song(
+        self, song_id: int, name: str, artists: list[str], genres: list[str], updated_at: float, keep_sorted: bool
+    ) -> None:
+        if (old_doc := self._doc_by_song_id.get(song_id)) is not None:
+            self._remove_doc(old_doc)
+        doc = len(self._song_ids)
+        self._doc_by_song_id[song_id] = doc
+        self._song_ids.append(song_id)
+        self._song_updated_at.append(updated_at)
+        name_words = normalize(name).split()
+        self._name_num_words.append(min(len(name_words), 255))
+        for word in set(name_words):
+            if (docs := self._name_word_docs.get(word)) is None:
+                self._add_word(word)
+                docs = self._name_word_docs[word] = array("I")
+            docs.append(doc)
+        for artist in artists:
+            if (docs := self._artist_docs.get(artist)) is None:
+                docs = self._artist_docs[artist] = array("I")
+                artist_words = normalize(artist).split()
+                self._artist_num_words[artist] = len(artist_words)
+                for word in set(artist_words):
+                    self._add_word(word)
+                    self._artist_word_artists.setdefault(word, []).append(artist)
+            docs.append(doc)
+            self._artists.add(artist, keep_sorted)
+        self._song_artists.append(tuple(artists))
+        self._song_genres.append(tuple(genres))
+        for genre in genres:
+            if (docs := self._genre_docs.get(genre)) is None:
+                docs = self._genre_docs[genre] = array("I")
+                # a genre without any words, like "-", can't match a query
+                if genre_words := tuple(normalize(genre).split()):
+                    self._genre_words[genre] = genre_words
+                    for word in genre_words:
+                        self._add_word(word)
+            docs.append(doc)
+            self._genres.add(genre, keep_sorted)
+
+    def _remove_doc(self, doc: int) -> None:
+        self._removed_docs.add(doc)
+        if self._doc_by_song_id.get(self._song_ids[doc]) == doc:
+            del self._doc_by_song_id[self._song_ids[doc]]
+        for artist in self._song_artists[doc]:
+            self._artists.remove(artist)
+        for genre in self._song_genres[doc]:
+            self._genres.remove(genre)
+
+    def _is_indexed(self, song_id: int, updated_at: float) -> bool:
+        doc = self._doc_by_song_id.get(song_id)
+        return doc is not None and self._song_updated_at[doc] == updated_at
+
+    def refresh(self) -> int:
+        """
+        Adds the songs saved or changed since the index was last built or refreshed and removes deleted songs,
+            building the index if it hasn't been
+
+        Returns:
+            int: the number of songs added
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        if self.is_loaded and len(self._removed_docs) > MAX_REMOVED_FRACTION * len(self._song_ids):
+            return self._rebuild()
+        is_build = not self.is_loaded
+        song_filter = true() if is_build else Song.updated_at >= self._max_updated_at - SEARCH_INDEX_REFRESH_OVERLAP
+        # the songs re-read from the overlap that haven't changed since they were added are skipped
+        songs = [
+            song
+            for song in db.session.execute(
+                select(Song.id, Song.name, Song.updated_at).where(song_filter).order_by(Song.id)
+            )
+            if not self._is_indexed(song.id, song.updated_at or 0.0)
+        ]
+        # a song changed after it was read is read again by the next refresh, since it's stamped later
+        artists_by_song_id: dict[int, list[str]] = {}
+        genres_by_song_id: dict[int, list[str]] = {}
+        if songs:
+            for table, column, names_by_song_id in (
+                (track_artists_table, track_artists_table.c.artist_name, artists_by_song_id),
+                (track_genres_table, track_genres_table.c.genre_name, genres_by_song_id),
+            ):
+                query = select(table.c.song_id, column)
+                if not is_build:
+                    query = query.where(table.c.song_id.in_(select(Song.id).where(song_filter)))
+                for song_id, name in db.session.execute(query):
+                    names_by_song_id.setdefault(song_id, []).append(name)
+        # songs are only looked for one by one when the database has fewer than the index will, which songs saved
+        #   after they were read can hide until the next refresh has added them
+        deleted_song_ids = set()
+        if not is_build:
+            num_indexed_songs = len(self._doc_by_song_id.keys() | {song.id for song in songs})
+            if db.session.scalar(select(func.count()).select_from(Song)) < num_indexed_songs:
+                deleted_song_ids = self._doc_by_song_id.keys() - set(db.session.scalars(select(Song.id)))
+
+        with self._lock:
+            for song_id, name, updated_at in songs:
+                self._add_song(
+                    song_id,
+                    name,
+                    artists_by_song_id.get(song_id, []),
+                    genres_by_song_id.get(song_id, []),
+                    updated_at or 0.0,
+                    # completions are sorted once at the end of a build rather than kept sorted per song
+                    keep_sorted=not is_build,
+                )
+                self._max_updated_at = max(self._max_updated_at, updated_at or 0.0)
+            for song_id in deleted_song_ids:
+                if (doc := self._doc_by_song_id.get(song_id)) is not None:
+                    self._remove_doc(doc)
+            if is_build:
+                self._artists.sort()
+                self._genres.sort()
+            self._refreshed_at = time.time()
+            self.is_loaded = True
+        return len(songs)
+
+    def _rebuild(self) -> int:
+        # built off to the side so searches carry on against the current index in the meantime
+        rebuilt = SongSearchIndex()
+        num_songs = rebuilt._refresh()
+        with self._lock:
+            for attribute, value in vars(rebuilt).items():
+                if attribute not in ("_lock", "_refresh_lock", "_load_started"):
+                    setattr(self, attribute, value)
+        return num_songs
+
+    def refresh_if_stale(self) -> None:
+        """
+        Picks up songs saved, changed or deleted by other processes if the index hasn't been refreshed recently
+        """
+        # only one caller refreshes, the rest carry on with the index as it is
+        if not self.is_loaded or not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if time.time() - self._refreshed_at > SEARCH_INDEX_REFRESH_INTERVAL:
+                self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def start_loading(self, app: Flask) -> None:
+        """
+        Builds the index in the background, unless it's already being built
+        """
+        with self._lock:
+            if self._load_started:
+                return
+            self._load_started = True
+        Thread(target=self._load, args=(app,), daemon=True).start()
+
+    def _load(self, app: Flask) -> None:
+        start_time = time.perf_counter()
+        with app.app_context():
+            try:
+                num_songs = self.refresh()
+            except Exception:
+                logger.exception("failed to build the song search index")
+                with self._lock:
+                    self._load_started = False
+                return
+        logger.info(f"built the song search index of {num_songs} songs in {time.perf_counter() - start_time:.1f}s")
+
+    def _match_word(self, query_word: str) -> dict[str, float]:
+        # the indexed words most similar to a query word, by the dice coefficient of their trigrams, each weighted by
+        #   the square of its similarity so exact matches count well above near misses
+        query_grams = trigrams(query_word)
+        shared = Counter()
+        for gram in query_grams:
+            if words := self._word_postings.get(gram):
+                shared.update(words)
+        matches = []
+        for word, num_shared in shared.items():
+            similarity = 2 * num_shared / (len(query_grams) + self._word_num_grams[word])
+            if similarity >= SEARCH_MIN_WORD_SIMILARITY:
+                matches.append((word, similarity * similarity))
+        return dict(heapq.nlargest(MAX_WORD_MATCHES, matches, key=lambda match: match[1]))
+
+    @staticmethod
+    def _sum_best_matches(
+        word_items: dict[str, list | array], word_matches: list[dict[str, float]], stop_size: int, stop_limit: int
+    ) -> dict:
+        # sums, for each item, the weight of the best match of each query word among the words the item contains
+        has_rare_word = any(
+            0 < len(word_items.get(word, ())) <= stop_size for matches in word_matches for word in matches
+        )
+        totals = {}
+        for matches in word_matches:
+            best = {}
+            for word, weight in matches.items():
+                if (items := word_items.get(word)) is None:
+                    continue
+                if len(items) > stop_size:
+                    if has_rare_word:
+                        continue
+                    items = items[-stop_limit:]
+                for item in items:
+                    if weight > best.get(item, 0.0):
+                        best[item] = weight
+            for item, weight in best.items():
+                totals[item] = totals.get(item, 0.0) + weight
+        return totals
+
+    def search(self, query: str, limit: int = 20) -> list[int]:
+        """
+        Finds the songs whose name, artists or genres best match a query
+
+        A name's score is the dice coefficient of the query's words and the name's words, counting a misspelled match
+            by the square of its similarity. A song's score is its name's score plus the weighted scores of its best
+            matching artist and genre. Genres only rank songs that matched by name or artist, unless none did, in
+            which case the newest songs of the best matching genre are returned
+
+        Args:
+            query (str): The text to search for
+            limit (int): The maximum number of songs to return
+
+        Returns:
+            list[int]: the IDs of the best matching songs, best first
+        """
+        if not (query_words := list(dict.fromkeys(normalize(query).split()))):
+            return []
+        num_query_words = len(query_words)
+        with self._lock:
+            word_matches = [self._match_word(word) for word in query_words]
+
+            stop_docs = max(STOP_WORD_SONG_LIMIT, int(STOP_WORD_FRACTION * len(self._song_ids)))
+            name_totals = self._sum_best_matches(self._name_word_docs, word_matches, stop_docs, STOP_WORD_SONG_LIMIT)
+            scores = {
+                doc: 2 * total / (num_query_words + self._name_num_words[doc]) for doc, total in name_totals.items()
+            }
+
+            # a song scores as well as its best matching artist
+            stop_artists = max(STOP_WORD_SONG_LIMIT, int(STOP_WORD_FRACTION * len(self._artist_docs)))
+            artist_totals = self._sum_best_matches(
+                self._artist_word_artists, word_matches, stop_artists, STOP_WORD_SONG_LIMIT
+            )
+            artist_scores: dict[int, float] = {}
+            for artist, total in artist_totals.items():
+                score = ARTIST_WEIGHT * 2 * total / (num_query_words + self._artist_num_words[artist])
+                for doc in self._artist_docs[artist]:
+                    if score > artist_scores.get(doc, 0.0):
+                        artist_scores[doc] = score
+            for doc, score in artist_scores.items():
+                scores[doc] = scores.get(doc, 0.0) + score
+            for doc in scores.keys() & self._removed_docs:
+                del scores[doc]
+
+            genre_scores = {}
+            for genre, genre_words in self._genre_words.items():
+                # genres whose songs were all replaced or deleted are kept with no songs
+                if genre not in self._genres.num_songs:
+                    continue
+                if total := sum(max([matches.get(word, 0.0) for word in genre_words]) for matches in word_matches):
+                    genre_scores[genre] = 2 * total / (num_query_words + len(genre_words))
+            if genre_scores and not scores:
+                genre = max(genre_scores, key=genre_scores.get)
+                docs = (doc for doc in reversed(self._genre_docs[genre]) if doc not in self._removed_docs)
+                return [self._song_ids[doc] for doc in islice(docs, limit)]
+            if genre_scores:
+                for doc in scores:
+                    if genres := self._song_genres[doc]:
+                        scores[doc] += GENRE_WEIGHT * max(genre_scores.get(genre, 0.0) for genre in genres)
+
+            # ties go to the most recently added song
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [self._song_ids[doc] for doc, _ in best]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> dict[str, list[dict]]:
+        """
+        Finds the artists and genres with a word starting with a prefix
+
+        Args:
+            prefix (str): The start of a word in an artist or genre
+            limit (int): The maximum number of artists and of genres to return
+
+        Returns:
+            dict[str, list[dict]]: the matching artists and genres with their number of songs, most songs first
+        """
+        with self._lock:
+            return {"artists": self._artists.complete(prefix, limit), "genres": self._genres.complete(prefix, limit)}
+
+    def get_stats(self) -> SearchIndexStats:
+        """
+        Returns the size of the index
+        """
+        with self._lock:
+            return SearchIndexStats(
+                loaded=self.is_loaded,
+                num_songs=len(self._doc_by_song_id),
+                num_words=len(self._word_num_grams),
+                num_artists=len(self._artists.num_songs),
+                num_genres=len(self._genres.num_songs),
+                refreshed_at=self._refreshed_at,
+            )
+
+
+song_search_index = SongSearchIndex()
+
+
+def refresh_song_search_index(song_ids: Iterable[int]) -> None:
+    """
+    Adds newly saved or changed songs to this process' search index if it has been built
+    """
+    if song_ids and song_search_index.is_loaded:
+        song_search_index.refresh()
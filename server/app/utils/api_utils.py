@@ -1,16 +1,145 @@
+import base64
+import dataclasses
+import json
 from datetime import date
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Iterable
 
+from sqlalchemy import inspect
 
-def row_to_dict(row):
+
+def _row_value(val):
+    if val and type(val) not in (str, int, float, date):
+        return [val.name for val in val]
+    elif val and type(val) is date:
+        return val.strftime("%Y-%m-%d")
+    return val
+
+
+def row_to_dict(row, exclude: Iterable[str] = ()):
     row_dict = {}
     for key in row.__dict__:
-        if key == "_sa_instance_state":
+        if key == "_sa_instance_state" or key in exclude:
             continue
-        val = row.__dict__[key]
-        if val and type(val) not in (str, int, date):
-            row_dict[key] = [val.name for val in row.__dict__[key]]
-        elif val and type(val) is date:
-            row_dict[key] = val.strftime("%Y-%m-%d")
-        else:
-            row_dict[key] = val
+        row_dict[key] = _row_value(row.__dict__[key])
     return row_dict
+
+
+# field encoders produce the same text json.dumps does for the values row_to_dict would return
+
+
+def _encode_any(val) -> str:
+    return json.dumps(_row_value(val))
+
+
+def _encode_str(val: str | None) -> str:
+    return "null" if val is None else encode_basestring_ascii(val)
+
+
+def _encode_int(val: int | None) -> str:
+    return "null" if val is None else int.__repr__(val)
+
+
+def _encode_float(val: float | None) -> str:
+    return "null" if val is None else float.__repr__(val)
+
+
+def _encode_date(val: date | None) -> str:
+    return "null" if val is None else f'"{val.strftime("%Y-%m-%d")}"'
+
+
+def _encode_names(val: Iterable) -> str:
+    return "[" + ", ".join([encode_basestring_ascii(item.name) for item in val]) + "]"
+
+
+_COLUMN_ENCODERS = {str: _encode_str, int: _encode_int, float: _encode_float, date: _encode_date}
+
+
+class RowSerializer:
+    """
+    Serializes rows of a model to JSON with field encoders chosen once from the model's column types
+
+    The output is byte for byte what json.dumps produces for row_to_dict(row, exclude) with its default settings,
+        without building the intermediate dicts. A row's fields are serialized in the order they appear in
+        row.__dict__, so the encoders are compiled once for each distinct field order
+    """
+
+    def __init__(self, model, exclude: Iterable[str] = ()):
+        # columns kept out of the output, like internal bookkeeping that isn't part of the API
+        self.exclude = frozenset(exclude)
+        mapper = inspect(model)
+        self._encoders: dict[str, Callable[[Any], str]] = {}
+        for column_attr in mapper.column_attrs:
+            try:
+                python_type = column_attr.columns[0].type.python_type
+            except NotImplementedError:
+                python_type = None
+            self._encoders[column_attr.key] = _COLUMN_ENCODERS.get(python_type, _encode_any)
+        for relationship in mapper.relationships:
+            if relationship.uselist:
+                self._encoders[relationship.key] = _encode_names
+        self._compiled: dict[tuple[str, ...], tuple[tuple[str, str, Callable[[Any], str]], ...]] = {}
+
+    def _compile(self, keys: tuple[str, ...]) -> tuple[tuple[str, str, Callable[[Any], str]], ...]:
+        return tuple(
+            (key, f"{encode_basestring_ascii(key)}: ", self._encoders.get(key, _encode_any))
+            for key in keys
+            if key != "_sa_instance_state" and key not in self.exclude
+        )
+
+    def dumps(self, row) -> str:
+        """
+        Serializes a row to a JSON object
+        """
+        values = row.__dict__
+        keys = tuple(values)
+        if (fields := self._compiled.get(keys)) is None:
+            fields = self._compiled[keys] = self._compile(keys)
+        return "{" + ", ".join([prefix + encode(values[key]) for key, prefix, encode in fields]) + "}"
+
+    def dumps_array(self, rows: Iterable) -> str:
+        """
+        Serializes rows to a JSON array
+        """
+        return "[" + ", ".join([self.dumps(row) for row in rows]) + "]"
+
+    def dumps_list(self, rows: Iterable) -> bytes:
+        """
+        Serializes rows to a JSON array, formatted like a list of rows returned from a flask-restful resource
+
+        Returns:
+            bytes: the UTF-8 encoded array followed by a newline
+        """
+        return (self.dumps_array(rows) + "\n").encode()
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Encodes the JSON serializable values that locate a position in a listing as an opaque, URL safe pagination cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode()
+
+
+def _dataclass_fields(cls) -> tuple[str, ...]:
+    if (names := _DATACLASS_FIELDS.get(cls)) is None:
+        names = _DATACLASS_FIELDS[cls] = tuple(field.name for field in dataclasses.fields(cls))
+    return names
+
+
+_DATACLASS_FIELDS: dict[type, tuple[str, ...]] = {}
+
+
+def dataclass_to_builtin(obj):
+    """
+    Converts nested dataclasses, like tekore's models, to dicts and lists
+
+    Gives the same result as the dataclasses.asdict call jsonify makes for each dataclass, but without asdict's
+        deep copy of every leaf value, so jsonify's output is unchanged
+    """
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {name: dataclass_to_builtin(getattr(obj, name)) for name in _dataclass_fields(type(obj))}
+    if isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+        return [dataclass_to_builtin(val) for val in obj]
+    if isinstance(obj, dict):
+        return {key: dataclass_to_builtin(val) for key, val in obj.items()}
+    return obj
@@ -1,6 +1,26 @@
+import base64
+import binascii
+import json
+
+from marshmallow import ValidationError
 from marshmallow.fields import Field
 
 
 class CommaDelimitedStringField(Field):
     def _deserialize(self, value, attr, data, **kwargs):
         return value.split(",")
+
+
+class CursorField(Field):
+    """
+    Decodes a pagination cursor made by api_utils.encode_cursor back into the list of values it was made from
+    """
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(value.encode()))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise ValidationError("Invalid cursor.")
+        if not isinstance(values, list) or not values:
+            raise ValidationError("Invalid cursor.")
+        return values
@@ -0,0 +1,127 @@
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# the benchmarks import the app package from the server directory, whichever directory they're run from
+SERVER_DIR = os.path.abspath(os.path.join(__file__, "../.."))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+PITCHFORK_GENRES = (
+    "Electronic",
+    "Experimental",
+    "Folk/Country",
+    "Global",
+    "Jazz",
+    "Metal",
+    "Pop/R&B",
+    "Rap",
+    "Rock",
+)
+TRACKS_PER_PAGE = 24
+
+
+def configure_environment(database_url: str | None = None) -> str:
+    """
+    Sets the environment variables the app reads when it's imported, pointing its database and local stores at a
+        scratch directory unless they're already set
+
+    Args:
+        database_url (str | None): The database to benchmark against - a new sqlite database if None
+
+    Returns:
+        str: the scratch directory
+    """
+    scratch_dir = tempfile.mkdtemp(prefix="top-tracks-hub-benchmark-")
+    os.environ["POSTGRES_CONNECTION_STRING"] = database_url or f"sqlite:///{os.path.join(scratch_dir, 'db.sqlite')}"
+    defaults = {
+        "JWT_COOKIE_SECURE": "false",
+        "JWT_COOKIE_CSRF_PROTECT": "false",
+        "JWT_SECRET_KEY": "benchmark",
+        "SECRET_KEY": "benchmark",
+        "PORT": "5001",
+        "SPOTIFY_RATE_LIMIT_DB": os.path.join(scratch_dir, "rate-limit.sqlite"),
+        "HTML_ARCHIVE_DIR": os.path.join(scratch_dir, "html-archive"),
+        "HTTP_CACHE_DIR": os.path.join(scratch_dir, "http-cache"),
+    }
+    for var, value in defaults.items():
+        os.environ.setdefault(var, value)
+    return scratch_dir
+
+
+def generate_track_pages(num_tracks: int, seed: int = 0) -> list[tuple[int, list]]:
+    """
+    Generates pages of tracks shaped like Pitchfork's, newest first, with artists recurring across tracks
+
+    Args:
+        num_tracks (int): The total number of tracks
+        seed (int): Seeds the generator so runs are reproducible
+
+    Returns:
+        list[tuple[int, list[Track]]]: the page numbers and their tracks, as stream_top_tracks yields them
+    """
+    from app.integrations.scrape_top_tracks import Track
+
+    rng = random.Random(seed)
+    artists = [f"Artist {i}" for i in range(max(1, num_tracks // 3))]
+    published = date(2023, 9, 1)
+    pages = []
+    for start in range(0, num_tracks, TRACKS_PER_PAGE):
+        tracks = []
+        for i in range(start, min(start + TRACKS_PER_PAGE, num_tracks)):
+            published -= timedelta(days=rng.random() < 0.3)
+            tracks.append(
+                Track(
+                    artists=sorted(rng.sample(artists, 2 if rng.random() < 0.2 else 1)),
+                    track_name=f"Track {i} {rng.choice(('Blue', 'Night', 'Drive', 'Glass', 'Summer'))}",
+                    genres=rng.sample(PITCHFORK_GENRES, 1 + (rng.random() < 0.3)),
+                    link=f"/reviews/tracks/track-{i}/",
+                    date_published=published,
+                )
+            )
+        pages.append((len(pages) + 1, tracks))
+    return pages
+
+
+def create_catalog(app, num_tracks: int, batch_size: int = 1000) -> None:
+    """
+    Creates the app's tables and saves generated tracks into them, see generate_track_pages
+
+    Args:
+        app (Flask): The app whose database the tracks are saved in
+        num_tracks (int): The number of tracks to save
+        batch_size (int): The number of tracks saved per transaction
+    """
+    from app.controller import save_new_recommendations_site, save_streamed_tracks
+    from app.models import db, Site
+
+    with app.app_context():
+        db.create_all()
+        save_new_recommendations_site("Pitchfork")
+        save_streamed_tracks(generate_track_pages(num_tracks), db.session.get(Site, "Pitchfork"), batch_size)
+
+
+def drop_catalog(app) -> None:
+    """
+    Drops the tables create_catalog created
+    """
+    from app.models import db
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def best_time(fnx, rounds: int) -> float:
+    """
+    Times a function, returning its fastest run in seconds, which is the least disturbed by the rest of the machine
+    """
+    timings = []
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        fnx()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
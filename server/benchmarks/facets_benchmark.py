@@ -0,0 +1,59 @@
+"""
+Measures how long counting the facets of /api/tracks takes on a large catalog, next to the time postgres is allowed to
+spend on the count before it's cancelled (TRACKS_FACETS_TIMEOUT_MS)
+
+The facets are counted with count_song_facets, the statement the tracks endpoint runs when it's asked for facets,
+for a range of filters from none, where every song is counted, to narrow ones. Run from the server directory:
+
+    python benchmarks/facets_benchmark.py --tracks 100000
+
+--database-url benchmarks another database, e.g. a scratch postgres database - its tables are created and dropped
+"""
+import argparse
+from datetime import date
+
+from common import best_time, configure_environment, create_catalog, drop_catalog
+
+FILTERS = (
+    ("no filters", {}),
+    ("a genre", {"genres": ["Jazz"]}),
+    ("two genres", {"genres": ["Rock", "Pop/R&B"]}),
+    ("an artist", {"artists": ["Artist 1"]}),
+    ("a song name", {"song_name": "night"}),
+    ("a year", {"date_from": date(2022, 1, 1), "date_to": date(2022, 12, 31)}),
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=100000, help="number of songs in the catalog")
+    parser.add_argument("--rounds", type=int, default=5, help="times the facets are counted, the fastest is kept")
+    parser.add_argument("--database-url", help="database to benchmark against, a new sqlite database by default")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    from sqlalchemy import func, select
+
+    from app.controller import FACETS_TIMEOUT_MS, count_song_facets, filter_songs
+    from app.models import db, Song
+    # the app with its routes registered
+    from run import app
+
+    create_catalog(app, args.tracks)
+    try:
+        with app.app_context():
+            print(f"counting facets of {args.tracks} songs, with a budget of {FACETS_TIMEOUT_MS}ms on postgres")
+            print(f"{'filters':<16}{'matching songs':>16}{'ms':>10}")
+            for name, filters in FILTERS:
+                num_songs = db.session.scalar(filter_songs(select(func.count(Song.id)), filters))
+                if count_song_facets(filters) is None:
+                    print(f"{name:<16}{num_songs:>16}{'timed out':>10}")
+                    continue
+                elapsed = best_time(lambda: count_song_facets(filters), args.rounds)
+                print(f"{name:<16}{num_songs:>16}{elapsed * 1000:>10.1f}")
+    finally:
+        drop_catalog(app)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compares the throughput of saving scraped tracks one at a time, as update_pitchfork_top_tracks_db did before ingest
+was batched, with the batched save path it uses now
+
+Each path saves the same generated tracks into an empty database, then saves them again to measure a run in which
+every track is already known. Run from the server directory:
+
+    python benchmarks/ingest_benchmark.py --tracks 5000
+
+--database-url benchmarks another database, e.g. a scratch postgres database - its tables are created and dropped
+"""
+import argparse
+import time
+
+from common import configure_environment, generate_track_pages
+
+
+def save_track_unbatched(track, site: str) -> int | None:
+    # the save path before ingest was batched: a query per track to check whether it's known, and a query and commit
+    #   for every new artist, genre and song
+    from sqlalchemy import func
+
+    from app.models import db, Artist, Genre, Song
+
+    query = Song.query.filter(Song.name == track.track_name, Song.site_name == site)
+    for artist in track.artists:
+        query = query.filter(Song.artists.any(name=artist))
+    for genre in track.genres:
+        query = query.filter(Song.genres.any(name=genre))
+    if query.all():
+        return None
+    for model, names in ((Artist, track.artists), (Genre, track.genres)):
+        for name in names:
+            if not db.session.get(model, name):
+                db.session.add(model(name=name))
+                db.session.commit()
+    song = Song(
+        id=(db.session.query(func.max(Song.id)).scalar() or 0) + 1,
+        name=track.track_name,
+        artists=[db.session.get(Artist, artist) for artist in track.artists],
+        genres=[db.session.get(Genre, genre) for genre in track.genres],
+        site_name=site,
+        link=track.link,
+        date_published=track.date_published,
+    )
+    db.session.add(song)
+    db.session.flush()
+    db.session.refresh(song)
+    db.session.commit()
+    return song.id
+
+
+def run(app, pages: list, batch_size: int | None) -> list[tuple[str, int, float]]:
+    from app.controller import save_new_recommendations_site, save_streamed_tracks
+    from app.models import db, Site
+
+    num_tracks = sum(len(tracks) for _, tracks in pages)
+    timings = []
+    with app.app_context():
+        db.create_all()
+        try:
+            save_new_recommendations_site("Pitchfork")
+            site = db.session.get(Site, "Pitchfork")
+            for phase in ("new tracks", "known tracks"):
+                start_time = time.perf_counter()
+                if batch_size:
+                    num_saved = len(save_streamed_tracks(pages, site, batch_size))
+                else:
+                    num_saved = sum(
+                        save_track_unbatched(track, site.name) is not None for _, tracks in pages for track in tracks
+                    )
+                timings.append((phase, num_saved, num_tracks / (time.perf_counter() - start_time)))
+        finally:
+            db.session.remove()
+            db.drop_all()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=5000, help="number of tracks to save")
+    parser.add_argument("--batch-size", type=int, default=250, help="tracks saved per transaction when batched")
+    parser.add_argument("--database-url", help="database to benchmark against, a new sqlite database by default")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    from app.app import create_app
+
+    app = create_app()
+    pages = generate_track_pages(args.tracks)
+    print(f"{'path':<24}{'phase':<16}{'saved':>8}{'tracks/sec':>14}")
+    for path, batch_size in (("one track at a time", None), (f"batches of {args.batch_size}", args.batch_size)):
+        for phase, num_saved, tracks_per_sec in run(app, pages, batch_size):
+            print(f"{path:<24}{phase:<16}{num_saved:>8}{tracks_per_sec:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
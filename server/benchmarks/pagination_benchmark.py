@@ -0,0 +1,65 @@
+"""
+Compares the latency of the first page of /api/tracks with a page deep into the catalog, for each sort order with a
+cursor and for the default order with an offset
+
+A cursor seeks straight to its page through the sort order's index, so a deep page should cost what the first one
+does, while an offset reads and discards every song before its page. Run from the server directory:
+
+    python benchmarks/pagination_benchmark.py --tracks 100000
+
+--database-url benchmarks another database, e.g. a scratch postgres database - its tables are created and dropped
+"""
+import argparse
+
+from common import best_time, configure_environment, create_catalog, drop_catalog
+
+
+def page_urls(app, sort: str, depth: int, page_size: int) -> tuple[str, str]:
+    from app.controller import song_sort_key, sort_songs
+    from app.models import Song
+    from app.utils.api_utils import encode_cursor
+
+    with app.app_context():
+        # the cursor a client paging through the catalog would have been given for the page at the depth
+        song = sort_songs(Song.query, sort).offset(depth - 1).first()
+        cursor = encode_cursor([sort, *song_sort_key(song, sort)])
+    base_url = f"/api/tracks?limit={page_size}&sort={sort}"
+    return base_url, f"{base_url}&cursor={cursor}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=100000, help="number of songs in the catalog")
+    parser.add_argument("--page-size", type=int, default=50, help="songs per page")
+    parser.add_argument("--rounds", type=int, default=5, help="times each page is requested, the fastest is kept")
+    parser.add_argument("--database-url", help="database to benchmark against, a new sqlite database by default")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    # the app with its routes registered
+    from run import app
+
+    create_catalog(app, args.tracks)
+    # a page nine tenths of the way through, short of the last page which is topped up with any undated songs
+    depth = args.tracks * 9 // 10 // args.page_size * args.page_size
+    client = app.test_client()
+
+    def time_page(url: str) -> float:
+        def get_page():
+            assert client.get(url).status_code == 200
+
+        return best_time(get_page, args.rounds) * 1000
+
+    try:
+        print(f"{'order':<18}{'page 1 ms':>12}{f'page {depth // args.page_size + 1} ms':>16}")
+        for sort in ("date", "name", "artist"):
+            first_url, deep_url = page_urls(app, sort, depth, args.page_size)
+            print(f"{f'{sort}, cursor':<18}{time_page(first_url):>12.1f}{time_page(deep_url):>16.1f}")
+        first_url = f"/api/tracks?limit={args.page_size}"
+        print(f"{'date, offset':<18}{time_page(first_url):>12.1f}{time_page(f'{first_url}&offset={depth}'):>16.1f}")
+    finally:
+        drop_catalog(app)
+
+
+if __name__ == "__main__":
+    main()
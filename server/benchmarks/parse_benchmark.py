@@ -0,0 +1,62 @@
+"""
+Compares the speed and memory use of parsing Pitchfork pages with each installed BeautifulSoup tree builder, building
+either the whole page or only the track elements into the tree
+
+Parses the fixture pages the parsing tests check every backend against, which are reconstructions of Pitchfork's
+markup rather than saved pages. Run from the server directory:
+
+    python benchmarks/parse_benchmark.py --rounds 200
+"""
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+
+from common import SERVER_DIR, configure_environment
+
+FIXTURES_DIR = Path(SERVER_DIR) / "tests" / "fixtures" / "pitchfork"
+PARSERS = ("html.parser", "lxml", "html5lib")
+
+
+def run(pages: list[bytes], parser: str, restricted: bool, rounds: int) -> tuple[int, float, float]:
+    from app.integrations.scrape_top_tracks import parse_top_tracks_html
+
+    num_tracks = sum(len(parse_top_tracks_html(html, parser, restricted)) for html in pages)
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            parse_top_tracks_html(html, parser, restricted)
+    pages_per_sec = rounds * len(pages) / (time.perf_counter() - start_time)
+
+    # measured separately since tracing allocations slows parsing down
+    peak_kib = 0.0
+    for html in pages:
+        tracemalloc.start()
+        parse_top_tracks_html(html, parser, restricted)
+        peak_kib = max(peak_kib, tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+    return num_tracks, pages_per_sec, peak_kib
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200, help="number of times every page is parsed")
+    args = parser.parse_args()
+
+    configure_environment()
+    from bs4.builder import builder_registry
+
+    pages = [page.read_bytes() for page in sorted(FIXTURES_DIR.glob("*.html"))]
+    print(f"{'parser':<14}{'tree':<12}{'tracks':>8}{'pages/sec':>12}{'peak KiB/page':>16}")
+    for html_parser in PARSERS:
+        if not builder_registry.lookup(html_parser):
+            print(f"{html_parser:<14}not installed")
+            continue
+        for restricted in (False, True):
+            num_tracks, pages_per_sec, peak_kib = run(pages, html_parser, restricted, args.rounds)
+            tree = "tracks only" if restricted else "whole page"
+            print(f"{html_parser:<14}{tree:<12}{num_tracks:>8}{pages_per_sec:>12.1f}{peak_kib:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares the throughput of serializing song listings with row_to_dict and json.dumps, which flask-restful did for
+every listing before the compiled serializer, with the RowSerializer listings are serialized with now
+
+Both produce the listing's response body, which is checked to be byte for byte the same. Run from the server
+directory:
+
+    python benchmarks/serializer_benchmark.py --rows 2000
+
+--database-url benchmarks another database, e.g. a scratch postgres database - its tables are created and dropped
+"""
+import argparse
+import json
+
+from common import best_time, configure_environment, create_catalog, drop_catalog
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000, help="number of songs in the listing")
+    parser.add_argument("--rounds", type=int, default=20, help="times each listing is serialized, the fastest is kept")
+    parser.add_argument("--database-url", help="database to benchmark against, a new sqlite database by default")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    from app.controller import sort_songs
+    from app.models import Song
+    from app.routes.tracks_routes import SONG_INTERNAL_COLUMNS, SONG_LISTING_OPTIONS, song_serializer
+    from app.utils.api_utils import row_to_dict
+    # the app with its routes registered
+    from run import app
+
+    create_catalog(app, args.rows)
+    try:
+        with app.app_context():
+            songs = sort_songs(Song.query.options(*SONG_LISTING_OPTIONS)).all()
+
+            def serialize_generic() -> bytes:
+                # flask-restful's output for a list of dicts, a compact json.dumps followed by a newline
+                return (json.dumps([row_to_dict(song, SONG_INTERNAL_COLUMNS) for song in songs]) + "\n").encode()
+
+            def serialize_compiled() -> bytes:
+                return song_serializer.dumps_list(songs)
+
+            assert serialize_generic() == serialize_compiled(), "the serializers' output differs"
+            print(f"{'serializer':<28}{'rows/sec':>12}")
+            serializers = (("row_to_dict + json.dumps", serialize_generic), ("RowSerializer", serialize_compiled))
+            for name, serialize in serializers:
+                print(f"{name:<28}{len(songs) / best_time(serialize, args.rounds):>12.0f}")
+    finally:
+        drop_catalog(app)
+
+
+if __name__ == "__main__":
+    main()
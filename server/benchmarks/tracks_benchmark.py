@@ -0,0 +1,67 @@
+"""
+Measures the latency of /api/tracks, and the number of statements each request runs, on catalogs of increasing size
+
+Each listing loads a page's songs and then their artists and genres with one statement each, so the number of
+statements stays the same whatever the page size or catalog size. Run from the server directory:
+
+    python benchmarks/tracks_benchmark.py --tracks 1000 10000 100000
+
+--database-url benchmarks another database, e.g. a scratch postgres database - its tables are created and dropped
+"""
+import argparse
+
+from common import best_time, configure_environment, create_catalog, drop_catalog
+
+LISTINGS = (
+    ("50 newest", "limit=50"),
+    ("500 newest", "limit=500"),
+    ("50 by artist", "sort=artist&limit=50"),
+    ("50 in a genre", "genres=Jazz&limit=50"),
+    ("an artist's songs", "artists=Artist 1&limit=50"),
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, nargs="+", default=[1000, 10000, 100000], help="catalog sizes")
+    parser.add_argument("--rounds", type=int, default=5, help="times each listing is requested, the fastest is kept")
+    parser.add_argument("--database-url", help="database to benchmark against, a new sqlite database by default")
+    args = parser.parse_args()
+
+    configure_environment(args.database_url)
+    from sqlalchemy import event
+
+    from app.models import db
+    # the app with its routes registered
+    from run import app
+
+    client = app.test_client()
+    print(f"{'songs':>8}  {'listing':<20}{'ms':>8}{'statements':>12}")
+    for num_tracks in args.tracks:
+        create_catalog(app, num_tracks)
+        try:
+            for name, query in LISTINGS:
+                url = f"/api/tracks?{query}"
+                statements = []
+
+                def record(conn, cursor, statement, parameters, context, executemany):
+                    statements.append(statement)
+
+                with app.app_context():
+                    event.listen(db.engine, "before_cursor_execute", record)
+                    try:
+                        assert client.get(url).status_code == 200
+                    finally:
+                        event.remove(db.engine, "before_cursor_execute", record)
+
+                    def get_listing():
+                        assert client.get(url).status_code == 200
+
+                    elapsed = best_time(get_listing, args.rounds)
+                print(f"{num_tracks:>8}  {name:<20}{elapsed * 1000:>8.1f}{len(statements):>12}")
+        finally:
+            drop_catalog(app)
+
+
+if __name__ == "__main__":
+    main()
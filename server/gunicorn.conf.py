@@ -0,0 +1,8 @@
+# gunicorn reads this file from the directory it's started in, see start.sh
+
+
+def post_worker_init(worker):
+    # every worker keeps its own song search index, built in the background as soon as the worker is ready
+    from app.search_index import song_search_index
+
+    song_search_index.start_loading(worker.wsgi)
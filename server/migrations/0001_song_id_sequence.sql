@@ -0,0 +1,8 @@
+-- Hand out Song IDs from a sequence instead of computing max(song.id) + 1 for every insert.
+-- The sequence is seeded from the current maximum ID so existing rows are untouched.
+
+CREATE SEQUENCE IF NOT EXISTS song_id_seq OWNED BY song.id;
+
+SELECT setval('song_id_seq', COALESCE((SELECT max(id) FROM song), 0) + 1, false);
+
+ALTER TABLE song ALTER COLUMN id SET DEFAULT nextval('song_id_seq');
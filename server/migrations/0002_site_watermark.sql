@@ -0,0 +1,4 @@
+-- Record the newest track seen for each site so routine refreshes can stop at already-known pages.
+
+ALTER TABLE site ADD COLUMN IF NOT EXISTS last_date_published DATE;
+ALTER TABLE site ADD COLUMN IF NOT EXISTS last_link VARCHAR(80);
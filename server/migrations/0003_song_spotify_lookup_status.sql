@@ -0,0 +1,8 @@
+-- Track whether each song has been matched to a Spotify track so enrichment progress can be queried.
+-- Existing songs were looked up when they were saved, so those without a track ID are marked as failed.
+
+ALTER TABLE song ADD COLUMN IF NOT EXISTS spotify_lookup_status VARCHAR(20);
+
+UPDATE song
+SET spotify_lookup_status = CASE WHEN spotify_track_id IS NULL THEN 'failed' ELSE 'done' END
+WHERE spotify_lookup_status IS NULL;
@@ -0,0 +1,10 @@
+-- Cache of Spotify track search results shared by every worker process.
+
+CREATE TABLE IF NOT EXISTS spotify_search_cache (
+    search_query VARCHAR PRIMARY KEY,
+    response TEXT NOT NULL,
+    fetched_at DOUBLE PRECISION NOT NULL,
+    last_used_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_spotify_search_cache_last_used_at ON spotify_search_cache (last_used_at);
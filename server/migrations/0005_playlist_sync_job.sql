@@ -0,0 +1,17 @@
+-- Background jobs that add every song matching a set of filters to a user's playlist.
+
+CREATE TABLE IF NOT EXISTS playlist_sync_job (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(120) NOT NULL,
+    playlist_id VARCHAR(120) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    num_tracks INTEGER NOT NULL DEFAULT 0,
+    num_added INTEGER NOT NULL DEFAULT 0,
+    num_duplicate INTEGER NOT NULL DEFAULT 0,
+    num_failed INTEGER NOT NULL DEFAULT 0,
+    error VARCHAR,
+    created_at DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_playlist_sync_job_email ON playlist_sync_job (email);
@@ -0,0 +1,15 @@
+-- Composite indexes for keyset paginated song listings, one per sort order, each ending in the song ID as a tiebreaker.
+-- Songs don't record the order of their artists, so existing songs are sorted by the alphabetically first one.
+
+ALTER TABLE song ADD COLUMN IF NOT EXISTS primary_artist VARCHAR(80) NOT NULL DEFAULT '';
+
+UPDATE song
+SET primary_artist = first_artist.artist_name
+FROM (
+    SELECT song_id, MIN(artist_name) AS artist_name FROM track_artists_table GROUP BY song_id
+) AS first_artist
+WHERE song.id = first_artist.song_id AND song.primary_artist = '';
+
+CREATE INDEX IF NOT EXISTS ix_song_date_published_id ON song (date_published DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS ix_song_name_id ON song (name, id);
+CREATE INDEX IF NOT EXISTS ix_song_primary_artist_id ON song (primary_artist, id);
@@ -0,0 +1,7 @@
+-- Identify songs by a fingerprint of their normalized name, artists and site so duplicates can be found with one
+-- indexed lookup. The fingerprints of existing songs are computed in Python afterwards by running, from the server
+-- directory, `flask --app run backfill-fingerprints`, which also reports any songs that share one.
+
+ALTER TABLE song ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(32);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_song_fingerprint ON song (fingerprint);
@@ -0,0 +1,51 @@
+-- Key the association tables and index the columns the song filters use.
+-- Duplicate and incomplete association rows are removed first so the primary keys can be added, unless the tables
+-- already have them. Each table is keyed song first, for loading a song's artists and genres and for the correlated
+-- filters, with a second index for finding the songs of an artist, genre or site.
+-- The song name filter is a case insensitive substring match, which only a trigram index on lower(name) can serve.
+
+DELETE FROM track_artists_table WHERE song_id IS NULL OR artist_name IS NULL;
+DELETE FROM track_artists_table AS duplicate USING track_artists_table AS original
+WHERE duplicate.song_id = original.song_id
+    AND duplicate.artist_name = original.artist_name
+    AND duplicate.ctid > original.ctid;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'track_artists_table_pkey') THEN
+        ALTER TABLE track_artists_table ADD CONSTRAINT track_artists_table_pkey PRIMARY KEY (song_id, artist_name);
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS ix_track_artists_table_artist_name ON track_artists_table (artist_name, song_id);
+
+DELETE FROM track_genres_table WHERE song_id IS NULL OR genre_name IS NULL;
+DELETE FROM track_genres_table AS duplicate USING track_genres_table AS original
+WHERE duplicate.song_id = original.song_id
+    AND duplicate.genre_name = original.genre_name
+    AND duplicate.ctid > original.ctid;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'track_genres_table_pkey') THEN
+        ALTER TABLE track_genres_table ADD CONSTRAINT track_genres_table_pkey PRIMARY KEY (song_id, genre_name);
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS ix_track_genres_table_genre_name ON track_genres_table (genre_name, song_id);
+
+DELETE FROM sites_table WHERE song_id IS NULL OR site_name IS NULL;
+DELETE FROM sites_table AS duplicate USING sites_table AS original
+WHERE duplicate.song_id = original.song_id
+    AND duplicate.site_name = original.site_name
+    AND duplicate.ctid > original.ctid;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'sites_table_pkey') THEN
+        ALTER TABLE sites_table ADD CONSTRAINT sites_table_pkey PRIMARY KEY (song_id, site_name);
+    END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS ix_sites_table_site_name ON sites_table (site_name, song_id);
+
+-- name and date_published are covered by the listing indexes from 0006
+CREATE INDEX IF NOT EXISTS ix_song_site_name_date_published_id
+    ON song (site_name, date_published DESC NULLS LAST, id DESC);
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_song_name_trgm ON song USING gin (lower(name) gin_trgm_ops);
@@ -0,0 +1,7 @@
+-- Index song names for the song name filter as they're stored rather than lowercased.
+-- The filter is a case insensitive substring match, which postgres runs as name ILIKE '%...%'. A trigram index can
+-- serve ILIKE on the column it was built on, but never on a lower(name) expression, so the index from 0008 was unused.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DROP INDEX IF EXISTS ix_song_name_trgm;
+CREATE INDEX IF NOT EXISTS ix_song_name_gin_trgm ON song USING gin (name gin_trgm_ops);
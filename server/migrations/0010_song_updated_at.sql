@@ -0,0 +1,7 @@
+-- Record when each song was saved or its name, artists or genres last changed, so the search index each worker keeps
+-- can find the songs that changed since it last looked. Existing songs are left null, they're read when the index is
+-- built and only have to be read again once they change.
+
+ALTER TABLE song ADD COLUMN IF NOT EXISTS updated_at DOUBLE PRECISION;
+
+CREATE INDEX IF NOT EXISTS ix_song_updated_at ON song (updated_at);
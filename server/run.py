@@ -2,6 +2,9 @@ import os
 from flask import send_from_directory
 from flask_restful import Api
 from app.app import create_app
+from app.controller import backfill_song_fingerprints, reingest_pitchfork_archive
+from app.migrations import upgrade_db
+from app.search_index import song_search_index
 from app.utils.logging_utils import logger
 from app.routes.user_routes import (
     Signup,
@@ -21,9 +24,14 @@ from app.routes.tracks_routes import (
     Tracks,
     Playlists,
     PlaylistTracks,
+    PlaylistSync,
     SearchSpotifyTracks,
     SpotifyTrackId,
     PitchforkTracks,
+    SongSearch,
+    Autocomplete,
+    SpotifyEnrichment,
+    SpotifyStats,
     Personalization,
 )
 
@@ -43,14 +51,41 @@ api.add_resource(Unauthorize, "/api/unauthorize")
 api.add_resource(AccountIsAuthorized, "/api/account-is-authorized")
 api.add_resource(AuthCallback, "/api/callback")
 api.add_resource(Tracks, "/api/tracks")
+api.add_resource(SongSearch, "/api/search")
+api.add_resource(Autocomplete, "/api/autocomplete")
 api.add_resource(Playlists, "/api/playlists")
 api.add_resource(PlaylistTracks, "/api/playlist-tracks")
+api.add_resource(PlaylistSync, "/api/playlist-sync")
 api.add_resource(SearchSpotifyTracks, "/api/spotify-tracks")
 api.add_resource(SpotifyTrackId, "/api/spotify-track-id")
 api.add_resource(PitchforkTracks, "/api/pitchfork-tracks")
+api.add_resource(SpotifyEnrichment, "/api/spotify-enrichment")
+api.add_resource(SpotifyStats, "/api/spotify-stats")
 api.add_resource(Personalization, "/api/personalization")
 
 
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """Apply the SQL migrations in the migrations directory that haven't been applied to the database yet."""
+    applied = upgrade_db()
+    logger.info(f"applied {len(applied)} migrations" if applied else "the database is up to date")
+
+
+@app.cli.command("reingest-pitchfork")
+def reingest_pitchfork():
+    """Re-derive Pitchfork tracks from the local HTML archive without fetching any pages."""
+    num_new_tracks = reingest_pitchfork_archive()
+    logger.info(f"re-ingest added {num_new_tracks} new tracks")
+
+
+@app.cli.command("backfill-fingerprints")
+def backfill_fingerprints():
+    """Compute the fingerprints of songs saved before they were added and report songs that share one."""
+    collisions = backfill_song_fingerprints()
+    num_duplicates = sum(len(song_ids) - 1 for song_ids in collisions.values())
+    logger.info(f"{num_duplicates} duplicate songs were left without a fingerprint")
+
+
 # these routes serve the React frontend
 @app.route("/")
 def serve():
@@ -70,4 +105,5 @@ def static_proxy(path):
 
 
 if __name__ == "__main__":
+    song_search_index.start_loading(app)
     app.run(port=PORT)
@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+import tekore as tk
+
+# the app reads its configuration from the environment when it's imported, so point it at scratch stores before any
+#   test module imports it - the database is always replaced so the tests can never drop a configured database
+SCRATCH_DIR = tempfile.mkdtemp(prefix="top-tracks-hub-tests-")
+os.environ["POSTGRES_CONNECTION_STRING"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'db.sqlite')}"
+os.environ["SPOTIFY_RATE_LIMIT_DB"] = os.path.join(SCRATCH_DIR, "rate-limit.sqlite")
+os.environ["HTML_ARCHIVE_DIR"] = os.path.join(SCRATCH_DIR, "html-archive")
+os.environ["HTTP_CACHE_DIR"] = os.path.join(SCRATCH_DIR, "http-cache")
+for var, value in {
+    "JWT_COOKIE_SECURE": "false",
+    "JWT_COOKIE_CSRF_PROTECT": "false",
+    "JWT_SECRET_KEY": "test",
+    "SECRET_KEY": "test",
+    "PORT": "5001",
+}.items():
+    os.environ.setdefault(var, value)
+
+
+@pytest.fixture
+def app():
+    from run import app
+    from app.models import db
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def serve():
+    """
+    Starts local HTTP servers that stand in for the sites the app talks to
+
+    Yields:
+        Callable[[type[BaseHTTPRequestHandler]], str]: starts a server with the handler class and returns its base URL
+    """
+    servers = []
+
+    def start(handler_class) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for Spotify's search endpoint, answering with an empty page of tracks
+
+    Each request's path and bearer token is recorded in `requests`, and requests made with a token in `rate_limited`
+        are answered with a 429 and that token's Retry-After
+    """
+    requests: list[tuple[str, str]]
+    rate_limited: dict[str, int]
+
+    def do_GET(self):
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        self.requests.append((self.path, token))
+        if (retry_after := self.rate_limited.get(token)) is not None:
+            self.send_json(429, {"error": {"status": 429, "message": "API rate limit exceeded"}}, retry_after)
+        else:
+            paging = {"href": "", "items": [], "limit": 20, "next": None, "offset": 0, "previous": None, "total": 0}
+            self.send_json(200, {"tracks": paging})
+
+    def send_json(self, status: int, body: dict, retry_after: int | None = None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalTransport(httpx.HTTPTransport):
+    # sends every request to the local server, whichever host it was addressed to
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = httpx.URL(base_url)
+
+    def handle_request(self, request):
+        request.url = request.url.copy_with(scheme="http", host=self.base_url.host, port=self.base_url.port)
+        return super().handle_request(request)
+
+
+class AsyncLocalTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = httpx.URL(base_url)
+
+    async def handle_async_request(self, request):
+        request.url = request.url.copy_with(scheme="http", host=self.base_url.host, port=self.base_url.port)
+        return await super().handle_async_request(request)
+
+
+class FakeSpotify:
+    """
+    A local stand-in for the Spotify Web API and senders that send tekore's requests to it
+    """
+
+    def __init__(self, base_url: str, handler_class: type[FakeSpotifyHandler]):
+        self.base_url = base_url
+        self.requests = handler_class.requests
+        self.rate_limited = handler_class.rate_limited
+
+    def sender(self) -> tk.SyncSender:
+        return tk.SyncSender(httpx.Client(transport=LocalTransport(self.base_url)))
+
+    def async_sender(self) -> tk.AsyncSender:
+        return tk.AsyncSender(httpx.AsyncClient(transport=AsyncLocalTransport(self.base_url)))
+
+    def tokens_used(self) -> list[str]:
+        return [token for _, token in self.requests]
+
+
+@pytest.fixture
+def fake_spotify(serve):
+    handler_class = type("Handler", (FakeSpotifyHandler,), {"requests": [], "rate_limited": {}})
+    return FakeSpotify(serve(handler_class), handler_class)
@@ -0,0 +1,76 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from app import controller, enrichment
+from app.integrations.scrape_top_tracks import Track
+from app.models import db, Song
+
+
+class FakeHttpClient:
+    async def aclose(self):
+        pass
+
+
+class FakeAsyncSpotify:
+    sender = SimpleNamespace(client=FakeHttpClient())
+
+
+@pytest.fixture
+def looked_up_songs(monkeypatch):
+    looked_up = []
+
+    async def search(spotify_obj, song):
+        looked_up.append(song.id)
+        return SimpleNamespace(id=f"spotify-{song.id}", preview_url=f"https://p.scdn.co/{song.id}")
+
+    monkeypatch.setattr(enrichment, "get_spotify_obj", lambda asynchronous=False: FakeAsyncSpotify())
+    monkeypatch.setattr(enrichment, "async_search_spotify_track", search)
+    return looked_up
+
+
+def save_tracks(num_tracks: int) -> list[int]:
+    controller.save_new_recommendations_site("Pitchfork")
+    tracks = [
+        Track(artists=[f"Artist {i}"], track_name=f"Track {i}", genres=["Rock"], link=None, date_published=date.today())
+        for i in range(num_tracks)
+    ]
+    return controller.save_new_tracks(tracks, "Pitchfork")
+
+
+def test_songs_left_pending_by_an_earlier_run_are_requeued(app, looked_up_songs, monkeypatch):
+    song_ids = save_tracks(3)
+    db.session.get(Song, song_ids[0]).spotify_lookup_status = enrichment.LOOKUP_DONE
+    db.session.commit()
+    monkeypatch.setattr(controller, "get_spotify_obj", lambda: object())
+
+    enricher = controller.start_spotify_enricher()
+    enricher.close()
+
+    assert sorted(looked_up_songs) == song_ids[1:]
+    db.session.expire_all()
+    assert enrichment.get_enrichment_progress() == {"pending": 0, "done": 3, "failed": 0}
+    assert db.session.get(Song, song_ids[2]).spotify_track_id == f"spotify-{song_ids[2]}"
+
+
+def test_the_enricher_is_stopped_when_a_scrape_fails(app, looked_up_songs, monkeypatch):
+    monkeypatch.setattr(controller, "get_spotify_obj", lambda: object())
+    enrichers = []
+
+    def start_spotify_enricher():
+        enrichers.append(enricher := start_enricher())
+        return enricher
+
+    def stream_top_tracks(*args, **kwargs):
+        raise ConnectionError("pitchfork.com is unreachable")
+
+    start_enricher = controller.start_spotify_enricher
+    monkeypatch.setattr(controller, "start_spotify_enricher", start_spotify_enricher)
+    monkeypatch.setattr(controller, "stream_top_tracks", stream_top_tracks)
+
+    with pytest.raises(ConnectionError):
+        controller.update_pitchfork_top_tracks_db(max_page_num=1)
+
+    [enricher] = enrichers
+    assert not enricher._lookup_thread.is_alive() and not enricher._writer.is_alive()
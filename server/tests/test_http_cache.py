@@ -0,0 +1,84 @@
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from app.integrations import scrape_top_tracks
+from app.integrations.html_archive import HtmlArchive
+from app.integrations.http_cache import ConditionalGetCache
+
+PAGE = b"<html><body>" + b"<div class='track-collection-item'></div>" * 100 + b"</body></html>"
+ETAG = '"page-v1"'
+LAST_MODIFIED = "Fri, 01 Sep 2023 00:00:00 GMT"
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, dict(self.headers)))
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.end_headers()
+        elif (
+            self.headers.get("If-None-Match") == ETAG
+            or self.path.startswith("/last-modified") and self.headers.get("If-Modified-Since") == LAST_MODIFIED
+        ):
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            if self.path.startswith("/last-modified"):
+                self.send_header("Last-Modified", LAST_MODIFIED)
+            else:
+                self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url(serve):
+    PageHandler.requests = []
+    return serve(PageHandler)
+
+
+@pytest.mark.parametrize("path", ["/etag", "/last-modified"])
+def test_revalidated_page_is_served_from_cache(tmp_path, base_url, path):
+    cache = ConditionalGetCache(cache_dir=str(tmp_path))
+
+    assert cache.get(base_url + path) == (200, PAGE)
+    assert cache.get(base_url + path) == (200, PAGE)
+
+    first_headers, second_headers = (headers for _, headers in PageHandler.requests)
+    assert "If-None-Match" not in first_headers and "If-Modified-Since" not in first_headers
+    assert second_headers.get("If-None-Match") == ETAG or second_headers.get("If-Modified-Since") == LAST_MODIFIED
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.bytes_saved) == (1, 1, len(PAGE))
+
+
+def test_error_responses_are_not_cached(tmp_path, base_url):
+    cache = ConditionalGetCache(cache_dir=str(tmp_path))
+
+    assert cache.get(base_url + "/missing")[0] == 404
+    assert cache.get(base_url + "/missing")[0] == 404
+    assert "If-None-Match" not in PageHandler.requests[-1][1]
+    assert (cache.stats.hits, cache.stats.misses) == (0, 2)
+
+
+def test_fetched_pitchfork_pages_are_cached_and_archived(tmp_path, base_url, monkeypatch):
+    cache = ConditionalGetCache(cache_dir=str(tmp_path / "cache"))
+    archive = HtmlArchive(archive_dir=str(tmp_path / "archive"))
+    monkeypatch.setattr(scrape_top_tracks, "TOP_TRACKS_URL", base_url + "/reviews/tracks/")
+    monkeypatch.setattr(scrape_top_tracks, "pitchfork_http_cache", cache)
+    monkeypatch.setattr(scrape_top_tracks, "pitchfork_html_archive", archive)
+
+    assert scrape_top_tracks.get_pitchfork_top_tracks_html(1) == PAGE
+    assert scrape_top_tracks.get_pitchfork_top_tracks_html(1) == PAGE
+
+    assert [path for path, _ in PageHandler.requests] == ["/reviews/tracks/?page=1"] * 2
+    assert cache.stats.hits == 1
+    entries = archive.latest_entries(base_url)
+    assert [entry.url for entry in entries] == [base_url + "/reviews/tracks/?page=1"]
+    assert archive.load(entries[0].sha256) == PAGE
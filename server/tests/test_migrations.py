@@ -0,0 +1,155 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, inspect, select
+
+from app import migrations
+from app.controller import filter_songs, sort_songs
+from app.migrations import MIGRATIONS_DIR, upgrade_db
+from app.models import db, Song, track_artists_table, track_genres_table
+
+# the migrations are postgres SQL, so the tests that run them need a scratch postgres database, e.g.
+#   TEST_POSTGRES_URL=postgresql://localhost/top_tracks_hub_test - they create and drop a schema of their own in it
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest.fixture
+def postgres_conn():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(TEST_POSTGRES_URL)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public")
+        conn.exec_driver_sql("DROP SCHEMA IF EXISTS migration_test CASCADE")
+        conn.exec_driver_sql("CREATE SCHEMA migration_test")
+        conn.exec_driver_sql("SET search_path TO migration_test, public")
+        conn.commit()
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql("DROP SCHEMA migration_test CASCADE")
+            conn.commit()
+    engine.dispose()
+
+
+# the tables as they were before the first migration, when they were created by db.create_all
+UNMIGRATED_SCHEMA = (
+    "CREATE TABLE site (name VARCHAR(80) PRIMARY KEY)",
+    "CREATE TABLE artist (name VARCHAR(80) PRIMARY KEY)",
+    "CREATE TABLE genre (name VARCHAR(80) PRIMARY KEY)",
+    """CREATE TABLE song (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(80) NOT NULL,
+        site_name VARCHAR(80) NOT NULL REFERENCES site (name),
+        link VARCHAR(80),
+        date_published DATE,
+        spotify_track_id VARCHAR(100),
+        preview_url VARCHAR
+    )""",
+    "CREATE TABLE track_artists_table (song_id INTEGER REFERENCES song (id), "
+    "artist_name VARCHAR(80) REFERENCES artist (name))",
+    "CREATE TABLE track_genres_table (song_id INTEGER REFERENCES song (id), "
+    "genre_name VARCHAR(80) REFERENCES genre (name))",
+    "CREATE TABLE sites_table (song_id INTEGER REFERENCES song (id), site_name VARCHAR(80) REFERENCES site (name))",
+)
+
+# a catalog of 5000 songs by 1000 artists, one in ten from a second site and one in twenty jazz, so that the filters
+# are selective enough for their indexes to be the cheapest plan
+CATALOG = (
+    "INSERT INTO site (name) VALUES ('Pitchfork'), ('Other')",
+    "INSERT INTO artist (name) SELECT 'Artist ' || i FROM generate_series(1, 1000) AS i",
+    "INSERT INTO genre (name) VALUES ('Rock'), ('Jazz')",
+    """INSERT INTO song (name, site_name, date_published, primary_artist, fingerprint, spotify_lookup_status)
+    SELECT 'Track ' || md5(i::text), CASE WHEN i % 10 = 0 THEN 'Other' ELSE 'Pitchfork' END,
+        DATE '2023-09-01' - i % 3000, 'Artist ' || (i % 1000 + 1), md5(i::text), 'done'
+    FROM generate_series(1, 5000) AS i""",
+    "INSERT INTO track_artists_table (song_id, artist_name) SELECT id, primary_artist FROM song",
+    """INSERT INTO track_genres_table (song_id, genre_name)
+    SELECT id, CASE WHEN id % 20 = 0 THEN 'Jazz' ELSE 'Rock' END FROM song""",
+    "INSERT INTO sites_table (song_id, site_name) SELECT id, site_name FROM song",
+)
+
+
+@pytest.fixture
+def migrated_catalog(postgres_conn):
+    for statement in UNMIGRATED_SCHEMA:
+        postgres_conn.exec_driver_sql(statement)
+    for file_name in sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql")):
+        with open(os.path.join(MIGRATIONS_DIR, file_name)) as f:
+            postgres_conn.exec_driver_sql(f.read())
+    for statement in CATALOG:
+        postgres_conn.exec_driver_sql(statement)
+    postgres_conn.exec_driver_sql("ANALYZE song, track_artists_table, track_genres_table")
+    return postgres_conn
+
+
+def explain(conn, query) -> str:
+    sql = query.compile(conn, compile_kwargs={"literal_binds": True})
+    # with sequential scans ruled out the planner uses the index whenever it's able to
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    return "\n".join(conn.exec_driver_sql(f"EXPLAIN {sql}").scalars())
+
+
+@pytest.fixture
+def migrations_dir(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS_DIR", str(tmp_path))
+    yield tmp_path
+    # these tables aren't models, so dropping the models' tables leaves them behind
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS first_table")
+        conn.exec_driver_sql("DROP TABLE schema_migrations")
+
+
+def test_pending_migrations_are_applied_once(migrations_dir):
+    (migrations_dir / "0001_first.sql").write_text("CREATE TABLE first_table (id INTEGER PRIMARY KEY)")
+    (migrations_dir / "0002_second.sql").write_text("CREATE INDEX ix_first_table_id ON first_table (id)")
+    (migrations_dir / "README.md").write_text("not a migration")
+
+    assert upgrade_db() == ["0001_first.sql", "0002_second.sql"]
+    assert upgrade_db() == []
+
+    (migrations_dir / "0003_third.sql").write_text("DROP INDEX ix_first_table_id")
+    assert upgrade_db() == ["0003_third.sql"]
+    assert inspect(db.engine).get_indexes("first_table") == []
+
+
+def test_song_name_filter_can_use_the_trigram_index(postgres_conn):
+    postgres_conn.exec_driver_sql("CREATE TABLE song (id SERIAL PRIMARY KEY, name VARCHAR(80) NOT NULL)")
+    postgres_conn.exec_driver_sql(
+        "INSERT INTO song (name) SELECT 'Track ' || md5(i::text) FROM generate_series(1, 5000) AS i"
+    )
+    with open(os.path.join(MIGRATIONS_DIR, "0009_song_name_trigram_index.sql")) as f:
+        postgres_conn.exec_driver_sql(f.read())
+    postgres_conn.exec_driver_sql("ANALYZE song")
+
+    query = filter_songs(select(Song.id), {"song_name": "Blue Night"})
+    sql = query.compile(postgres_conn, compile_kwargs={"literal_binds": True})
+    plan = explain(postgres_conn, query)
+
+    assert "ILIKE" in str(sql)
+    assert "ix_song_name_gin_trgm" in plan, plan
+
+
+@pytest.mark.parametrize(
+    "query, index",
+    [
+        # the songs of an artist or genre are found through the association tables' name indexes
+        (filter_songs(select(Song.id), {"artists": ["Artist 1"]}), "ix_track_artists_table_artist_name"),
+        (filter_songs(select(Song.id), {"genres": ["Jazz"]}), "ix_track_genres_table_genre_name"),
+        # and a page's artists and genres through their primary keys
+        (select(track_artists_table).where(track_artists_table.c.song_id.in_([1, 2, 3])), "track_artists_table_pkey"),
+        (select(track_genres_table).where(track_genres_table.c.song_id.in_([1, 2, 3])), "track_genres_table_pkey"),
+        (
+            sort_songs(filter_songs(select(Song.id), {"site_name": "Other"})).limit(50),
+            "ix_song_site_name_date_published_id",
+        ),
+        (select(Song.id).where(Song.fingerprint.in_(["c4ca4238a0b923820dcc509a6f75849b"])), "ix_song_fingerprint"),
+        (filter_songs(select(Song.id), {"song_name": "Blue Night"}), "ix_song_name_gin_trgm"),
+    ],
+    ids=["artists", "genres", "song artists", "song genres", "site by date", "fingerprint", "song name"],
+)
+def test_hot_queries_use_the_migrated_indexes(migrated_catalog, query, index):
+    plan = explain(migrated_catalog, query)
+
+    assert index in plan, plan
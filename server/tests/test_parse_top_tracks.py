@@ -0,0 +1,33 @@
+import dataclasses
+import json
+from datetime import date
+from pathlib import Path
+
+import pytest
+from bs4.builder import builder_registry
+
+from app.integrations.scrape_top_tracks import parse_top_tracks_html
+
+# pages built to mirror the markup of Pitchfork's best tracks listing, each with the tracks it should parse to
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "pitchfork"
+FIXTURE_PAGES = sorted(FIXTURES_DIR.glob("*.html"))
+PARSERS = ("html.parser", "lxml", "html5lib")
+
+
+def load_expected_tracks(page: Path) -> list[dict]:
+    tracks = json.loads(page.with_suffix(".json").read_text())
+    for track in tracks:
+        track["date_published"] = track["date_published"] and date.fromisoformat(track["date_published"])
+    return tracks
+
+
+@pytest.mark.parametrize("restricted", [False, True], ids=["full", "restricted"])
+@pytest.mark.parametrize("parser", PARSERS)
+@pytest.mark.parametrize("page", FIXTURE_PAGES, ids=lambda page: page.stem)
+def test_every_parser_backend_parses_the_same_tracks(page, parser, restricted):
+    if not builder_registry.lookup(parser):
+        pytest.skip(f"{parser} is not installed")
+
+    tracks = parse_top_tracks_html(page.read_bytes(), parser=parser, restricted=restricted)
+
+    assert [dataclasses.asdict(track) for track in tracks] == load_expected_tracks(page)
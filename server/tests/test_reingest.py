@@ -0,0 +1,78 @@
+import dataclasses
+from pathlib import Path
+
+import pytest
+from sqlalchemy import func, select
+
+from app import controller
+from app.integrations.html_archive import HtmlArchive
+from app.integrations.http_cache import ConditionalGetCache
+from app.integrations.scrape_top_tracks import TOP_TRACKS_URL, parse_top_tracks_html
+from app.models import db, Song
+
+FIXTURE_PAGE = Path(__file__).parent / "fixtures" / "pitchfork" / "page-1.html"
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    archive = HtmlArchive(archive_dir=str(tmp_path / "archive"))
+    archive.store(f"{TOP_TRACKS_URL}?page=1", FIXTURE_PAGE.read_bytes())
+    monkeypatch.setattr(controller, "pitchfork_html_archive", archive)
+    monkeypatch.setattr(controller, "start_spotify_enricher", lambda: None)
+    return archive
+
+
+def test_reingest_updates_the_songs_saved_from_the_same_links(app, archive):
+    tracks = parse_top_tracks_html(FIXTURE_PAGE.read_bytes())
+    # saved by a version of the parser that kept the featured artists in track names and missed the second genre
+    misparsed = [
+        dataclasses.replace(tracks[2], genres=tracks[2].genres[:1]),
+        dataclasses.replace(tracks[5], track_name=f"{tracks[5].track_name} [ft. El Alfa and JT]"),
+    ]
+    controller.save_new_recommendations_site("Pitchfork")
+    misparsed_ids = controller.save_new_tracks(misparsed, "Pitchfork")
+    db.session.execute(Song.__table__.update().values(spotify_track_id="abc", spotify_lookup_status="done"))
+    db.session.commit()
+
+    num_new_tracks = controller.reingest_pitchfork_archive()
+
+    assert num_new_tracks == len(tracks) - 2
+    assert db.session.scalar(select(func.count(Song.id))) == len(tracks)
+    regenred, renamed = (db.session.get(Song, song_id) for song_id in misparsed_ids)
+    assert sorted(genre.name for genre in regenred.genres) == sorted(tracks[2].genres)
+    assert (regenred.spotify_track_id, regenred.spotify_lookup_status) == ("abc", "done")
+    assert renamed.name == tracks[5].track_name
+    assert renamed.fingerprint == tracks[5].fingerprint("Pitchfork")
+    assert (renamed.spotify_track_id, renamed.spotify_lookup_status) == (None, "pending")
+
+
+def test_reingest_leaves_unchanged_songs_alone(app, archive):
+    controller.reingest_pitchfork_archive()
+    songs_before = {song.id: (song.name, song.fingerprint) for song in Song.query}
+
+    assert controller.reingest_pitchfork_archive() == 0
+    assert {song.id: (song.name, song.fingerprint) for song in Song.query} == songs_before
+
+
+def test_links_re_derived_to_the_same_track_update_only_one_song(app):
+    tracks = parse_top_tracks_html(FIXTURE_PAGE.read_bytes())
+    controller.save_new_recommendations_site("Pitchfork")
+    song_ids = controller.save_new_tracks(tracks[1:3], "Pitchfork")
+    db.session.commit()
+    names = {song_id: db.session.get(Song, song_id).name for song_id in song_ids}
+    # both links are now parsed to the same track, which isn't saved yet
+    reparsed = [dataclasses.replace(tracks[1], track_name="Renamed", link=track.link) for track in tracks[1:3]]
+
+    _, updated_ids, _ = controller.update_saved_tracks(reparsed, "Pitchfork")
+    db.session.commit()
+
+    assert len(updated_ids) == 1
+    names[updated_ids[0]] = "Renamed"
+    assert {song_id: db.session.get(Song, song_id).name for song_id in song_ids} == names
+
+
+def test_unset_storage_locations_fail_loudly():
+    with pytest.raises(RuntimeError, match="HTML_ARCHIVE_DIR"):
+        HtmlArchive(archive_dir=None).latest_entries()
+    with pytest.raises(RuntimeError, match="HTTP_CACHE_DIR"):
+        ConditionalGetCache(cache_dir=None).get("http://127.0.0.1:9/")
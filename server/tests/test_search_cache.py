@@ -0,0 +1,56 @@
+from tekore.model import FullTrackPaging
+
+from app.integrations import search_cache, spotify
+from app.integrations.search_cache import SpotifySearchCache
+from app.models import db, Site
+
+
+def make_paging(total: int) -> FullTrackPaging:
+    return FullTrackPaging(href="", items=[], limit=20, next=None, offset=0, previous=None, total=total)
+
+
+class FakeSpotify:
+    def __init__(self):
+        self.searches = []
+
+    def search(self, query, max_tries=10, **params):
+        self.searches.append((query, params["market"]))
+        return (make_paging(total=len(self.searches)),)
+
+
+def test_entries_are_keyed_by_every_search_parameter(app):
+    cache = SpotifySearchCache()
+    cache.put("Dang  artist:Caroline Polachek", make_paging(total=1), market="US")
+
+    assert cache.get("dang artist:caroline polachek", market="US")[0].total == 1
+    assert cache.get("dang artist:caroline polachek", market="GB") == (None, False)
+    assert cache.get("dang artist:caroline polachek", market="US", limit=50) == (None, False)
+
+
+def test_searches_in_different_markets_are_cached_separately(app, monkeypatch):
+    monkeypatch.setattr(spotify, "spotify_search_cache", SpotifySearchCache())
+    spotify_obj = FakeSpotify()
+
+    def search(market: str) -> int:
+        return spotify.search_spotify_tracks(spotify_obj, "Dang", "Caroline Polachek", market=market).total
+
+    us_total, gb_total = search("US"), search("GB")
+
+    assert us_total != gb_total
+    assert (search("US"), search("GB")) == (us_total, gb_total)
+    assert [market for _, market in spotify_obj.searches] == ["US", "GB"]
+
+
+def test_the_cache_leaves_pending_changes_in_the_session_alone(app, monkeypatch):
+    # every read updates the entry's last used time
+    monkeypatch.setattr(search_cache, "TOUCH_INTERVAL", -1)
+    cache = SpotifySearchCache()
+    db.session.add(Site(name="Unsaved"))
+
+    cache.put("Dang artist:Caroline Polachek", make_paging(total=1), market="US")
+    assert cache.get("Dang artist:Caroline Polachek", market="US")[0].total == 1
+    cache.evict()
+    db.session.rollback()
+
+    assert db.session.get(Site, "Unsaved") is None
+    assert cache.get("Dang artist:Caroline Polachek", market="US")[0].total == 1
@@ -0,0 +1,160 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select, update
+
+from app import controller
+from app.integrations.scrape_top_tracks import Track
+from app.models import db, track_artists_table, track_genres_table, Song
+from app import search_index
+from app.search_index import SEARCH_INDEX_REFRESH_OVERLAP, SongSearchIndex
+
+
+def make_track(name: str, artists: list[str], genres: list[str], link: str | None = None) -> Track:
+    return Track(artists=artists, track_name=name, genres=genres, link=link, date_published=date(2023, 9, 1))
+
+
+def save(*tracks: Track) -> list[int]:
+    # the IDs of the tracks in the order they're given, which isn't the order they're saved in
+    controller.save_new_tracks(list(tracks), "Pitchfork")
+    song_ids_by_name = dict(db.session.execute(select(Song.name, Song.id)).all())
+    return [song_ids_by_name[track.track_name] for track in tracks]
+
+
+@pytest.fixture
+def index(app):
+    controller.save_new_recommendations_site("Pitchfork")
+    return SongSearchIndex()
+
+
+def test_build_indexes_every_saved_song(index):
+    song_ids = save(
+        make_track("Midnight Drive", ["Glass Animals"], ["Rock"]),
+        make_track("Summer Rain", ["Ana Frango Elétrico"], ["Global", "Pop/R&B"]),
+    )
+
+    assert index.refresh() == 2
+
+    stats = index.get_stats()
+    assert stats.loaded and stats.num_songs == 2 and stats.num_artists == 2 and stats.num_genres == 3
+    assert index.search("midnight drive") == [song_ids[0]]
+    assert index.search("ana frango") == [song_ids[1]]
+    assert index.autocomplete("gl") == {
+        "artists": [{"name": "Glass Animals", "num_songs": 1}],
+        "genres": [{"name": "Global", "num_songs": 1}],
+    }
+
+
+def test_misspelled_words_still_match(index):
+    [song_id] = save(make_track("Midnight Drive", ["Glass Animals"], ["Rock"]))
+    index.refresh()
+
+    assert index.search("midnite drive") == [song_id]
+    assert index.search("glas animls") == [song_id]
+    assert index.search("xyzzy") == []
+
+
+def test_genres_without_words_are_left_out_of_searches(index):
+    [song_id] = save(make_track("Midnight Drive", ["Glass Animals"], ["-", "Rock"]))
+    index.refresh()
+
+    assert index.search("midnight") == [song_id]
+    assert index.search("rock") == [song_id]
+
+
+def test_songs_are_ranked_by_how_well_they_match(index):
+    exact, partial, by_artist, longer = save(
+        make_track("Blue Night", ["Someone"], ["Rock"]),
+        make_track("Blue", ["Someone Else"], ["Rock"]),
+        make_track("Anything", ["Blue Night"], ["Rock"]),
+        make_track("Blue Night Blue Day Again", ["Another"], ["Rock"]),
+    )
+    index.refresh()
+
+    assert index.search("blue night") == [exact, by_artist, partial, longer]
+
+
+def test_refresh_adds_new_songs_and_replaces_changed_ones(index, monkeypatch):
+    monkeypatch.setattr(search_index, "MAX_REMOVED_FRACTION", 1.0)
+    [song_id] = save(make_track("Midnight Drive", ["Glass Animals"], ["Rock"], link="/reviews/tracks/drive/"))
+    index.refresh()
+    [new_song_id] = save(make_track("Summer Rain", ["Someone"], ["Jazz"]))
+    controller.update_saved_tracks(
+        [make_track("Morning Drive", ["Glass Animals", "Someone"], ["Electronic"], link="/reviews/tracks/drive/")],
+        "Pitchfork",
+    )
+
+    assert index.refresh() == 2
+    # nothing changed since, so the songs re-read from the overlap aren't added again
+    assert index.refresh() == 0
+    assert len(index._song_ids) == 3
+
+    assert index.search("summer rain") == [new_song_id]
+    assert index.search("morning drive") == [song_id]
+    assert index.search("midnight") == []
+    assert index.get_stats().num_songs == 2
+    assert index.autocomplete("rock")["genres"] == []
+    assert index.autocomplete("some")["artists"] == [{"name": "Someone", "num_songs": 2}]
+
+
+def test_refresh_finds_songs_stamped_before_the_latest_change_it_has_seen(index):
+    save(make_track("Midnight Drive", ["Glass Animals"], ["Rock"]))
+    index.refresh()
+    # saved by a transaction that started before the last refresh but committed after it
+    [late_song_id] = save(make_track("Summer Rain", ["Someone"], ["Jazz"]))
+    db.session.execute(update(Song).where(Song.id == late_song_id).values(updated_at=index._max_updated_at - 1))
+    db.session.commit()
+
+    assert index.refresh() == 1
+    assert index.search("summer rain") == [late_song_id]
+
+
+def test_refresh_skips_songs_stamped_before_the_overlap(index):
+    save(make_track("Midnight Drive", ["Glass Animals"], ["Rock"]))
+    index.refresh()
+    [old_song_id] = save(make_track("Summer Rain", ["Someone"], ["Jazz"]))
+    db.session.execute(
+        update(Song)
+        .where(Song.id == old_song_id)
+        .values(updated_at=index._max_updated_at - SEARCH_INDEX_REFRESH_OVERLAP - 1)
+    )
+    db.session.commit()
+
+    assert index.refresh() == 0
+
+
+def test_refresh_removes_deleted_songs(index):
+    song_ids = save(
+        make_track("Midnight Drive", ["Glass Animals"], ["Rock"]),
+        make_track("Summer Drive", ["Someone"], ["Jazz"]),
+    )
+    index.refresh()
+    for table in (track_artists_table, track_genres_table):
+        db.session.execute(table.delete().where(table.c.song_id == song_ids[0]))
+    db.session.execute(Song.__table__.delete().where(Song.id == song_ids[0]))
+    db.session.commit()
+
+    index.refresh()
+
+    assert index.search("drive") == [song_ids[1]]
+    assert index.search("rock") == []
+    assert index.search("rock jazz") == [song_ids[1]]
+    assert index.get_stats().num_songs == 1
+
+
+def test_index_is_rebuilt_once_most_of_it_is_replaced_versions(index):
+    tracks = [make_track(f"Track {i}", [f"Artist {i}"], ["Rock"], link=f"/reviews/tracks/{i}/") for i in range(4)]
+    song_ids = save(*tracks)
+    index.refresh()
+    controller.update_saved_tracks(
+        [make_track(f"Song {i}", [f"Artist {i}"], ["Jazz"], link=f"/reviews/tracks/{i}/") for i in range(4)],
+        "Pitchfork",
+    )
+    index.refresh()
+    assert index.get_stats().num_songs == 4 and len(index._song_ids) == 8
+
+    index.refresh()
+
+    assert len(index._song_ids) == 4 and not index._removed_docs
+    assert sorted(index.search("song")) == sorted(song_ids)
+    assert index.search("jazz") and not index.search("rock")
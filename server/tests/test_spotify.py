@@ -0,0 +1,256 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import tekore as tk
+from tekore.model import FullTrackPaging
+
+from app.integrations import spotify
+from app.integrations.rate_limiter import SharedRateLimiter
+from app.integrations.search_cache import SpotifySearchCache
+from app.integrations.spotify import AsyncSafeSpotify, SafeSpotify
+from app.integrations.spotify_tokens import AccountPool, CachedToken, PooledAccount, UserTokenCache
+
+
+@pytest.fixture(autouse=True)
+def rate_limiter(tmp_path, monkeypatch):
+    rate_limiter = SharedRateLimiter(db_path=str(tmp_path / "rate-limit.sqlite"))
+    monkeypatch.setattr(spotify, "spotify_rate_limiter", rate_limiter)
+    return rate_limiter
+
+
+def make_pool(*tokens: str) -> AccountPool:
+    pool = AccountPool(UserTokenCache())
+    pool._user_accounts = [PooledAccount(key=token, token=token) for token in tokens]
+    pool._loaded_at = time.time()
+    return pool
+
+
+def test_a_rate_limited_pooled_call_does_not_leak_its_token(fake_spotify):
+    fake_spotify.rate_limited["pool-token"] = 0
+    pooled_client = SafeSpotify(sender=fake_spotify.sender(), account_pool=make_pool("pool-token"))
+    user_client = SafeSpotify("user-token", sender=fake_spotify.sender())
+
+    assert pooled_client.search("dang", max_tries=1) is None
+    assert user_client.search("dang") is not None
+
+    assert fake_spotify.tokens_used() == ["pool-token", "user-token"]
+
+
+def test_a_rate_limit_pauses_only_the_account_that_got_it(rate_limiter):
+    rate_limiter.pause(30, "limited@example.com")
+
+    assert rate_limiter.try_acquire("limited@example.com") > 29
+    assert rate_limiter.try_acquire("other@example.com") == 0
+    assert rate_limiter.try_acquire() == 0
+    assert rate_limiter.get_budget()["paused_accounts"] == 1
+
+
+def test_pooled_calls_fail_over_to_another_account_after_a_429(fake_spotify, rate_limiter):
+    fake_spotify.rate_limited["account-a"] = 30
+    pool = make_pool("account-a", "account-b")
+    pooled_client = SafeSpotify(sender=fake_spotify.sender(), account_pool=pool)
+    user_client = SafeSpotify("user-token", sender=fake_spotify.sender(), account_key="user@example.com")
+
+    start_time = time.monotonic()
+    assert pooled_client.search("dang") is not None
+    assert pooled_client.search("dang") is not None
+    assert user_client.search("dang") is not None
+
+    assert time.monotonic() - start_time < 5
+    assert fake_spotify.tokens_used() == ["account-a", "account-b", "account-b", "user-token"]
+    assert pool.get_stats()["available_user_accounts"] == 1
+    assert rate_limiter.get_budget()["paused_accounts"] == 1
+
+
+def test_calls_that_give_up_early_do_not_wait_for_an_identical_call_that_does_not(fake_spotify, rate_limiter):
+    rate_limiter.pause(2, "user@example.com")
+    user_client = SafeSpotify("user-token", sender=fake_spotify.sender(), account_key="user@example.com")
+    waiting_call = threading.Thread(target=user_client.search, args=("dang",))
+    waiting_call.start()
+    # let the first call start waiting out the pause
+    time.sleep(0.2)
+
+    start_time = time.monotonic()
+    assert user_client.search("dang", max_tries=1, block=False) is None
+    assert time.monotonic() - start_time < 1
+    waiting_call.join()
+    assert fake_spotify.tokens_used() == ["user-token"]
+
+
+def test_a_rate_limited_async_pooled_call_does_not_leak_its_token(fake_spotify):
+    fake_spotify.rate_limited["pool-token"] = 0
+
+    async def search():
+        pooled_client = AsyncSafeSpotify(sender=fake_spotify.async_sender(), account_pool=make_pool("pool-token"))
+        user_client = AsyncSafeSpotify("user-token", sender=fake_spotify.async_sender())
+        try:
+            assert await pooled_client.search("dang", max_tries=1) is None
+            assert await user_client.search("dang") is not None
+        finally:
+            await pooled_client.sender.client.aclose()
+            await user_client.sender.client.aclose()
+
+    asyncio.run(search())
+
+    assert fake_spotify.tokens_used() == ["pool-token", "user-token"]
+
+
+class ThreadRecordingToken(CachedToken):
+    # a token whose refreshes record the thread they were requested from
+    def __init__(self, access_token: str):
+        super().__init__(credentials=None)
+        self.access_token_value = access_token
+        self.refresh_threads = []
+
+    def _request_token(self) -> tk.Token:
+        self.refresh_threads.append(threading.current_thread())
+        return tk.Token({"access_token": self.access_token_value, "token_type": "Bearer", "expires_in": 3600}, False)
+
+
+def test_async_calls_refresh_expiring_tokens_off_the_event_loop(fake_spotify):
+    user_token = ThreadRecordingToken("user-token")
+    pool_token = ThreadRecordingToken("pool-token")
+    pool = make_pool()
+    pool._user_accounts = [PooledAccount(key="pool-account", token=pool_token)]
+
+    async def search():
+        user_client = AsyncSafeSpotify(user_token, sender=fake_spotify.async_sender())
+        pooled_client = AsyncSafeSpotify(sender=fake_spotify.async_sender(), account_pool=pool)
+        try:
+            for _ in range(2):
+                assert await user_client.search("dang") is not None
+                assert await pooled_client.search("dang") is not None
+        finally:
+            await user_client.sender.client.aclose()
+            await pooled_client.sender.client.aclose()
+
+    asyncio.run(search())
+
+    assert fake_spotify.tokens_used() == ["user-token", "pool-token"] * 2
+    for token in (user_token, pool_token):
+        assert len(token.refresh_threads) == 1
+        assert token.refresh_threads[0] is not threading.main_thread()
+
+
+class RevokedToken(CachedToken):
+    # a token whose refresh token was revoked, so refreshing it fails
+    def __init__(self):
+        super().__init__(credentials=None)
+        self.num_refreshes = 0
+
+    def _request_token(self) -> tk.Token:
+        self.num_refreshes += 1
+        raise tk.BadRequest("invalid_grant: Refresh token revoked", None, None)
+
+
+def make_pool_with_a_revoked_account() -> tuple[AccountPool, RevokedToken]:
+    revoked_token = RevokedToken()
+    pool = make_pool("account-b")
+    pool._user_accounts.insert(0, PooledAccount(key="account-a", token=revoked_token))
+    return pool, revoked_token
+
+
+def test_pooled_calls_skip_an_account_whose_token_cannot_be_refreshed(fake_spotify):
+    pool, revoked_token = make_pool_with_a_revoked_account()
+    pooled_client = SafeSpotify(sender=fake_spotify.sender(), account_pool=pool)
+
+    for _ in range(3):
+        assert pooled_client.search("dang") is not None
+
+    assert fake_spotify.tokens_used() == ["account-b"] * 3
+    assert revoked_token.num_refreshes == 1
+    assert pool.get_stats()["user_accounts"] == 1
+
+
+def test_async_pooled_calls_skip_an_account_whose_token_cannot_be_refreshed(fake_spotify):
+    pool, revoked_token = make_pool_with_a_revoked_account()
+
+    async def search():
+        pooled_client = AsyncSafeSpotify(sender=fake_spotify.async_sender(), account_pool=pool)
+        try:
+            for _ in range(3):
+                assert await pooled_client.search("dang") is not None
+        finally:
+            await pooled_client.sender.client.aclose()
+
+    asyncio.run(search())
+
+    assert fake_spotify.tokens_used() == ["account-b"] * 3
+    assert revoked_token.num_refreshes == 1
+    assert pool.get_stats()["user_accounts"] == 1
+
+
+def test_async_searches_share_the_search_cache(app, fake_spotify, monkeypatch):
+    monkeypatch.setattr(spotify, "spotify_search_cache", SpotifySearchCache())
+
+    async def search_twice():
+        spotify_obj = AsyncSafeSpotify("user-token", sender=fake_spotify.async_sender())
+        try:
+            return [await spotify.async_search_spotify_tracks(spotify_obj, "Dang", "Caroline Polachek") for _ in range(2)]
+        finally:
+            await spotify_obj.sender.client.aclose()
+
+    first_results, second_results = asyncio.run(search_twice())
+
+    assert first_results.total == second_results.total == 0
+    assert len(fake_spotify.requests) == 1
+    assert spotify.spotify_search_cache.get_stats().hits == 1
+
+
+def test_no_async_sender_is_created_without_a_client(app, monkeypatch):
+    def fail():
+        raise AssertionError("an asynchronous sender was created")
+
+    monkeypatch.setattr(spotify.tk, "AsyncSender", fail)
+
+    assert spotify.get_spotify_obj(SimpleNamespace(email="a@example.com", config_file=None), asynchronous=True) is None
+
+
+def make_paging(total: int) -> FullTrackPaging:
+    return FullTrackPaging(href="", items=[], limit=20, next=None, offset=0, previous=None, total=total)
+
+
+@pytest.fixture
+def stale_search_cache(app, monkeypatch):
+    search_cache = SpotifySearchCache(ttl=0)
+    monkeypatch.setattr(spotify, "spotify_search_cache", search_cache)
+    search_cache.put("Dang artist:Caroline Polachek", make_paging(total=7), **spotify._track_search_params(None))
+    return search_cache
+
+
+def test_stale_results_are_served_without_waiting_out_a_rate_limit(fake_spotify, rate_limiter, stale_search_cache):
+    rate_limiter.pause(30, "user@example.com")
+    user_client = SafeSpotify("user-token", sender=fake_spotify.sender(), account_key="user@example.com")
+    pool = make_pool("account-a")
+    pool.cool_down(pool._user_accounts[0], 30)
+    pooled_client = SafeSpotify(sender=fake_spotify.sender(), account_pool=pool)
+
+    start_time = time.monotonic()
+    for spotify_obj in (user_client, pooled_client):
+        assert spotify.search_spotify_tracks(spotify_obj, "Dang", "Caroline Polachek").total == 7
+
+    assert time.monotonic() - start_time < 1
+    assert fake_spotify.requests == []
+    assert stale_search_cache.get_stats().stale == 2
+
+
+def test_stale_results_are_served_without_waiting_out_a_rate_limit_async(
+    fake_spotify, rate_limiter, stale_search_cache
+):
+    rate_limiter.pause(30, "user@example.com")
+
+    async def search():
+        spotify_obj = AsyncSafeSpotify("user-token", sender=fake_spotify.async_sender(), account_key="user@example.com")
+        try:
+            return await spotify.async_search_spotify_tracks(spotify_obj, "Dang", "Caroline Polachek")
+        finally:
+            await spotify_obj.sender.client.aclose()
+
+    start_time = time.monotonic()
+    assert asyncio.run(search()).total == 7
+
+    assert time.monotonic() - start_time < 1
+    assert fake_spotify.requests == []
@@ -0,0 +1,150 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app import controller
+from app.integrations.scrape_top_tracks import Track
+from app.models import db
+from app.utils.api_utils import encode_cursor
+
+
+@pytest.fixture
+def songs(app):
+    controller.save_new_recommendations_site("Pitchfork")
+    tracks = [
+        Track(
+            artists=[f"Artist {i}", f"Artist {i + 1}"],
+            track_name=f"Track {i}",
+            genres=["Rock", "Pop/R&B"] if i % 2 else ["Jazz"],
+            link=f"/reviews/tracks/track-{i}/",
+            date_published=date(2023, 9, 1) - timedelta(days=i),
+        )
+        for i in range(30)
+    ]
+    return controller.save_new_tracks(tracks, "Pitchfork")
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+
+@pytest.mark.parametrize("query", ["sort=date", "sort=artist&genres=Rock", ""], ids=["cursor", "filtered", "offset"])
+@pytest.mark.parametrize("limit", [5, 25])
+def test_a_page_of_tracks_takes_the_same_number_of_queries_at_any_size(client, songs, query, limit):
+    with count_statements() as statements:
+        resp = client.get(f"/api/tracks?{query}&limit={limit}")
+
+    assert resp.status_code == 200
+    tracks = resp.json["tracks"] if query else resp.json
+    assert len(tracks) == min(limit, 15 if "genres" in query else 30)
+    assert all(track["artists"] and track["genres"] for track in tracks)
+    # the songs, then their artists and their genres
+    assert len(statements) == 3, statements
+
+
+@pytest.mark.parametrize(
+    "sort, cursor",
+    [
+        ("date", ["date", 20230901, 1]),
+        ("date", ["date", "not a date", 1]),
+        ("date", ["date", "2023-09-01", "1"]),
+        ("date", ["date", "2023-09-01", True]),
+        ("date", ["date", None, 1.5]),
+        ("date", ["date", "2023-09-01"]),
+        ("name", ["name", None, 1]),
+        ("name", ["name", ["Track"], 1]),
+        ("artist", ["artist", "Artist 1", None]),
+        ("artist", ["name", "Artist 1", 1]),
+    ],
+)
+def test_crafted_cursors_are_rejected(client, songs, sort, cursor):
+    resp = client.get("/api/tracks", query_string={"sort": sort, "cursor": encode_cursor(cursor)})
+
+    assert resp.status_code == 400
+    assert resp.json == {"cursor": ["Invalid cursor."]}
+
+
+@pytest.mark.parametrize("query", ["sort=date&limit=-1", "sort=date&limit=0", "limit=501", "offset=-1"])
+def test_out_of_range_page_sizes_are_rejected(client, songs, query):
+    resp = client.get(f"/api/tracks?{query}")
+
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize("sort", ["date", "name", "artist"])
+def test_pages_follow_each_other_to_the_last_song(client, songs, sort):
+    song_ids = []
+    cursor = None
+    while True:
+        query_string = {"sort": sort, "limit": 7} | ({"cursor": cursor} if cursor else {})
+        resp = client.get("/api/tracks", query_string=query_string)
+        assert resp.status_code == 200
+        song_ids += [track["id"] for track in resp.json["tracks"]]
+        if not (cursor := resp.json["next_cursor"]):
+            break
+
+    assert sorted(song_ids) == sorted(songs)
+
+
+class DriverError(Exception):
+    def __init__(self, pgcode: str):
+        self.pgcode = pgcode
+
+
+@pytest.fixture
+def failing_facet_query(monkeypatch):
+    # stands in for postgres failing the facet query, which is the only statement selecting "facet" values
+    def fail_with(pgcode: str):
+        execute = db.session.execute
+
+        def execute_failing_facets(statement, *args, **kwargs):
+            if "facet" in str(statement):
+                raise OperationalError(str(statement), {}, DriverError(pgcode))
+            return execute(statement, *args, **kwargs)
+
+        monkeypatch.setattr(db.session, "execute", execute_failing_facets)
+
+    return fail_with
+
+
+def test_facets_are_left_out_when_counting_them_times_out(client, songs, failing_facet_query):
+    failing_facet_query(controller.QUERY_CANCELED_PGCODE)
+
+    resp = client.get("/api/tracks?facets=true&limit=5")
+
+    assert resp.status_code == 200
+    assert resp.json["facets"] is None
+    assert len(resp.json["tracks"]) == 5
+
+
+def test_other_facet_query_errors_are_raised(app, songs, failing_facet_query):
+    failing_facet_query("53300")
+
+    with pytest.raises(OperationalError):
+        controller.count_song_facets({"genres": ["Rock"]})
+
+
+@pytest.mark.parametrize("restful_json", [False, True], ids=["serializer", "flask-restful"])
+@pytest.mark.parametrize("query", ["limit=5", "sort=date&limit=5", "song-id=1"])
+def test_internal_song_columns_are_left_out_of_responses(app, client, songs, restful_json, query, monkeypatch):
+    monkeypatch.setitem(app.config, "RESTFUL_JSON", {"sort_keys": True} if restful_json else None)
+
+    resp = client.get(f"/api/tracks?{query}")
+
+    assert resp.status_code == 200
+    tracks = resp.json if isinstance(resp.json, list) else resp.json.get("tracks", [resp.json])
+    assert tracks and all(track["name"] for track in tracks)
+    assert not any({"fingerprint", "updated_at"} & track.keys() for track in tracks)